@@ -0,0 +1,100 @@
+"""
+This script load tests the ETL service with and without database connection pooling.
+It serves the Flask app on a local port with a threaded werkzeug server and fires concurrent requests
+at one endpoint, first with a new connection per request (ETL_DB_POOL_MAX=0, the original behaviour)
+and then through the per-role connection pools. It reports throughput and p50/p95/p99 latency for each
+mode, plus the pool metrics after the pooled run.
+Usage:
+    python bench_connections.py [--endpoint PATH] [--concurrency N] [--requests N] [--pool-size N]
+Arguments:
+    --endpoint: Path to request, including the query string (default: /display-rows?role=analyst).
+    --concurrency: Number of concurrent client threads (default: 16).
+    --requests: Requests sent by each client thread (default: 200).
+    --pool-size: Maximum connections per role in pooled mode (default: 10).
+Example:
+    python bench_connections.py --endpoint "/health?role=admin" --concurrency 32
+Database connection settings and AUTH_USERNAME/AUTH_PASSWORD are read from the environment, as for the service.
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import etl_service  # noqa: E402
+from db import PoolManager, db_role_configs  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def client(port, endpoint, headers, count):
+    latencies = []
+    errors = 0
+    for _ in range(count):
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', endpoint, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        latencies.append(time.perf_counter() - started)
+        errors += response.status != 200
+    return latencies, errors
+
+
+def run(mode, max_size, endpoint, concurrency, requests_per_client):
+    etl_service.db_pools = PoolManager(db_role_configs, min_size=min(1, max_size), max_size=max_size)
+    server = make_server('127.0.0.1', 0, etl_service.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    credentials = f"{os.environ.get('AUTH_USERNAME')}:{os.environ.get('AUTH_PASSWORD')}"
+    headers = {'Authorization': 'Basic ' + base64.b64encode(credentials.encode()).decode()}
+    try:
+        # Warm up so pooled mode is measured with its connections open, as in a long-running service.
+        client(server.port, endpoint, headers, 5)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda _: client(server.port, endpoint, headers, requests_per_client), range(concurrency)
+            ))
+        elapsed = time.perf_counter() - started
+        metrics = etl_service.db_pools.metrics()
+    finally:
+        server.shutdown()
+        etl_service.db_pools.closeall()
+
+    latencies = sorted(latency for latencies, _ in results for latency in latencies)
+    errors = sum(errors for _, errors in results)
+    print(f"{mode:>8} {len(latencies):>9} {errors:>7} {len(latencies) / elapsed:>9,.0f} "
+          f"{1000 * percentile(latencies, 0.50):>8.2f} {1000 * percentile(latencies, 0.95):>8.2f} "
+          f"{1000 * percentile(latencies, 0.99):>8.2f}")
+    return metrics
+
+
+def main(endpoint, concurrency, requests_per_client, pool_size):
+    print(f"endpoint={endpoint} concurrency={concurrency} requests/client={requests_per_client}")
+    print(f"{'mode':>8} {'requests':>9} {'errors':>7} {'req/sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    run('direct', 0, endpoint, concurrency, requests_per_client)
+    metrics = run('pooled', pool_size, endpoint, concurrency, requests_per_client)
+    print(f"pool metrics: {metrics}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the ETL service with and without connection pooling.')
+    parser.add_argument('--endpoint', default='/display-rows?role=analyst',
+                        help='Path to request (default: /display-rows?role=analyst)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads (default: 16)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per client thread (default: 200)')
+    parser.add_argument('--pool-size', type=int, default=10, help='Maximum pooled connections per role (default: 10)')
+    args = parser.parse_args()
+    main(args.endpoint, args.concurrency, args.requests, args.pool_size)
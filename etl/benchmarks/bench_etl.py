@@ -0,0 +1,194 @@
+"""
+This script benchmarks the /etl endpoint end to end: upload, extract, validate and load into PostgreSQL.
+For every row count, format and error rate it generates a synthetic upload with synthetic.generate_upload,
+then posts it with wait=true through the Flask test client of etl_service, in a fresh subprocess so each
+case reports the peak memory of its own service process. The service runs with ETL_ON_CONFLICT=reject, so
+every injected duplicate id is rejected whichever chunk it lands in; the other service settings
+(ETL_CHUNK_SIZE, ETL_LOAD_METHOD, ETL_CSV_ENGINE, ETL_TRANSFORM_WORKERS) come from the environment and
+are recorded with the results. Reported per case:
+    extract/transform/load seconds: Stage timings summed over the chunks of the run.
+    request seconds and rows/sec: Whole request, including saving and hashing the upload and the commit.
+    peak MB and delta MB: Peak resident set size of the service process, and its growth during the request.
+    reject accuracy: Invalid rows per validation rule and rejected row numbers compared with the errors the
+        generator injected, as precision and recall.
+Each case is also appended as one JSON object per line to --output, with the settings, the git commit and
+the time, so runs can be compared over time to catch regressions in the extract, validate and load paths.
+The users table is emptied before every case and at the end, so point it at a scratch database only.
+Usage:
+    python bench_etl.py [--rows N [N ...]] [--formats F [F ...]] [--error-rates R [R ...]] [--output PATH]
+Arguments:
+    --rows: Row counts to benchmark (default: 10000 100000).
+    --formats: Upload formats, any of 'csv' and 'xlsx' (default: both).
+    --error-rates: Shares of bad rows to inject (default: 0 0.05).
+    --role: Database role the uploads are loaded as (default: admin).
+    --output: JSON lines file the results are appended to (default: bench_etl_results.jsonl).
+Example:
+    ETL_CHUNK_SIZE=100000 python bench_etl.py --rows 1000000 --formats csv --error-rates 0.01
+Database connection and API credentials are read from the same environment variables as the ETL service.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+import datetime
+import subprocess
+
+ETL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl')
+sys.path.insert(0, ETL_DIR)
+
+from bench_memory import peak_rss_mb  # noqa: E402
+from synthetic import generate_upload, write_upload  # noqa: E402
+
+# Validation rule each injected error kind is expected to fail
+RULE_FOR_KIND = {'email': 'email', 'ip_address': 'ip_address', 'name': 'first_name'}
+SETTINGS = ('ETL_CHUNK_SIZE', 'ETL_LOAD_METHOD', 'ETL_CSV_ENGINE', 'ETL_TRANSFORM_WORKERS', 'ETL_ON_CONFLICT')
+
+
+def expected_outcome(expected):
+    """Summarize the generator's per-row outcomes as the counts and rows the service should report."""
+    counts = expected.value_counts()
+    return {
+        'validation_failures': {rule: int(counts.get(kind, 0)) for kind, rule in RULE_FOR_KIND.items()},
+        'invalid_rows': int(sum(counts.get(kind, 0) for kind in RULE_FOR_KIND)),
+        'rejected_rows': [int(row) for row in expected.index[expected == 'duplicate_id']],
+        'rows_loaded': int(counts.get('valid', 0)),
+    }
+
+
+def reject_accuracy(summary, outcome):
+    """Compare the service's load summary with the expected outcome."""
+    reported = {reject['row'] for reject in summary['rejected_rows']}
+    expected = set(outcome['rejected_rows'])
+    found = len(reported & expected)
+    failures = summary['validation_failures']
+    return {
+        'invalid_expected': outcome['invalid_rows'],
+        'invalid_reported': summary['invalid_rows'],
+        'rules_matched': all(failures.get(rule, 0) == count for rule, count in outcome['validation_failures'].items()),
+        'rejected_expected': len(expected),
+        'rejected_reported': len(reported),
+        'reject_precision': round(found / len(reported), 4) if reported else 1.0,
+        'reject_recall': round(found / len(expected), 4) if expected else 1.0,
+        'loaded_expected': outcome['rows_loaded'],
+        'loaded_reported': summary['rows_loaded'],
+    }
+
+
+def measure(file_path, outcome_path, role):
+    """Runs inside the subprocess: posts one upload to /etl and returns its stats."""
+    import etl_service
+
+    # Uploads are posted with wait=true and run inline, so the job queue is not needed
+    etl_service.start_services(jobs=False)
+    client = etl_service.app.test_client()
+    credentials = f"{os.environ.get('AUTH_USERNAME')}:{os.environ.get('AUTH_PASSWORD')}"
+    auth = {'Authorization': 'Basic ' + base64.b64encode(credentials.encode()).decode()}
+    response = client.delete('/delete-all', data={'role': 'admin'}, headers=auth)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with open(outcome_path) as f:
+        outcome = json.load(f)
+
+    baseline_mb = peak_rss_mb()
+    started = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        response = client.post('/etl', data={'file': (f, os.path.basename(file_path)), 'role': role, 'wait': 'true'},
+                               headers=auth)
+    request_seconds = time.perf_counter() - started
+    peak_mb = peak_rss_mb()
+    summary = response.get_json()
+    client.delete('/delete-all', data={'role': 'admin'}, headers=auth)
+    etl_service.stop_services()
+    if response.status_code != 200:
+        return {'status': response.status_code, 'error': summary.get('error') if summary else response.get_data(as_text=True)}
+
+    stages = {stage: round(sum(chunk[f'{key}_seconds'] for chunk in summary['chunks']), 4)
+              for stage, key in (('extract', 'read'), ('transform', 'transform'), ('load', 'load'))}
+    return {
+        'status': response.status_code,
+        'rows_read': summary['rows_read'],
+        'chunks': len(summary['chunks']),
+        'seconds': {**stages, 'request': round(request_seconds, 4)},
+        'rows_per_second': round(summary['rows_read'] / request_seconds),
+        'peak_mb': round(peak_mb, 1),
+        'delta_mb': round(peak_mb - baseline_mb, 1),
+        'accuracy': reject_accuracy(summary, outcome),
+    }
+
+
+def run_in_subprocess(file_path, outcome_path, role, work_dir):
+    env = dict(os.environ, ETL_ON_CONFLICT='reject', ETL_JOB_STORE=os.path.join(work_dir, 'jobs.sqlite3'))
+    # Run from the scratch directory, which is where the service writes its error.log
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', file_path, outcome_path, role],
+        check=True, capture_output=True, text=True, env=env, cwd=work_dir
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ETL_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(row_counts, formats, error_rates, role, output_path):
+    settings = {name: os.environ.get(name) for name in SETTINGS}
+    settings['ETL_ON_CONFLICT'] = 'reject'
+    context = {'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+               'commit': git_commit(), 'settings': settings}
+    print(' '.join(f'{name}={value}' for name, value in settings.items() if value is not None))
+    print(f"{'rows':>9} {'format':>6} {'errors':>6} {'extract':>8} {'transform':>9} {'load':>7} {'request':>8} "
+          f"{'rows/sec':>9} {'peak MB':>8} {'delta MB':>8} {'invalid':>13} {'rejected':>13} {'rules':>5}")
+    with tempfile.TemporaryDirectory() as tmp_dir, open(output_path, 'a') as results:
+        for row_count in row_counts:
+            for error_rate in error_rates:
+                df, expected = generate_upload(row_count, error_rate=error_rate)
+                outcome_path = os.path.join(tmp_dir, 'outcome.json')
+                with open(outcome_path, 'w') as f:
+                    json.dump(expected_outcome(expected), f)
+                for file_format in formats:
+                    file_path = os.path.join(tmp_dir, f'users_{row_count}.{file_format}')
+                    write_upload(df, file_path)
+                    stats = run_in_subprocess(file_path, outcome_path, role, tmp_dir)
+                    record = {**context, 'rows': row_count, 'format': file_format, 'error_rate': error_rate,
+                              'file_mb': round(os.path.getsize(file_path) / (1024 * 1024), 2), **stats}
+                    results.write(json.dumps(record) + '\n')
+                    results.flush()
+                    os.remove(file_path)
+                    if stats['status'] != 200:
+                        print(f"{row_count:>9} {file_format:>6} {error_rate:>6} failed with {stats['status']}: "
+                              f"{stats['error']}")
+                        continue
+                    seconds, accuracy = stats['seconds'], stats['accuracy']
+                    print(f"{row_count:>9} {file_format:>6} {error_rate:>6} {seconds['extract']:>8.2f} "
+                          f"{seconds['transform']:>9.2f} {seconds['load']:>7.2f} {seconds['request']:>8.2f} "
+                          f"{stats['rows_per_second']:>9,} {stats['peak_mb']:>8.1f} {stats['delta_mb']:>8.1f} "
+                          f"{accuracy['invalid_reported']:>6}/{accuracy['invalid_expected']:<6} "
+                          f"{accuracy['rejected_reported']:>6}/{accuracy['rejected_expected']:<6} "
+                          f"{'ok' if accuracy['rules_matched'] else 'diff':>5}")
+    print(f'Results appended to {output_path}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the /etl endpoint end to end.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='Row counts to benchmark (default: 10000 100000)')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'],
+                        help='Upload formats (default: csv xlsx)')
+    parser.add_argument('--error-rates', type=float, nargs='+', default=[0.0, 0.05],
+                        help='Shares of bad rows to inject (default: 0 0.05)')
+    parser.add_argument('--role', default='admin', help='Database role the uploads are loaded as (default: admin)')
+    parser.add_argument('--output', default='bench_etl_results.jsonl',
+                        help='JSON lines file the results are appended to (default: bench_etl_results.jsonl)')
+    parser.add_argument('--measure', nargs=3, metavar=('FILE', 'OUTCOME', 'ROLE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+    else:
+        main(args.rows, args.formats, args.error_rates, args.role, args.output)
@@ -0,0 +1,88 @@
+"""
+This script compares load throughput of the original row-by-row INSERT path against the bulk loader.
+For each size it writes a synthetic CSV, reads it back with pandas the same way the ETL service does,
+and times loading it into an empty users table with each method. The users table is emptied before
+every run, so point it at a scratch database only.
+Usage:
+    python bench_load.py [--sizes N [N ...]] [--methods M [M ...]] [--role ROLE]
+Arguments:
+    --sizes: Row counts to benchmark (default: 10000 100000 1000000).
+    --methods: Load paths to compare, any of 'row', 'values' and 'copy' (default: all three).
+    --role: Database role from db_role_configs to connect as (default: admin).
+Example:
+    python bench_load.py --sizes 10000 100000
+Database connection settings are read from the same environment variables as the ETL service.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import pandas as pd
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+from db import db_role_configs  # noqa: E402
+from loader import bulk_load  # noqa: E402
+from synthetic import generate_users  # noqa: E402
+
+
+def load_row_by_row(conn, df):
+    """Replicates the original load path: one INSERT round trip per row."""
+    cursor = conn.cursor()
+    for _, row in df.iterrows():
+        cursor.execute(
+            "INSERT INTO users (id, first_name, last_name, email, gender, ip_address) VALUES (%s, %s, %s, %s, %s, %s)",
+            tuple(row)
+        )
+    cursor.close()
+    return {'rows_loaded': len(df), 'rejected_rows': []}
+
+
+def run(conn, df, method):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM users")
+    conn.commit()
+    cursor.close()
+
+    start = time.perf_counter()
+    if method == 'row':
+        report = load_row_by_row(conn, df)
+    else:
+        report = bulk_load(conn, df, method=method)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    return elapsed, report
+
+
+def main(sizes, methods, role):
+    conn = psycopg2.connect(**db_role_configs[role])
+    print(f"{'rows':>10} {'method':>8} {'seconds':>10} {'rows/sec':>12} {'loaded':>10} {'rejected':>9}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for size in sizes:
+                csv_path = os.path.join(tmp_dir, f'users_{size}.csv')
+                generate_users(size).to_csv(csv_path, index=False)
+                df = pd.read_csv(csv_path)
+                for method in methods:
+                    elapsed, report = run(conn, df, method)
+                    print(f"{size:>10} {method:>8} {elapsed:>10.2f} {size / elapsed:>12,.0f} "
+                          f"{report['rows_loaded']:>10} {len(report['rejected_rows']):>9}")
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM users")
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark ETL load paths against PostgreSQL.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Row counts to benchmark (default: 10000 100000 1000000)')
+    parser.add_argument('--methods', nargs='+', default=['row', 'values', 'copy'],
+                        choices=['row', 'values', 'copy'], help='Load paths to compare (default: all)')
+    parser.add_argument('--role', default='admin', help='Database role to connect as (default: admin)')
+    args = parser.parse_args()
+    main(args.sizes, args.methods, args.role)
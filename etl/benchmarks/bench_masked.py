@@ -0,0 +1,117 @@
+"""
+This script compares analyst read throughput of the original masked view against the materialized one.
+Three relations with the same rows and columns are read in full with COPY ... TO STDOUT, the way a
+streaming export reads them, and with a filtered keyset page like /display-rows serves:
+    plpgsql view: The original definition, masking every row on read with a PL/pgSQL function. Recreated
+                  as a temporary view and function for the run.
+    sql view: Masking on read with the inlinable SQL mask_email, also as a temporary view.
+    materialized: The masked_users view, which reads the precomputed masked_users_materialized table.
+Usage:
+    python bench_masked.py [--load N] [--repeats N] [--role ROLE]
+Arguments:
+    --load: Replace the users table with N synthetic rows first (default: use the rows already loaded).
+    --repeats: Timed repetitions per relation; the best run is reported (default: 3).
+    --role: Database role from db_role_configs to connect as; it must be able to read 'users' (default: admin).
+Example:
+    python bench_masked.py --load 1000000
+Database connection settings are read from the same environment variables as the ETL service.
+"""
+import os
+import sys
+import time
+import argparse
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+from db import db_role_configs  # noqa: E402
+from loader import bulk_load  # noqa: E402
+from synthetic import generate_users  # noqa: E402
+
+_TEMP_RELATIONS = """
+    CREATE FUNCTION pg_temp.mask_email_plpgsql(email text) RETURNS text AS $$
+    BEGIN
+      RETURN SUBSTRING(email, 1, 1) || '****' || SUBSTRING(email FROM POSITION('@' IN email));
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TEMP VIEW masked_users_plpgsql AS
+    SELECT id, first_name, last_name, pg_temp.mask_email_plpgsql(email) AS email, gender, ip_address FROM users;
+    CREATE TEMP VIEW masked_users_sql AS
+    SELECT id, first_name, last_name, mask_email(email) AS email, gender, ip_address FROM users;
+"""
+
+RELATIONS = [
+    ('plpgsql view', 'masked_users_plpgsql'),
+    ('sql view', 'masked_users_sql'),
+    ('materialized', 'masked_users'),
+]
+
+
+class CountingSink:
+    """File-like target for copy_expert that only counts what it is given."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+def best_time(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def scan(cursor, relation):
+    sink = CountingSink()
+    cursor.copy_expert(f"COPY (SELECT * FROM {relation}) TO STDOUT WITH CSV", sink)
+    return sink.bytes
+
+
+def page(cursor, relation, after):
+    cursor.execute(
+        f"SELECT * FROM {relation} WHERE gender = 'Female' AND id > %s ORDER BY id LIMIT 1000", (after,)
+    )
+    return len(cursor.fetchall())
+
+
+def main(load, repeats, role):
+    conn = psycopg2.connect(**db_role_configs[role])
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        if load:
+            cursor.execute("DELETE FROM users")
+            conn.autocommit = False
+            started = time.perf_counter()
+            bulk_load(conn, generate_users(load))
+            conn.commit()
+            conn.autocommit = True
+            print(f"loaded {load:,} rows in {time.perf_counter() - started:.2f}s")
+        cursor.execute(_TEMP_RELATIONS)
+        cursor.execute("SELECT count(*), percentile_disc(0.5) WITHIN GROUP (ORDER BY id) FROM users")
+        rows, middle_id = cursor.fetchone()
+
+        print(f"{rows:,} rows; page = 1000 rows with gender = 'Female' after the median id")
+        print(f"{'relation':>14} {'scan s':>8} {'rows/sec':>12} {'MB/sec':>8} {'page ms':>8}")
+        for name, relation in RELATIONS:
+            scan_seconds, scanned_bytes = best_time(lambda: scan(cursor, relation), repeats)
+            page_seconds, _ = best_time(lambda: page(cursor, relation, middle_id), repeats)
+            print(f"{name:>14} {scan_seconds:>8.2f} {rows / scan_seconds:>12,.0f} "
+                  f"{scanned_bytes / scan_seconds / 1e6:>8.1f} {1000 * page_seconds:>8.2f}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark masked reads: plpgsql view vs SQL view vs materialized.')
+    parser.add_argument('--load', type=int, default=0,
+                        help='Replace the users table with this many synthetic rows first (default: 0)')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repetitions per relation (default: 3)')
+    parser.add_argument('--role', default='admin', help='Database role to connect as (default: admin)')
+    args = parser.parse_args()
+    main(args.load, args.repeats, args.role)
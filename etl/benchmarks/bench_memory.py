@@ -0,0 +1,128 @@
+"""
+This script measures peak memory of whole-file versus chunked ingestion for CSV and XLSX uploads.
+For each file size and format it writes a synthetic upload, then reads and transforms it in a fresh
+subprocess, once the original way (pd.read_csv/pd.read_excel on the whole file) and once through
+pipeline.read_chunks. Each subprocess reports its peak resident set size, so the numbers are not
+polluted by earlier runs. With --load, chunks are also bulk loaded into PostgreSQL; the users table
+is truncated before and after every run, so point it at a scratch database only.
+Usage:
+    python bench_memory.py [--rows N [N ...]] [--formats F [F ...]] [--chunk-size N] [--load]
+Arguments:
+    --rows: Row counts to benchmark (default: 100000 500000).
+    --formats: Upload formats, any of 'csv' and 'xlsx' (default: both).
+    --chunk-size: Rows per chunk for the chunked mode (default: 50000).
+    --load: Also load each chunk into the database (connection settings come from the environment).
+            Empties the users table.
+Example:
+    python bench_memory.py --rows 1000000 --formats csv
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import pipeline  # noqa: E402
+from loader import bulk_load  # noqa: E402
+from synthetic import generate_users, write_upload  # noqa: E402
+
+
+def peak_rss_mb():
+    # On Linux ru_maxrss is inherited from the parent across fork/exec, so prefer the per-process
+    # high-water mark from /proc. ru_maxrss is reported in bytes on macOS.
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def truncate_users(conn):
+    # TRUNCATE rather than DELETE or ROLLBACK, so dead tuples from one run do not slow down the next.
+    cursor = conn.cursor()
+    cursor.execute("TRUNCATE users")
+    conn.commit()
+    cursor.close()
+
+
+def measure(file_path, mode, chunk_size, load):
+    """Runs inside the subprocess: ingests one file and returns its stats."""
+    baseline_mb = peak_rss_mb()
+    conn = None
+    if load:
+        import psycopg2
+        from db import db_role_configs
+        conn = psycopg2.connect(**db_role_configs['admin'])
+        truncate_users(conn)
+
+    started = time.perf_counter()
+    if mode == 'whole':
+        chunks = [pd.read_excel(file_path) if file_path.endswith('.xlsx') else pd.read_csv(file_path)]
+    else:
+        chunks = pipeline.read_chunks(file_path, chunk_size)
+
+    rows = 0
+    for df in chunks:
+        valid_df, _, _ = pipeline.transform(df)
+        if conn is not None:
+            bulk_load(conn, valid_df)
+        rows += len(df)
+    elapsed = time.perf_counter() - started
+
+    if conn is not None:
+        conn.commit()
+        truncate_users(conn)
+        conn.close()
+    return {'rows': rows, 'seconds': elapsed, 'baseline_mb': baseline_mb, 'peak_mb': peak_rss_mb()}
+
+
+def run_in_subprocess(file_path, mode, chunk_size, load):
+    command = [sys.executable, os.path.abspath(__file__), '--measure', file_path, mode, str(chunk_size)]
+    if load:
+        command.append('--load')
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(row_counts, formats, chunk_size, load):
+    print(f"{'rows':>10} {'format':>6} {'mode':>8} {'file MB':>8} {'seconds':>8} {'rows/sec':>10} "
+          f"{'peak MB':>8} {'delta MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for row_count in row_counts:
+            df = generate_users(row_count)
+            for file_format in formats:
+                file_path = os.path.join(tmp_dir, f'users_{row_count}.{file_format}')
+                write_upload(df, file_path)
+                file_mb = os.path.getsize(file_path) / (1024 * 1024)
+                for mode in ('whole', 'chunked'):
+                    stats = run_in_subprocess(file_path, mode, chunk_size, load)
+                    print(f"{row_count:>10} {file_format:>6} {mode:>8} {file_mb:>8.1f} {stats['seconds']:>8.2f} "
+                          f"{stats['rows'] / stats['seconds']:>10,.0f} {stats['peak_mb']:>8.1f} "
+                          f"{stats['peak_mb'] - stats['baseline_mb']:>9.1f}")
+                os.remove(file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark peak memory of whole-file vs chunked ingestion.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 500000],
+                        help='Row counts to benchmark (default: 100000 500000)')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'],
+                        help='Upload formats to benchmark (default: csv xlsx)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per chunk (default: 50000)')
+    parser.add_argument('--load', action='store_true', help='Also bulk load chunks into the database')
+    parser.add_argument('--measure', nargs=3, metavar=('FILE', 'MODE', 'CHUNK_SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        file_path, mode, chunk_size = args.measure
+        print(json.dumps(measure(file_path, mode, int(chunk_size), args.load)))
+    else:
+        main(args.rows, args.formats, args.chunk_size, args.load)
@@ -0,0 +1,117 @@
+"""
+This script compares how fast, and with how much memory, each upload format is parsed.
+The same synthetic dataset is written once per format and read back in a fresh subprocess through
+pipeline.read_chunks, which reports parse time and its peak resident set size. Formats:
+    csv: CSV through pandas' chunked reader, inferring column types (ETL_CSV_ENGINE=pandas).
+    csv-pyarrow: The same CSV through pyarrow's streaming reader with string columns (ETL_CSV_ENGINE=pyarrow).
+    xlsx: Excel through openpyxl's read-only row iterator.
+    parquet: Parquet read batch by batch with pyarrow.
+    arrow: Arrow IPC file format, read from a memory map.
+With --transform, chunks are also cleaned and validated, to show the effect of the column dtypes each
+reader produces on the transform step.
+Usage:
+    python bench_parse.py [--rows N [N ...]] [--formats F [F ...]] [--chunk-size N] [--transform]
+Arguments:
+    --rows: Row counts to benchmark (default: 100000 1000000).
+    --formats: Formats to compare (default: all of them).
+    --chunk-size: Rows per chunk; 0 reads each file whole (default: 50000).
+    --transform: Also transform every chunk.
+Example:
+    python bench_parse.py --rows 1000000 --formats csv csv-pyarrow parquet arrow --transform
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import pipeline  # noqa: E402
+from bench_memory import peak_rss_mb, write_upload  # noqa: E402
+from synthetic import generate_users  # noqa: E402
+
+# Format name: (file extension, CSV engine)
+FORMATS = {
+    'csv': ('csv', 'pandas'),
+    'csv-pyarrow': ('csv', 'pyarrow'),
+    'xlsx': ('xlsx', 'pandas'),
+    'parquet': ('parquet', 'pandas'),
+    'arrow': ('arrow', 'pandas'),
+}
+
+
+def write_file(df, path):
+    if path.endswith('.parquet'):
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    elif path.endswith('.arrow'):
+        feather.write_feather(df, path, compression='uncompressed')
+    else:
+        write_upload(df, path)
+
+
+def measure(file_path, chunk_size, csv_engine, transform):
+    """Runs inside the subprocess: parses one file and returns its stats."""
+    baseline_mb = peak_rss_mb()
+    started = time.perf_counter()
+    rows = 0
+    for df in pipeline.read_chunks(file_path, chunk_size, csv_engine=csv_engine):
+        if transform:
+            pipeline.transform(df)
+        rows += len(df)
+    elapsed = time.perf_counter() - started
+    return {'rows': rows, 'seconds': elapsed, 'baseline_mb': baseline_mb, 'peak_mb': peak_rss_mb()}
+
+
+def run_in_subprocess(file_path, chunk_size, csv_engine, transform):
+    command = [sys.executable, os.path.abspath(__file__), '--measure', file_path, str(chunk_size), csv_engine]
+    if transform:
+        command.append('--transform')
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(row_counts, formats, chunk_size, transform):
+    print(f"chunk_size={chunk_size} transform={transform}")
+    print(f"{'rows':>10} {'format':>12} {'file MB':>8} {'seconds':>8} {'rows/sec':>11} {'peak MB':>8} {'delta MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for row_count in row_counts:
+            df = generate_users(row_count)
+            # Every format carries the same values; ids are text, as in the users table.
+            df['id'] = df['id'].astype(str)
+            files = {}
+            for name in formats:
+                extension, csv_engine = FORMATS[name]
+                file_path = os.path.join(tmp_dir, f'users_{row_count}.{extension}')
+                if extension not in files:
+                    write_file(df, file_path)
+                    files[extension] = file_path
+                stats = run_in_subprocess(file_path, chunk_size, csv_engine, transform)
+                print(f"{row_count:>10} {name:>12} {os.path.getsize(file_path) / (1024 * 1024):>8.1f} "
+                      f"{stats['seconds']:>8.2f} {stats['rows'] / stats['seconds']:>11,.0f} "
+                      f"{stats['peak_mb']:>8.1f} {stats['peak_mb'] - stats['baseline_mb']:>9.1f}")
+            for file_path in files.values():
+                os.remove(file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parse speed and peak memory per upload format.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                        help='Row counts to benchmark (default: 100000 1000000)')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=list(FORMATS),
+                        help='Formats to compare (default: all)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per chunk (default: 50000)')
+    parser.add_argument('--transform', action='store_true', help='Also transform every chunk')
+    parser.add_argument('--measure', nargs=3, metavar=('FILE', 'CHUNK_SIZE', 'CSV_ENGINE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        file_path, chunk_size, csv_engine = args.measure
+        print(json.dumps(measure(file_path, int(chunk_size), csv_engine, args.transform)))
+    else:
+        main(args.rows, args.formats, args.chunk_size, args.transform)
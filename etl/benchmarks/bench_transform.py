@@ -0,0 +1,99 @@
+"""
+This script measures how the transform step scales with the number of worker processes.
+A synthetic upload, with a share of rows broken so that every validation rule rejects some of them, is
+written to a temporary CSV and read back in chunks through pipeline.read_chunks. The chunks are then
+transformed serially and with a pipeline.TransformPool of each requested size. Every parallel result is
+compared with the serial one: the valid rows (values, dtypes, order and index), the invalid row count
+and the per-rule failure counts must all be identical.
+Usage:
+    python bench_transform.py [--rows N] [--chunk-size N] [--workers N [N ...]] [--invalid-fraction F]
+Arguments:
+    --rows: Rows in the synthetic upload (default: 1000000).
+    --chunk-size: Rows per chunk, as ETL_CHUNK_SIZE (default: 200000).
+    --workers: Pool sizes to test; 1 is the serial transform (default: 1 2 4 8 16).
+    --invalid-fraction: Share of rows broken to fail validation (default: 0.02).
+Example:
+    python bench_transform.py --rows 2000000 --workers 1 4 8
+Speedups are bounded by the cores available; the script prints how many there are.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import pipeline  # noqa: E402
+from synthetic import generate_users  # noqa: E402
+
+BREAKAGES = [
+    ('email', lambda value: value.replace('@', ' at ')),
+    ('ip_address', lambda value: value + '.1'),
+    ('first_name', lambda value: value + '1'),
+    ('last_name', lambda value: ' ' + value + '-'),
+]
+
+
+def synthetic_upload(rows, invalid_fraction, path):
+    df = generate_users(rows)
+    rng = np.random.default_rng(1)
+    for column, breakage in BREAKAGES:
+        broken = rng.random(rows) < invalid_fraction / len(BREAKAGES)
+        df.loc[broken, column] = df.loc[broken, column].map(breakage)
+    df.to_csv(path, index=False)
+
+
+def transform_all(chunks, transform):
+    return [transform(chunk) for chunk in chunks]
+
+
+def same_results(expected, actual):
+    return all(
+        valid.equals(other_valid) and (valid.dtypes == other_valid.dtypes).all()
+        and valid.index.equals(other_valid.index) and count == other_count and failures == other_failures
+        for (valid, count, failures), (other_valid, other_count, other_failures) in zip(expected, actual)
+    )
+
+
+def main(rows, chunk_size, worker_counts, invalid_fraction):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'users.csv')
+        synthetic_upload(rows, invalid_fraction, path)
+        chunks = list(pipeline.read_chunks(path, chunk_size))
+
+    started = time.perf_counter()
+    expected = transform_all(chunks, pipeline.transform)
+    serial_seconds = time.perf_counter() - started
+    invalid_rows = sum(count for _, count, _ in expected)
+
+    print(f"{rows:,} rows in {len(chunks)} chunks of {chunk_size:,}; {invalid_rows:,} invalid; "
+          f"{os.cpu_count()} cores available")
+    print(f"{'workers':>7} {'seconds':>8} {'rows/sec':>12} {'speedup':>8} {'identical':>9}")
+    for workers in worker_counts:
+        if workers <= 1:
+            seconds, identical = serial_seconds, True
+        else:
+            pool = pipeline.TransformPool(workers)
+            try:
+                started = time.perf_counter()
+                results = transform_all(chunks, pool.transform)
+                seconds = time.perf_counter() - started
+            finally:
+                pool.close()
+            identical = same_results(expected, results)
+        print(f"{workers:>7} {seconds:>8.2f} {rows / seconds:>12,.0f} {serial_seconds / seconds:>7.2f}x "
+              f"{str(identical):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the parallel transform step against the serial one.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows in the synthetic upload (default: 1000000)')
+    parser.add_argument('--chunk-size', type=int, default=200000, help='Rows per chunk (default: 200000)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Pool sizes to test; 1 is the serial transform (default: 1 2 4 8 16)')
+    parser.add_argument('--invalid-fraction', type=float, default=0.02,
+                        help='Share of rows broken to fail validation (default: 0.02)')
+    args = parser.parse_args()
+    main(args.rows, args.chunk_size, args.workers, args.invalid_fraction)
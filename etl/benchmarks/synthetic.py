@@ -0,0 +1,135 @@
+"""
+This module generates synthetic user data in the shape expected by the ETL service.
+Rows can be generated all valid, or with a share of deliberately bad rows whose expected outcome is known,
+so the validation and reject counts reported by the service can be checked.
+Usage:
+    python synthetic.py num_rows output_path [--seed SEED] [--error-rate RATE]
+Arguments:
+    num_rows (int): Number of rows to generate.
+    output_path (str): Destination .csv or .xlsx file.
+    --error-rate (float): Share of rows given one error each (default: 0).
+Example:
+    python synthetic.py 100000 /tmp/users_100k.xlsx --error-rate 0.05
+This will write 100,000 user rows, 5% of them with a bad email, IP address or name or a duplicate id,
+to /tmp/users_100k.xlsx.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+FIRST_NAMES = ['Ada', 'Alan', 'Grace', 'Linus', 'Barbara', 'Dennis', 'Margaret', 'Ken', 'Frances', 'Edsger']
+LAST_NAMES = ['Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Liskov', 'Ritchie', 'Hamilton', 'Thompson', 'Allen', 'Dijkstra']
+ERROR_KINDS = ('email', 'ip_address', 'name', 'duplicate_id')
+GENDERS = ['Female', 'Male', 'Non-binary', 'Agender']
+DOMAINS = ['example.com', 'mail.example.org', 'corp.example.net']
+
+
+def generate_users(num_rows, seed=0, start_id=1):
+    """
+    Generate a DataFrame of valid user rows.
+
+    Ids are consecutive integers starting at start_id and emails embed the id, so both are unique
+    within one call and across calls with non-overlapping id ranges.
+
+    Args:
+        num_rows (int): Number of rows to generate.
+        seed (int): Seed for the random number generator.
+        start_id (int): First id to assign.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with the columns id, first_name, last_name, email, gender and ip_address.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(start_id, start_id + num_rows)
+    first_names = rng.choice(FIRST_NAMES, num_rows)
+    last_names = rng.choice(LAST_NAMES, num_rows)
+    domains = rng.choice(DOMAINS, num_rows)
+    octets = pd.DataFrame(rng.integers(0, 256, size=(num_rows, 4))).astype(str)
+
+    emails = (
+        pd.Series(first_names).str.lower() + '.' + pd.Series(last_names).str.lower()
+        + pd.Series(ids).astype(str) + '@' + pd.Series(domains)
+    )
+    ip_addresses = octets[0] + '.' + octets[1] + '.' + octets[2] + '.' + octets[3]
+
+    return pd.DataFrame({
+        'id': ids,
+        'first_name': first_names,
+        'last_name': last_names,
+        'email': emails,
+        'gender': rng.choice(GENDERS, num_rows),
+        'ip_address': ip_addresses,
+    })
+
+
+def generate_upload(num_rows, error_rate=0.0, seed=0, start_id=1, kinds=ERROR_KINDS):
+    """
+    Generate user rows of which a share are bad, together with the outcome expected for every row.
+
+    A random error_rate share of the rows get exactly one error each, spread evenly over kinds:
+        email: The '@' is removed, so the row fails the email rule.
+        ip_address: The last octet is removed, so the row fails the ip_address rule.
+        name: A digit is appended to the first name, so the row fails the first_name rule.
+        duplicate_id: The row reuses the id of an earlier valid row, so the loader rejects it. Rows with
+            no valid row before them get an email error instead.
+
+    Args:
+        num_rows (int): Number of rows to generate.
+        error_rate (float): Share of rows to make bad, between 0 and 1.
+        seed (int): Seed for the random number generator.
+        start_id (int): First id to assign.
+        kinds (tuple): Error kinds to inject, from ERROR_KINDS.
+
+    Returns:
+        tuple: (df, expected) where expected is a Series aligned with df holding 'valid' or the error kind
+               of each row.
+    """
+    df = generate_users(num_rows, seed=seed, start_id=start_id)
+    rng = np.random.default_rng(seed + 1)
+    bad_rows = np.sort(rng.choice(num_rows, size=int(round(num_rows * error_rate)), replace=False))
+    expected = pd.Series('valid', index=df.index, dtype=object)
+    expected.iloc[bad_rows] = np.array(kinds, dtype=object)[rng.permutation(len(bad_rows)) % len(kinds)]
+
+    # Duplicates point at an earlier row that is itself valid, so exactly one of the pair is rejected
+    duplicate_rows = np.flatnonzero(expected.to_numpy() == 'duplicate_id')
+    valid_rows = np.flatnonzero(expected.to_numpy() == 'valid')
+    earlier_valid = np.searchsorted(valid_rows, duplicate_rows)
+    expected.iloc[duplicate_rows[earlier_valid == 0]] = 'email'
+    duplicate_rows, earlier_valid = duplicate_rows[earlier_valid > 0], earlier_valid[earlier_valid > 0]
+    targets = valid_rows[(rng.random(len(duplicate_rows)) * earlier_valid).astype(int)]
+    df.loc[duplicate_rows, 'id'] = df['id'].to_numpy()[targets]
+
+    email_rows = expected == 'email'
+    df.loc[email_rows, 'email'] = df.loc[email_rows, 'email'].str.replace('@', '', regex=False)
+    ip_rows = expected == 'ip_address'
+    df.loc[ip_rows, 'ip_address'] = df.loc[ip_rows, 'ip_address'].str.rsplit('.', n=1).str[0]
+    name_rows = expected == 'name'
+    df.loc[name_rows, 'first_name'] = df.loc[name_rows, 'first_name'] + '1'
+    return df, expected
+
+
+def write_upload(df, path):
+    """Write a DataFrame as a .csv or .xlsx upload."""
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+        return
+    # A write-only workbook keeps generating large XLSX files from taking more memory than reading them.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([value.item() if hasattr(value, 'item') else value for value in row])
+    workbook.save(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic user upload for the ETL service.')
+    parser.add_argument('num_rows', type=int, help='Number of rows to generate')
+    parser.add_argument('output_path', help='Destination .csv or .xlsx file')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of rows made bad (default: 0)')
+    args = parser.parse_args()
+    df, expected = generate_upload(args.num_rows, error_rate=args.error_rate, seed=args.seed)
+    write_upload(df, args.output_path)
+    print(f'Saved {args.num_rows} rows to {args.output_path}; expected outcomes: {expected.value_counts().to_dict()}')
@@ -0,0 +1,366 @@
+"""
+Database Connection Pools
+This module keeps one thread-safe pool of PostgreSQL connections per database role, so request handlers
+reuse open connections instead of paying connection setup on every request.
+Connections are health checked when they are checked out: closed or broken connections are replaced, and
+connections that have been idle for longer than ping_after seconds are probed with 'SELECT 1' first.
+Connections returned in a failed or unfinished transaction are rolled back, and broken ones are closed and
+recycled. Each pool counts checkouts, waits, timeouts and recycled connections, and times checkouts and the
+opening of new connections.
+Configuration:
+    db_role_configs: psycopg2.connect keyword arguments for each database role (analyst, manager, admin),
+        read from the environment. Importing this module opens no connections.
+Classes:
+    PoolTimeoutError: Raised when no connection becomes available within the pool timeout.
+    ConnectionPool: A bounded pool of connections for one database configuration.
+    PoolManager: Creates and holds one ConnectionPool per role.
+Usage:
+    pools = PoolManager(db_role_configs, min_size=1, max_size=10)
+    with pools.connection('analyst') as conn:
+        ...
+    A max_size of 0 disables pooling: every checkout opens a new connection and every release closes it.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the checkout latency histogram kept by every pool
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Database configurations
+db_role_configs = {
+    'analyst': {
+        'dbname': os.environ.get('POSTGRES_DB'),
+        'user': os.environ.get('ANALYST_DB_USER'),
+        'password': os.environ.get('ANALYST_DB_PASSWORD'),
+        'host': os.environ.get('POSTGRES_HOST')
+    },
+    'manager': {
+        'dbname': os.environ.get('POSTGRES_DB'),
+        'user': os.environ.get('MANAGER_DB_USER'),
+        'password': os.environ.get('MANAGER_DB_PASSWORD'),
+        'host': os.environ.get('POSTGRES_HOST')
+    },
+    'admin': {
+        'dbname': os.environ.get('POSTGRES_DB'),
+        'user': os.environ.get('ADMIN_DB_USER'),
+        'password': os.environ.get('ADMIN_DB_PASSWORD'),
+        'host': os.environ.get('POSTGRES_HOST')
+    }
+}
+
+
+class PoolTimeoutError(Exception):
+    """Raised when a connection could not be checked out before the pool timeout expired."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe, bounded pool of connections for one database configuration.
+
+    Args:
+        config (dict): Keyword arguments for psycopg2.connect.
+        min_size (int): Connections opened when the pool is created.
+        max_size (int): Maximum open connections. 0 disables pooling.
+        timeout (float): Seconds to wait for a free connection before raising PoolTimeoutError.
+        ping_after (float): Idle seconds after which a connection is probed before being handed out.
+    """
+
+    def __init__(self, config, min_size=1, max_size=10, timeout=30.0, ping_after=30.0):
+        self.config = config
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._checkout_seconds = 0.0
+        self._checkout_seconds_max = 0.0
+        self._checkout_buckets = [0] * (len(CHECKOUT_BUCKETS) + 1)
+        self._connects = 0
+        self._connect_seconds = 0.0
+
+        try:
+            for _ in range(self.min_size):
+                self._idle.append((self._connect(), time.monotonic()))
+                self._size += 1
+        except psycopg2.Error as e:
+            logger.error(f"Could not open initial pool connections: {str(e)}")
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = psycopg2.connect(**self.config)
+        elapsed = time.perf_counter() - started
+        with self._condition:
+            self._connects += 1
+            self._connect_seconds += elapsed
+        return conn
+
+    def _is_usable(self, conn, last_used):
+        if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _record_checkout(self, started, waited):
+        elapsed = time.perf_counter() - started
+        with self._condition:
+            self._in_use += 1
+            self._checkouts += 1
+            self._waits += waited
+            self._checkout_seconds += elapsed
+            self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+            self._checkout_buckets[bisect.bisect_left(CHECKOUT_BUCKETS, elapsed)] += 1
+
+    def getconn(self):
+        """
+        Check out a healthy connection, waiting up to the pool timeout if all connections are in use.
+
+        Returns:
+            psycopg2.extensions.connection: An open connection that must be returned with putconn.
+
+        Raises:
+            PoolTimeoutError: If no connection became available in time.
+            psycopg2.Error: If a new connection could not be opened.
+        """
+        started = time.perf_counter()
+        if self.max_size == 0:
+            conn = self._connect()
+            self._record_checkout(started, False)
+            return conn
+
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout} seconds.")
+                waited = True
+                self._condition.wait(remaining)
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+
+        # Health checks and new connections happen outside the lock so they never block other checkouts.
+        if conn is not None and not self._is_usable(conn, last_used):
+            self._close(conn)
+            with self._condition:
+                self._recycled += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+
+        self._record_checkout(started, waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Return a connection to the pool.
+
+        Unfinished transactions are rolled back. Closed or broken connections, and connections returned
+        with discard=True, are closed and their slot is freed for a new connection.
+
+        Args:
+            conn (psycopg2.extensions.connection): A connection obtained from getconn.
+            discard (bool): Close the connection instead of keeping it.
+        """
+        if self.max_size == 0:
+            with self._condition:
+                self._in_use -= 1
+            self._close(conn)
+            return
+
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._size -= 1
+                self._recycled += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+        if discard:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block.
+
+        Connections that raise psycopg2.InterfaceError or psycopg2.OperationalError inside the block are
+        discarded rather than returned to the pool.
+
+        Yields:
+            psycopg2.extensions.connection: An open connection.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def metrics(self):
+        """
+        Report the pool's current state and counters.
+
+        Returns:
+            dict: size, in_use, idle and max_size gauges, the checkouts, waits, timeouts, recycled and
+                  connects counters, average and maximum checkout latency and average time to open a new
+                  connection in milliseconds.
+        """
+        with self._condition:
+            return {
+                'size': self._size if self.max_size else self._in_use,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'checkout_ms_avg': round(1000 * self._checkout_seconds / self._checkouts, 3) if self._checkouts else 0.0,
+                'checkout_ms_max': round(1000 * self._checkout_seconds_max, 3),
+                'connects': self._connects,
+                'connect_ms_avg': round(1000 * self._connect_seconds / self._connects, 3) if self._connects else 0.0,
+            }
+
+    def timings(self):
+        """
+        Report the raw checkout and connect timings, for exporting as histograms.
+
+        Returns:
+            dict: checkout_buckets (checkouts per CHECKOUT_BUCKETS bound, not cumulative, plus one final
+                  count for slower checkouts), checkout_seconds and checkouts (sum and count), and
+                  connect_seconds and connects (sum and count).
+        """
+        with self._condition:
+            return {
+                'checkout_buckets': list(self._checkout_buckets),
+                'checkout_seconds': self._checkout_seconds,
+                'checkouts': self._checkouts,
+                'connect_seconds': self._connect_seconds,
+                'connects': self._connects,
+            }
+
+    def closeall(self):
+        """Close all idle connections. Connections that are checked out are closed when they are returned."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+
+class PoolManager:
+    """
+    Holds one ConnectionPool per database role, created on first use.
+
+    Args:
+        role_configs (dict): psycopg2.connect keyword arguments keyed by role, e.g. db_role_configs.
+        **pool_options: Keyword arguments passed to every ConnectionPool.
+    """
+
+    def __init__(self, role_configs, **pool_options):
+        self.role_configs = role_configs
+        self.pool_options = pool_options
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._role_locks = {}
+
+    def pool(self, role):
+        """
+        Return the pool for a role, creating it on first use.
+
+        A new pool opens its min_size connections under a lock of its own role, so a slow or unreachable
+        database for one role does not hold up the first use of the others.
+
+        Raises:
+            KeyError: If the role has no database configuration.
+        """
+        with self._lock:
+            if role in self._pools:
+                return self._pools[role]
+            config = self.role_configs[role]
+            role_lock = self._role_locks.setdefault(role, threading.Lock())
+        with role_lock:
+            with self._lock:
+                if role in self._pools:
+                    return self._pools[role]
+            pool = ConnectionPool(config, **self.pool_options)
+            with self._lock:
+                self._pools[role] = pool
+            return pool
+
+    def connection(self, role):
+        """Check out a connection from the role's pool for the duration of a with block."""
+        return self.pool(role).connection()
+
+    def metrics(self):
+        """Return the metrics of every pool created so far, keyed by role."""
+        with self._lock:
+            pools = dict(self._pools)
+        return {role: pool.metrics() for role, pool in pools.items()}
+
+    def timings(self):
+        """Return the timings of every pool created so far, keyed by role."""
+        with self._lock:
+            pools = dict(self._pools)
+        return {role: pool.timings() for role, pool in pools.items()}
+
+    def closeall(self):
+        """Close the idle connections of every pool."""
+        with self._lock:
+            pools = dict(self._pools)
+        for pool in pools.values():
+            pool.closeall()
@@ -5,70 +5,182 @@ This module provides a Flask-based web service for performing ETL (Extract, Tran
 It includes endpoints for health checks, file uploads, ETL processing, displaying rows, and deleting all data.
 Modules:
     os: Provides a way of using operating system dependent functionality.
-    re: Provides regular expression matching operations.
     logging: Provides a way to configure and use loggers.
-    psycopg2: Provides a PostgreSQL database adapter for Python.
-    pandas: Provides data structures and data analysis tools.
     flask: Provides a micro web framework for Python.
     werkzeug.utils: Provides utility functions for Flask.
     flask_httpauth: Provides HTTP authentication for Flask.
+    pipeline: Provides the chunked extract, transform and load steps.
+    db: Provides the per-role database connection pools.
+    jobs: Provides the SQLite-backed background ETL job queue.
+    validation: Provides the column-wide row validation rules.
+    queries: Provides the keyset-paginated and streaming row queries behind /display-rows.
+    ledger: Provides upload content hashing and the ledger of loaded uploads.
+    metrics: Provides the Prometheus metrics, request timing and profiling hooks.
 Configuration:
     UPLOAD_FOLDER: Directory where uploaded files are saved.
-    db_role_configs: Dictionary containing database configurations for different roles (analyst, manager, admin).
+    ETL_CHUNK_SIZE: Rows read, validated and loaded per chunk; 0 processes the whole file at once. Read from the environment.
+    ETL_LOAD_METHOD: Bulk load method, 'copy' (default) or 'values'. Read from the environment.
+    ETL_CSV_ENGINE: CSV parser, 'pandas' (default) or 'pyarrow' for pyarrow's multithreaded reader with
+        string columns. Read from the environment.
+    ETL_LOAD_BATCH_SIZE: Rows per statement for the 'values' load method. Read from the environment.
+    ETL_ON_CONFLICT: 'upsert' (default) updates users whose id is already loaded when a column changed;
+        'reject' rejects them. Read from the environment.
+    ETL_JOB_STORE: Path of the SQLite database holding ETL job state. Read from the environment.
+    ETL_JOB_WORKERS: Number of ETL jobs processed concurrently. Read from the environment.
+    ETL_DISPLAY_MAX_LIMIT: Largest page size accepted by /display-rows. Read from the environment.
+    ETL_EXPORT_ITERSIZE: Rows fetched per round trip when /display-rows streams an export. Read from the environment.
+    ETL_TRANSFORM_WORKERS: Worker processes the transform step of each chunk is split across; 1 (default)
+        transforms in the service process. Read from the environment.
+    VALIDATION_RULES: Compiled validation rules. Extra rules are read from the JSON file named by the
+        ETL_VALIDATION_RULES_FILE environment variable, if set.
+    ETL_DB_POOL_MIN, ETL_DB_POOL_MAX: Connections opened up front and the maximum kept open per role.
+        ETL_DB_POOL_MAX=0 disables pooling. Read from the environment.
+    ETL_DB_POOL_TIMEOUT: Seconds a request waits for a free pooled connection. Read from the environment.
+    ETL_DB_POOL_PING_AFTER: Idle seconds after which a pooled connection is probed before reuse. Read from the environment.
+    ETL_PROFILE_DIR: Directory where requests sent with 'X-Profile: true' write cProfile dumps. Profiling is
+        disabled when unset. Read from the environment.
+    db_role_configs: Dictionary containing database configurations for different roles (analyst, manager, admin),
+        from the db module.
+    db_pools: One connection pool per role in db_role_configs. Created by start_services.
+    transform_pool: The pipeline.TransformPool used by ETL jobs, or None when ETL_TRANSFORM_WORKERS is 1.
+        Created by start_services.
+    etl_jobs: The background ETL job queue. Created by start_services.
 Endpoints:
-    /health (GET): Performs a health check on the service and database connection.
+    /health (GET): Performs a health check on the service and database connection, and reports pool metrics.
+    /metrics (GET): Reports request, pipeline stage, row and connection pool metrics in the Prometheus text format.
     /test-upload (POST): Tests file upload functionality.
-    /etl (POST): Performs ETL operations on uploaded files. Requires authentication.
-    /display-rows (GET): Displays rows from the database. Requires authentication.
+    /etl (POST): Queues ETL operations on uploaded files as a background job. Requires authentication.
+    /etl/jobs (GET): Lists recent ETL jobs. Requires authentication.
+    /etl/jobs/<job_id> (GET): Reports the state, progress, timings and result of an ETL job. Requires authentication.
+    /etl/jobs/<job_id>/cancel (POST): Cancels an ETL job. Requires authentication.
+    /display-rows (GET): Pages through rows with projection and filters, or streams them as NDJSON or CSV.
+        Requires authentication.
     /delete-all (DELETE): Deletes all data from the database. Requires authentication.
 Functions:
+    start_services(jobs): Creates the transform worker processes, connection pools and job queue.
+    stop_services(): Stops the job queue and transform workers and closes idle pooled connections.
+    create_app(): Starts the services and returns the Flask app; the entry point for 'flask run'.
     verify_password(username, password): Verifies the provided username and password against environment variables.
     health_check(): Performs a health check on the service and database connection.
+    service_metrics(): Reports the service metrics.
     test_upload(): Tests file upload functionality.
-    etl(): Performs ETL operations on uploaded files.
-    display_rows(): Displays rows from the database.
+    run_etl(role, file_path, on_chunk, content_hash): Runs the ETL pipeline over a saved upload, or returns the
+        earlier result of an identical upload.
+    etl(): Queues ETL operations on uploaded files, or runs them inline when asked to wait.
+    etl_jobs_list(): Lists recent ETL jobs.
+    etl_job_status(job_id): Reports the state of an ETL job.
+    etl_job_cancel(job_id): Cancels an ETL job.
+    display_rows(): Pages through rows from the database, or streams them.
+    export_rows(role, export_format, query, params, columns): Streams query results through a server-side cursor.
     delete_all(): Deletes all data from the database.
 Usage:
-    Run the module as a standalone script to start the Flask web service.
+    Run the module as a standalone script, or with FLASK_APP='etl_service:create_app()' flask run, to start
+    the Flask web service. Importing the module only defines the app; nothing is started until
+    start_services is called.
 """
-import re
+import time
+import uuid
+import atexit
 import logging
-import psycopg2
-import pandas as pd
-from flask import Flask, request, jsonify
+import itertools
+import threading
+from flask import Flask, Response, request, jsonify, url_for
 from werkzeug.utils import secure_filename
 from flask_httpauth import HTTPBasicAuth
+import ledger
+import metrics
+import pipeline
+import queries
+from db import PoolManager, PoolTimeoutError, db_role_configs
+from jobs import JobCancelled, JobQueue, JobStore
+from validation import DEFAULT_RULES, compile_rules, load_rules
 
 # Setting up Flask App
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = '/tmp'
+app.config['ETL_CHUNK_SIZE'] = int(os.environ.get('ETL_CHUNK_SIZE', 50000))
+app.config['ETL_LOAD_METHOD'] = os.environ.get('ETL_LOAD_METHOD', 'copy')
+app.config['ETL_CSV_ENGINE'] = os.environ.get('ETL_CSV_ENGINE', 'pandas')
+app.config['ETL_LOAD_BATCH_SIZE'] = int(os.environ.get('ETL_LOAD_BATCH_SIZE', 10000))
+app.config['ETL_ON_CONFLICT'] = os.environ.get('ETL_ON_CONFLICT', 'upsert')
+app.config['ETL_DB_POOL_MIN'] = int(os.environ.get('ETL_DB_POOL_MIN', 1))
+app.config['ETL_DB_POOL_MAX'] = int(os.environ.get('ETL_DB_POOL_MAX', 10))
+app.config['ETL_DB_POOL_TIMEOUT'] = float(os.environ.get('ETL_DB_POOL_TIMEOUT', 30))
+app.config['ETL_DB_POOL_PING_AFTER'] = float(os.environ.get('ETL_DB_POOL_PING_AFTER', 30))
+app.config['ETL_PROFILE_DIR'] = os.environ.get('ETL_PROFILE_DIR')
+app.config['ETL_JOB_STORE'] = os.environ.get('ETL_JOB_STORE', os.path.join(app.config['UPLOAD_FOLDER'], 'etl_jobs.sqlite3'))
+app.config['ETL_JOB_WORKERS'] = int(os.environ.get('ETL_JOB_WORKERS', 2))
+app.config['ETL_DISPLAY_MAX_LIMIT'] = int(os.environ.get('ETL_DISPLAY_MAX_LIMIT', 1000))
+app.config['ETL_EXPORT_ITERSIZE'] = int(os.environ.get('ETL_EXPORT_ITERSIZE', 2000))
+app.config['ETL_TRANSFORM_WORKERS'] = int(os.environ.get('ETL_TRANSFORM_WORKERS', 1))
+app.config['VALIDATION_RULES'] = (
+    load_rules(os.environ['ETL_VALIDATION_RULES_FILE'])
+    if os.environ.get('ETL_VALIDATION_RULES_FILE') else compile_rules(DEFAULT_RULES)
+)
 auth = HTTPBasicAuth()
+metrics.instrument(app, profile_dir=app.config['ETL_PROFILE_DIR'])
 
 # Logger for errors
 logging.basicConfig(filename='error.log', level=logging.ERROR)
 logger = logging.getLogger()
 
-# Database configurations
-db_role_configs = {
-    'analyst': {
-        'dbname': os.environ.get('POSTGRES_DB'),
-        'user': os.environ.get('ANALYST_DB_USER'),
-        'password': os.environ.get('ANALYST_DB_PASSWORD'),
-        'host': os.environ.get('POSTGRES_HOST')
-    },
-    'manager': {
-        'dbname': os.environ.get('POSTGRES_DB'),
-        'user': os.environ.get('MANAGER_DB_USER'),
-        'password': os.environ.get('MANAGER_DB_PASSWORD'),
-        'host': os.environ.get('POSTGRES_HOST')
-    },
-    'admin': {
-        'dbname': os.environ.get('POSTGRES_DB'),
-        'user': os.environ.get('ADMIN_DB_USER'),
-        'password': os.environ.get('ADMIN_DB_PASSWORD'),
-        'host': os.environ.get('POSTGRES_HOST')
-    }
-}
+# Created by start_services, so importing this module starts no processes, threads or connections
+transform_pool = None
+db_pools = None
+etl_jobs = None
+_services_lock = threading.Lock()
+
+def start_services(jobs=True):
+    """
+    Create the transform worker processes, the connection pools and the ETL job queue.
+
+    Called by create_app when the service starts. Scripts that drive the app in process (for example
+    through its test client) call it themselves, usually with jobs=False. Calling it again does nothing,
+    except start the job queue if it was not started before.
+
+    Args:
+        jobs (bool): Start the job queue, which also resumes jobs left queued or running by a stopped
+            process. Without it the queue is started by the first /etl request that queues a job.
+    """
+    global transform_pool, db_pools, etl_jobs
+    with _services_lock:
+        if db_pools is None:
+            # Transform worker processes, started before any other thread so they can be forked safely
+            transform_pool = (
+                pipeline.TransformPool(app.config['ETL_TRANSFORM_WORKERS'])
+                if app.config['ETL_TRANSFORM_WORKERS'] > 1 else None
+            )
+            # One connection pool per role, created on first use
+            db_pools = PoolManager(
+                db_role_configs,
+                min_size=app.config['ETL_DB_POOL_MIN'],
+                max_size=app.config['ETL_DB_POOL_MAX'],
+                timeout=app.config['ETL_DB_POOL_TIMEOUT'],
+                ping_after=app.config['ETL_DB_POOL_PING_AFTER']
+            )
+            metrics.register_pools(db_pools)
+            etl_jobs = JobQueue(JobStore(app.config['ETL_JOB_STORE']), run_etl, workers=app.config['ETL_JOB_WORKERS'])
+            atexit.register(stop_services)
+    if jobs:
+        etl_jobs.start()
+
+def stop_services():
+    """Wait for running ETL jobs, then stop the transform worker processes and close idle pooled connections."""
+    if etl_jobs is not None:
+        etl_jobs.shutdown()
+    if transform_pool is not None:
+        transform_pool.close()
+    if db_pools is not None:
+        db_pools.closeall()
+
+def create_app():
+    """
+    Application factory used by 'flask run' (FLASK_APP='etl_service:create_app()').
+
+    Starts the services before the server starts any threads, then returns the Flask app.
+    """
+    start_services()
+    return app
 
 # Authentication
 @auth.verify_password
@@ -81,17 +193,18 @@ def health_check():
     """
     Perform a health check on the service.
 
-    This function checks the health of the service by attempting to connect to the database
-    using the configuration specified for the role provided in the request arguments. If no
-    role is specified, it defaults to 'analyst'. It returns a JSON response indicating the
-    health status of the service and the database connection status.
+    This function checks the health of the service by checking out a connection from the pool
+    of the role provided in the request arguments and running a trivial query. If no role is
+    specified, it defaults to 'analyst'. It returns a JSON response indicating the health status
+    of the service, the database connection status and the metrics of the role's connection pool.
 
     Returns:
         Response: A Flask JSON response with the health status and HTTP status code.
             - If the health check is successful:
                 {
                     "status": "healthy",
-                    "database": "connected"
+                    "database": "connected",
+                    "pool": {"size": ..., "in_use": ..., "waits": ..., "checkout_ms_avg": ..., ...}
                 }, 200
             - If the health check fails:
                 {
@@ -106,19 +219,33 @@ def health_check():
     """
     try:
         role = request.args.get('role', 'analyst')  # Default to analyst if no role specified
-        db_config = db_role_configs[role]
+        db_pool = db_pools.pool(role)
 
         # Check database connection
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
-        return jsonify({"status": "healthy", "database": "connected"}), 200
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        return jsonify({"status": "healthy", "database": "connected", "pool": db_pool.metrics()}), 200
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({"status": "unhealthy", "database": "disconnected", "error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def service_metrics():
+    """
+    Report the service metrics in the Prometheus text format, for scraping.
+
+    Covers request counts, latency histograms and in-flight gauges per route, pipeline stage durations,
+    row counts and run throughput, and connection pool state, checkout and connect timings per role.
+    See the metrics module for the full list.
+
+    Returns:
+        Response: The metrics text with the Prometheus content type.
+    """
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/test-upload', methods=['POST'])
 def test_upload():
     """
@@ -137,6 +264,100 @@ def test_upload():
         return "No selected file", 400
     return f"File received: {file.filename}", 200
 
+def run_etl(role, file_path, on_chunk=None, content_hash=None):
+    """
+    Run the ETL pipeline over a saved upload using a pooled connection for the given role.
+
+    This is the unit of work executed by ETL jobs, and inline by /etl when the client asks to wait.
+    When the upload's content hash is in the upload ledger, nothing is read or loaded and the earlier
+    load summary is returned with duplicate set to true. Otherwise the upload is recorded in the ledger
+    in the same transaction as its rows. Stage timings, row counts and the run's duration and
+    throughput are recorded in the service metrics.
+
+    Args:
+        role (str): Database role whose connection pool is used for the load.
+        file_path (str): Path to the saved upload.
+        on_chunk (callable, optional): Called with each chunk's stats after it is loaded. It may raise
+            jobs.JobCancelled to abort the job; the load is then rolled back and the exception re-raised.
+        content_hash (str, optional): SHA-256 hex digest of the upload. Without it the ledger is not used.
+
+    Returns:
+        tuple: A response body dict and an HTTP status code.
+            - ({"message": ..., rows_read, invalid_rows, ...}, 200) if the load succeeded.
+            - ({"message": ..., "duplicate": true, "loaded_at": ..., rows_read, ...}, 200) if an identical
+              upload was already loaded.
+            - ({"error": ...}, 400) if the upload does not have exactly the expected columns.
+            - ({"error": ...}, 500) if reading, processing or writing the data failed.
+    """
+    def record_chunk(stats):
+        metrics.record_chunk(stats)
+        if on_chunk is not None:
+            on_chunk(stats)
+
+    started = time.perf_counter()
+    with metrics.track_run():
+        try:
+            body, status = _load_upload(role, file_path, record_chunk, content_hash)
+        except JobCancelled:
+            metrics.record_run('cancelled', time.perf_counter() - started, 0)
+            raise
+    rows_read = 0 if body.get('duplicate') else body.get('rows_read', 0)
+    metrics.record_run(status, time.perf_counter() - started, rows_read)
+    return body, status
+
+def _load_upload(role, file_path, on_chunk, content_hash):
+    """Load a saved upload, or return the earlier result of an identical one. See run_etl."""
+    stage_messages = {
+        'extract': "ETL process failed during file load",
+        'transform': "ETL process failed during data processing",
+        'load': "ETL process failed while writing to database",
+    }
+    try:
+        with db_pools.connection(role) as conn:
+            try:
+                earlier = ledger.find(conn, content_hash) if content_hash else None
+                if earlier is not None:
+                    conn.rollback()
+                    return {
+                        "message": "File already processed; returning the result of the earlier load.",
+                        **earlier['summary'],
+                        "duplicate": True,
+                        "content_hash": content_hash,
+                        "loaded_by": earlier['loaded_by'],
+                        "loaded_at": earlier['loaded_at'],
+                    }, 200
+                summary = pipeline.run(
+                    conn, file_path,
+                    chunk_size=app.config['ETL_CHUNK_SIZE'],
+                    rules=app.config['VALIDATION_RULES'],
+                    load_method=app.config['ETL_LOAD_METHOD'],
+                    batch_size=app.config['ETL_LOAD_BATCH_SIZE'],
+                    on_chunk=on_chunk,
+                    transform_pool=transform_pool,
+                    on_conflict=app.config['ETL_ON_CONFLICT'],
+                    csv_engine=app.config['ETL_CSV_ENGINE']
+                )
+                if content_hash:
+                    ledger.record(conn, content_hash, summary)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    except JobCancelled:
+        raise
+    except pipeline.ColumnMismatchError as e:
+        logger.error(str(e))
+        return {"error": str(e)}, 400
+    except pipeline.StageError as e:
+        logger.error(f"{stage_messages[e.stage]}: {str(e)}")
+        return {"error": str(e)}, 500
+    except Exception as e:
+        logger.error(f"ETL process failed while writing to database: {str(e)}")
+        return {"error": str(e)}, 500
+
+    return {"message": "ETL process completed successfully.", **summary, "duplicate": False,
+            "content_hash": content_hash}, 200
+
 @app.route('/etl', methods=['POST'])
 @auth.login_required
 def etl():
@@ -152,12 +373,29 @@ def etl():
         @app.route('/etl', methods=['POST']): Defines the route and HTTP method for the ETL service.
         @auth.login_required: Ensures that the endpoint is accessible only to authenticated users.
     ETL Process:
-        1. Extract: Receives a file upload (Excel or CSV) and reads it into a pandas DataFrame.
-        2. Transform: Validates the data for required columns, formats, and patterns.
-        3. Load: Inserts the validated data into the PostgreSQL database.
+        The upload is saved and queued as a background job, and the endpoint returns immediately with
+        the job id. Progress and the final result are available from /etl/jobs/<job_id>. Send the form
+        field wait=true to run the job inside the request and get the result in the response instead.
+        1. Extract: Receives a file upload (CSV, Excel, Parquet or Arrow IPC) and reads it in chunks of
+           ETL_CHUNK_SIZE rows.
+           Each chunk is transformed and loaded before the next one is read.
+        2. Transform: Validates the data for required columns, formats, and patterns. Invalid rows are
+           dropped and counted per validation rule.
+        3. Load: Bulk loads the validated data into the PostgreSQL database through a staging table.
+           Rows whose id already exists update that user when a column changed and are skipped otherwise
+           (ETL_ON_CONFLICT=upsert), or are rejected (ETL_ON_CONFLICT=reject). Rows whose email belongs to
+           another user, or that repeat an earlier row in the same upload, are skipped and returned in the
+           response as rejected rows. All chunks load in one transaction.
+        The upload is hashed while it is saved. If identical content was loaded before, the job returns the
+        earlier result without reading the file, marked with duplicate=true.
+    Response:
+        - 202 with {"job_id", "status": "queued", "status_url"} once the job is queued.
+        - With wait=true, a JSON summary with rows read, invalid rows, failures per validation rule,
+          rows loaded, updated and unchanged, rejected rows and per-chunk stats (rows and timings).
     Error Handling:
         - Returns appropriate HTTP status codes and error messages for various failure scenarios such as:
-            - Database authentication failure
+            - Database authentication failure (401)
+            - No pooled database connection freed up within ETL_DB_POOL_TIMEOUT (503)
             - Missing or unsupported file
             - Data validation errors
             - File read errors
@@ -166,11 +404,13 @@ def etl():
         - Logs errors and important events for debugging and monitoring purposes.
     """
     role = request.form.get('role', 'analyst')  # Default to analyst if no role specified
-    db_config = db_role_configs[role]
-    
+    db_pool = db_pools.pool(role)
+
     try:
-        conn = psycopg2.connect(**db_config)
-        conn.close()
+        db_pool.putconn(db_pool.getconn())
+    except PoolTimeoutError as e:
+        logger.error(f"No database connection available: {str(e)}")
+        return f"No database connection available, try again later: {str(e)}", 503
     except Exception as e:
         logger.error(f"Database authentication failed: {str(e)}")
         return f"Database authentication failed: {str(e)}", 401
@@ -182,123 +422,191 @@ def etl():
     if file.filename == '':
         return "No selected file.", 400
 
-    if not (file.filename.endswith('.xlsx') or file.filename.endswith('.csv')):
-        return "Unsupported file type. Please upload an Excel or CSV file.", 400
+    if not file.filename.endswith(pipeline.UPLOAD_FORMATS):
+        return "Unsupported file type. Please upload a CSV, Excel, Parquet or Arrow file.", 400
 
+    # Uploads are prefixed with the job id so concurrent jobs with the same file name do not collide.
+    job_id = uuid.uuid4().hex
     filename = secure_filename(file.filename)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
+    content_hash = ledger.save_upload(file, file_path)
+
+    if request.form.get('wait', '').lower() == 'true':
+        try:
+            body, status = run_etl(role, file_path, content_hash=content_hash)
+        finally:
+            os.remove(file_path)
+        return jsonify(body), status
+
+    etl_jobs.submit(role, filename, file_path, job_id=job_id, content_hash=content_hash)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for('etl_job_status', job_id=job_id)
+    }), 202
+
+@app.route('/etl/jobs', methods=['GET'])
+@auth.login_required
+def etl_jobs_list():
+    """
+    Lists the most recent ETL jobs, newest first.
 
-    try:
-        df = pd.read_excel(file_path) if file.filename.endswith('.xlsx') else pd.read_csv(file_path)
-    except Exception as e:
-        logger.error(f"ETL process failed during file load: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    The number of jobs returned is taken from the 'limit' request argument, defaulting to 50.
 
-    try:
-        expected_columns = {'id', 'first_name', 'last_name', 'email', 'gender', 'ip_address'}
-        actual_columns = set(df.columns)
-
-        if actual_columns != expected_columns:
-            missing_columns = expected_columns - actual_columns
-            extra_columns = actual_columns - expected_columns
-            error_message = f"Data validation error. Missing columns: {missing_columns}. Extra columns: {extra_columns}."
-            logger.error(error_message)
-            return jsonify({"error": error_message}), 400
-
-        df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        df['email'] = df['email'].str.lower()
-
-        valid_email_pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
-        valid_ip_pattern = r'^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$'
-        valid_name_pattern = r'^[A-Za-z]+$'
-
-        invalid_rows = []
-        for index, row in df.iterrows():
-            valid_row = True
-            if not re.match(valid_email_pattern, row['email']):
-                logger.error(f"Row ID {row['id']}: Invalid email format")
-                valid_row = False
-            if not re.match(valid_ip_pattern, row['ip_address']):
-                logger.error(f"Row ID {row['id']}: Invalid IP address format")
-                valid_row = False
-            if not re.match(valid_name_pattern, row['first_name']):
-                logger.error(f"Row ID {row['id']}: Invalid first name format")
-                valid_row = False
-            if not re.match(valid_name_pattern, row['last_name']):
-                logger.error(f"Row ID {row['id']}: Invalid last name format")
-                valid_row = False
-
-            if not valid_row:
-                invalid_rows.append(index)
-
-        df.drop(index=invalid_rows, inplace=True)
+    Returns:
+        tuple: A JSON list of jobs (state, progress counters and timings, without results) and a 200 status code.
+    """
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(etl_jobs.store.list(limit=limit)), 200
 
-    except Exception as e:
-        logger.error(f"ETL process failed during data processing: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+@app.route('/etl/jobs/<job_id>', methods=['GET'])
+@auth.login_required
+def etl_job_status(job_id):
+    """
+    Reports the state of an ETL job.
 
-    try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
+    Returns:
+        tuple: A JSON response and an HTTP status code.
+            - (job, 200) with the job's status (queued, running, succeeded, failed or cancelled), rows read,
+              invalid, loaded and rejected so far, chunks processed, created/started/finished timestamps,
+              queue and run times, and the final result (the /etl response body) once finished.
+            - ({"error": "Job not found."}, 404) if there is no such job.
+    """
+    job = etl_jobs.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job), 200
 
-        for _, row in df.iterrows():
-            cursor.execute(
-                "INSERT INTO users (id, first_name, last_name, email, gender, ip_address) VALUES (%s, %s, %s, %s, %s, %s)",
-                tuple(row)
-            )
-        conn.commit()
-        cursor.close()
-        conn.close()
+@app.route('/etl/jobs/<job_id>/cancel', methods=['POST'])
+@auth.login_required
+def etl_job_cancel(job_id):
+    """
+    Cancels an ETL job.
 
-        return "ETL process completed successfully.", 200
+    Queued jobs are cancelled immediately. Running jobs stop after their current chunk and their load is
+    rolled back, so nothing from a cancelled job is written to the database.
 
-    except Exception as e:
-        logger.error(f"ETL process failed while writing to database: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    Returns:
+        tuple: A JSON response and an HTTP status code.
+            - ({"job_id": ..., "status": ...}, 202) if cancellation was accepted.
+            - ({"error": "Job not found."}, 404) if there is no such job.
+            - ({"error": ..., "status": ...}, 409) if the job has already finished.
+    """
+    job = etl_jobs.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    if not etl_jobs.store.cancel(job_id):
+        job = etl_jobs.store.get(job_id)
+        return jsonify({"error": "Job has already finished.", "status": job['status']}), 409
+    return jsonify({"job_id": job_id, "status": etl_jobs.store.get(job_id)['status']}), 202
 
 @app.route('/display-rows', methods=['GET'])
 @auth.login_required
 def display_rows():
     """
-    Fetches and displays rows from the database based on the user's role.
-    This function connects to a PostgreSQL database using role-specific configurations,
-    executes a query to fetch rows from either the 'masked_users' or 'users' table,
-    and returns the results as a JSON response.
+    Fetches rows from the database based on the user's role, a page at a time or as a streaming export.
     The role is determined from the request arguments, defaulting to 'analyst' if not specified.
-    - 'analyst': Fetches rows from the 'masked_users' table.
+    - 'analyst': Fetches rows from the 'masked_users' view.
     - 'manager' or 'admin': Fetches rows from the 'users' table.
+    Rows are ordered by id and paged with keyset pagination: pass the last id of a page as 'after' to get
+    the next one. Request arguments:
+        columns: Comma separated columns to return (default: all). The id column is always included.
+        gender, last_name, email: Return only rows with exactly this value.
+        after: Return only rows whose id sorts after this one.
+        limit: Rows per page, up to ETL_DISPLAY_MAX_LIMIT (default: 5). For exports, the maximum number of
+               rows to stream (default: all).
+        format: 'json' (default) for one page, or 'ndjson' or 'csv' to stream every matching row. Exports
+                read through a server-side cursor ETL_EXPORT_ITERSIZE rows at a time, in constant memory.
     Returns:
-        tuple: A JSON response containing the fetched rows and an HTTP status code.
-               On success, returns a list of dictionaries representing the rows and a 200 status code.
-               On failure, returns an error message and a 500 status code.
-    Raises:
-        Exception: If any error occurs during database connection, query execution, or data fetching.
+        tuple: A response and an HTTP status code.
+               - format=json: A list of dictionaries representing the rows and a 200 status code. When the
+                 page is full, the X-Next-After header holds the cursor of the next page and the Link
+                 header its URL.
+               - format=ndjson or csv: The matching rows streamed as newline-delimited JSON or CSV with a
+                 header row, and a 200 status code.
+               - An error message and a 400 status code for invalid columns, filters, limits or formats.
+               - An error message and a 500 status code if the query failed.
     Logs:
-        Logs an error message if any exception is raised during the process.
+        Logs an error message if any exception is raised while querying the database.
     """
+    role = request.args.get('role', 'analyst')  # Default to analyst if no role specified
+    table = 'masked_users' if role == 'analyst' else 'users'
+    export_format = request.args.get('format', 'json')
     try:
-        role = request.args.get('role', 'analyst')  # Default to analyst if no role specified
-        db_config = db_role_configs[role]
-        
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        
-        if role == 'analyst':
-            cursor.execute("SELECT * FROM masked_users LIMIT 5")
-        elif role in ['manager', 'admin']:
-            cursor.execute("SELECT * FROM users LIMIT 5")
-        
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return jsonify([dict(zip(columns, row)) for row in rows]), 200
+        if export_format != 'json' and export_format not in queries.EXPORT_FORMATS:
+            raise queries.QueryError(f"Unsupported format: {export_format}. Use json, ndjson or csv.")
+        columns = queries.parse_columns(request.args.get('columns'))
+        filters = {column: request.args[column] for column in queries.FILTER_COLUMNS if column in request.args}
+        if export_format == 'json':
+            limit = queries.parse_limit(request.args.get('limit'), 5, maximum=app.config['ETL_DISPLAY_MAX_LIMIT'])
+        else:
+            limit = queries.parse_limit(request.args.get('limit'), None)
+        query, params, selected = queries.build_select(
+            table, columns, filters, after=request.args.get('after'), limit=limit
+        )
+    except queries.QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if export_format != 'json':
+        return export_rows(role, export_format, query, params, selected)
+
+    try:
+        with db_pools.connection(role) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+    except Exception as e:
+        logger.error(f"Display Rows Failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    response = jsonify([dict(zip(selected, row)) for row in rows])
+    if len(rows) == limit:
+        next_after = rows[-1][selected.index('id')]
+        response.headers['X-Next-After'] = next_after
+        next_url = url_for('display_rows', **{**request.args.to_dict(), 'after': next_after})
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response, 200
+
+def export_rows(role, export_format, query, params, columns):
+    """
+    Streams the rows of a query as NDJSON or CSV.
+
+    The pooled connection is held for the duration of the response and returned to the pool when the
+    response is closed, including when the client disconnects part way through.
+
+    Returns:
+        tuple: A streaming response and a 200 status code, or an error message and a 500 status code if
+               the query could not be started.
+    """
+    try:
+        db_pool = db_pools.pool(role)
+        conn = db_pool.getconn()
+    except Exception as e:
+        logger.error(f"Display Rows Failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    batches = queries.iter_batches(conn, query, params, itersize=app.config['ETL_EXPORT_ITERSIZE'])
+    try:
+        # Start the query before the response begins, so errors can still be reported with a status code
+        first = next(batches, None)
     except Exception as e:
         logger.error(f"Display Rows Failed: {str(e)}")
+        db_pool.putconn(conn)
         return jsonify({"error": str(e)}), 500
 
+    def release():
+        try:
+            batches.close()
+        finally:
+            db_pool.putconn(conn)
+
+    rows = itertools.chain([first] if first else [], batches)
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = Response(queries.format_batches(export_format, columns, rows), mimetype=mimetype)
+    response.call_on_close(release)
+    return response, 200
+
 @app.route('/delete-all', methods=['DELETE'])
 @auth.login_required
 def delete_all():
@@ -313,6 +621,8 @@ def delete_all():
         tuple: A message indicating the result of the operation and an HTTP status code.
             - ("All data deleted successfully.", 200) if the operation is successful.
             - ("Database authentication failed: {error_message}", 401) if database authentication fails.
+            - ("No database connection available, try again later: {error_message}", 503) if the role's
+              connection pool stayed exhausted for ETL_DB_POOL_TIMEOUT seconds.
             - ("Failed to delete data: {error_message}", 500) if the deletion operation fails.
 
     Raises:
@@ -320,8 +630,11 @@ def delete_all():
     """
     try:
         role = request.form.get('role', 'analyst')  # Default to analyst if no role specified
-        db_config = db_role_configs[role]
-        conn = psycopg2.connect(**db_config)
+        db_pool = db_pools.pool(role)
+        conn = db_pool.getconn()
+    except PoolTimeoutError as e:
+        logger.error(f"No database connection available: {str(e)}")
+        return f"No database connection available, try again later: {str(e)}", 503
     except Exception as e:
         logger.error(f"Database authentication failed: {str(e)}")
         return f"Database authentication failed: {str(e)}", 401
@@ -330,11 +643,12 @@ def delete_all():
         cursor.execute("DELETE FROM users")
         conn.commit()
         cursor.close()
-        conn.close()
         return "All data deleted successfully.", 200
     except Exception as e:
         logger.error(f"Failed to delete data: {str(e)}")
         return f"Failed to delete data: {str(e)}", 500
+    finally:
+        db_pool.putconn(conn)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+ETL Jobs
+This module runs ETL uploads as background jobs so the /etl endpoint can return as soon as the upload is saved.
+Jobs are recorded in a local SQLite database and executed by a pool of worker threads. Job state, progress,
+timings and the final result are kept in the store, so they survive a service restart: jobs that were queued
+or running when the service stopped are queued again when it starts. Because a job's load runs in a single
+database transaction, an interrupted job left nothing behind and is safe to run again.
+Every job records the process that owns it (hostname and pid): the one that queued it, or the one that
+recovered it. Recovery only takes over jobs whose owner process has exited, so several processes can share a
+store without resetting or re-running each other's jobs.
+Job States:
+    queued: Waiting for a worker.
+    running: Being processed. Progress is updated after every chunk.
+    succeeded: Finished; the result holds the load summary.
+    failed: Finished with an error; the result holds the error response.
+    cancelled: Cancelled before or while running. A running job is rolled back at the next chunk boundary.
+Classes:
+    JobCancelled: Raised inside a running job when cancellation was requested.
+    JobStore: SQLite-backed job records.
+    JobQueue: Worker pool that executes queued jobs.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        role TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        content_hash TEXT,
+        owner TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        chunks INTEGER NOT NULL DEFAULT 0,
+        rows_read INTEGER NOT NULL DEFAULT 0,
+        invalid_rows INTEGER NOT NULL DEFAULT 0,
+        rows_loaded INTEGER NOT NULL DEFAULT 0,
+        rejected_rows INTEGER NOT NULL DEFAULT 0,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        http_status INTEGER,
+        result TEXT,
+        error TEXT
+    )
+"""
+
+
+def _process_owner():
+    """Identify this process as a job owner."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """
+    Return True if the process that owns a job may still be running.
+
+    Owners on other hosts cannot be checked and are assumed to be alive. Recovery runs before this process
+    queues any job, so jobs owned by its own pid were left by an earlier process that had the same pid, for
+    example before a container restart. Jobs recorded before owners were have none, and are recoverable.
+    """
+    if not owner:
+        return False
+    hostname, _, pid = owner.rpartition(':')
+    if hostname != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # The process exists but belongs to another user
+    return True
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when cancellation has been requested."""
+
+
+class JobStore:
+    """
+    Job records in a local SQLite database.
+
+    Every call opens its own short-lived SQLite connection, so the store can be shared by request
+    handlers and worker threads.
+
+    Args:
+        path (str): Path of the SQLite database file. Created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+            # Stores created before uploads were hashed, or before jobs had owners, lack those columns.
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column in ('content_hash', 'owner'):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _write(self, statement, params):
+        with self._lock, self._connect() as db:
+            return db.execute(statement, params).rowcount
+
+    def create(self, role, filename, file_path, job_id=None, content_hash=None):
+        """Record a new queued job, owned by this process, and return its id."""
+        job_id = job_id or uuid.uuid4().hex
+        self._write(
+            "INSERT INTO jobs (id, status, role, filename, file_path, content_hash, owner, created_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, role, filename, file_path, content_hash, _process_owner(), time.time())
+        )
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return a job as a dict, or None if it does not exist.
+
+        The dict has the job's state, progress counters, created/started/finished timestamps, the derived
+        queue_seconds and run_seconds timings, and the final result once the job has finished.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._as_dict(row) if row else None
+
+    def list(self, limit=50):
+        """Return the most recently created jobs, newest first, without their results."""
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        jobs = [self._as_dict(row) for row in rows]
+        for job in jobs:
+            job.pop('result')
+        return jobs
+
+    def _as_dict(self, row):
+        job = dict(row)
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        now = time.time()
+        job['queue_seconds'] = round((job['started_at'] or job['finished_at'] or now) - job['created_at'], 3)
+        job['run_seconds'] = round((job['finished_at'] or now) - job['started_at'], 3) if job['started_at'] else None
+        del job['file_path']
+        return job
+
+    def file_path(self, job_id):
+        """Return the saved upload path of a job."""
+        with self._connect() as db:
+            row = db.execute("SELECT file_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['file_path'] if row else None
+
+    def start(self, job_id):
+        """Mark a queued job as running. Returns False if the job is no longer queued (e.g. cancelled)."""
+        return self._write(
+            "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ) == 1
+
+    def record_chunk(self, job_id, stats):
+        """Add one chunk's counters to a running job's progress."""
+        self._write(
+            "UPDATE jobs SET chunks = chunks + 1, rows_read = rows_read + ?, invalid_rows = invalid_rows + ?, "
+            "rows_loaded = rows_loaded + ?, rejected_rows = rejected_rows + ? WHERE id = ?",
+            (stats['rows_read'], stats['invalid_rows'], stats['rows_loaded'], stats['rejected_rows'], job_id)
+        )
+
+    def finish(self, job_id, status, http_status=None, result=None, error=None):
+        """
+        Mark a job as finished with the given final status, HTTP status and result.
+
+        Failed and cancelled jobs were rolled back, so their rows_loaded count is reset to 0.
+        """
+        self._write(
+            "UPDATE jobs SET status = ?, finished_at = ?, http_status = ?, result = ?, error = ?, "
+            "rows_loaded = CASE WHEN ? = 'succeeded' THEN rows_loaded ELSE 0 END WHERE id = ?",
+            (status, time.time(), http_status, json.dumps(result) if result is not None else None, error,
+             status, job_id)
+        )
+
+    def cancel(self, job_id):
+        """
+        Request cancellation of a job.
+
+        Queued jobs are cancelled immediately; running jobs are flagged and stop at the next chunk boundary.
+
+        Returns:
+            bool: False if the job does not exist or has already finished.
+        """
+        if self._write(
+            "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ):
+            return True
+        return self._write(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+        ) == 1
+
+    def cancel_requested(self, job_id):
+        """Return True if cancellation of the job has been requested."""
+        with self._connect() as db:
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def recover(self):
+        """
+        Take over the unfinished jobs of exited processes and return their ids, oldest first.
+
+        Queued and running jobs whose owner process has exited are given to this process; running ones are
+        queued again with their progress counters reset, since their transaction was never committed.
+        Jobs owned by processes that are still running are left alone.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        owner = _process_owner()
+        recovered = []
+        for row in rows:
+            if _owner_alive(row['owner']):
+                continue
+            # Conditional on the owner read above, so two processes recovering at once cannot both claim a job
+            claimed = self._write(
+                "UPDATE jobs SET status = 'queued', owner = ?, started_at = NULL, chunks = 0, rows_read = 0, "
+                "invalid_rows = 0, rows_loaded = 0, rejected_rows = 0 "
+                "WHERE id = ? AND status IN ('queued', 'running') AND owner IS ?",
+                (owner, row['id'], row['owner'])
+            )
+            if claimed:
+                recovered.append(row['id'])
+        return recovered
+
+
+class JobQueue:
+    """
+    Runs queued jobs on a pool of worker threads.
+
+    Args:
+        store (JobStore): Where job records are kept.
+        handler (callable): Called as handler(role, file_path, on_chunk, content_hash) to process a job.
+            It returns a (response body dict, HTTP status) tuple and must let JobCancelled propagate.
+        workers (int): Number of jobs processed concurrently.
+    """
+
+    def __init__(self, store, handler, workers=2):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker pool and queue the jobs left queued or running by processes that have exited."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='etl-job')
+        for job_id in self.store.recover():
+            self._executor.submit(self._run, job_id)
+
+    def submit(self, role, filename, file_path, job_id=None, content_hash=None):
+        """Record and queue a job for a saved upload. Returns the job id."""
+        self.start()
+        job_id = self.store.create(role, filename, file_path, job_id=job_id, content_hash=content_hash)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id):
+        file_path = self.store.file_path(job_id)
+        if not self.store.start(job_id):
+            self._remove_upload(file_path)
+            return
+        job = self.store.get(job_id)
+
+        def on_chunk(stats):
+            self.store.record_chunk(job_id, stats)
+            if self.store.cancel_requested(job_id):
+                raise JobCancelled()
+
+        try:
+            if self.store.cancel_requested(job_id):
+                raise JobCancelled()
+            body, http_status = self.handler(job['role'], file_path, on_chunk, job['content_hash'])
+            status = 'succeeded' if http_status == 200 else 'failed'
+            self.store.finish(job_id, status, http_status=http_status, result=body, error=body.get('error'))
+        except JobCancelled:
+            self.store.finish(job_id, 'cancelled')
+        except Exception as e:
+            logger.error(f"ETL job {job_id} failed: {str(e)}")
+            self.store.finish(job_id, 'failed', http_status=500, error=str(e))
+        finally:
+            self._remove_upload(file_path)
+
+    def _remove_upload(self, file_path):
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
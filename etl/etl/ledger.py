@@ -0,0 +1,80 @@
+"""
+Upload Ledger
+This module records which uploads have already been loaded, so an identical re-upload is answered with the
+earlier result instead of running extract, transform and load again.
+Uploads are identified by the SHA-256 hash of their content, computed while the upload is saved. A loaded
+upload is recorded in the 'etl_uploads' table in the same transaction as its rows, so the ledger never
+lists an upload whose load was rolled back. Deleting rows from 'users' clears the ledger (see
+scripts/init.sql), since earlier results no longer describe what is in the table.
+Functions:
+    save_upload(file, path): Saves an uploaded file and returns the SHA-256 hex digest of its content.
+    find(conn, content_hash): Locks an upload's hash for the transaction and returns its earlier result, if any.
+    record(conn, content_hash, summary): Records a loaded upload and its load summary.
+Usage:
+    Call find and record in the load's transaction. find holds a transaction-scoped advisory lock on the
+    hash, so concurrent loads of the same content run one at a time and all but the first find the
+    recorded result.
+"""
+import hashlib
+from psycopg2.extras import Json
+
+BLOCK_SIZE = 1 << 20
+
+
+def save_upload(file, path):
+    """
+    Save an uploaded file, hashing it block by block as it is written.
+
+    Args:
+        file (werkzeug.datastructures.FileStorage): The uploaded file.
+        path (str): Where to save it.
+
+    Returns:
+        str: The SHA-256 hex digest of the file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for block in iter(lambda: file.stream.read(BLOCK_SIZE), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+def find(conn, content_hash):
+    """
+    Lock an upload's content hash until the end of the transaction and return its earlier load, if any.
+
+    Args:
+        conn: An open psycopg2 connection, in the transaction that will load the upload.
+        content_hash (str): SHA-256 hex digest of the upload.
+
+    Returns:
+        dict: None if the content has not been loaded, otherwise the earlier load with the keys
+              'summary' (the load summary), 'loaded_by' (database role) and 'loaded_at' (ISO 8601 timestamp).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", (content_hash,))
+        cursor.execute(
+            "SELECT summary, loaded_by, loaded_at FROM etl_uploads WHERE content_hash = %s", (content_hash,)
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    summary, loaded_by, loaded_at = row
+    return {'summary': summary, 'loaded_by': loaded_by, 'loaded_at': loaded_at.isoformat()}
+
+
+def record(conn, content_hash, summary):
+    """
+    Record a loaded upload. The caller commits it together with the load.
+
+    Args:
+        conn: An open psycopg2 connection, in the transaction that loaded the upload.
+        content_hash (str): SHA-256 hex digest of the upload.
+        summary (dict): The load summary returned by pipeline.run.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO etl_uploads (content_hash, rows_read, rows_loaded, summary) VALUES (%s, %s, %s, %s)",
+            (content_hash, summary['rows_read'], summary['rows_loaded'], Json(summary))
+        )
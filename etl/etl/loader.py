@@ -0,0 +1,238 @@
+"""
+Bulk Loader
+This module loads validated user rows into PostgreSQL in bulk instead of issuing one INSERT per row.
+Rows are first streamed into a temporary staging table, either with COPY FROM STDIN or with batched
+execute_values, and then moved into the 'users' table with a single INSERT ... SELECT. Rows that would
+violate the primary key on 'id' or the unique constraint on 'email' are flagged in the staging table
+and reported back instead of aborting the whole transaction.
+An upload counts as every bulk_load call in one transaction: the ids and emails of the rows accepted so far
+are kept in a second temporary table, users_upload_keys, that lives until the transaction ends, so a row
+repeating an id or email of an earlier chunk is rejected exactly as if both rows were in the same chunk.
+Conflict Modes:
+    reject: Rows whose id or email already exists in 'users' are rejected.
+    upsert: Rows whose id already exists update that user with INSERT ... ON CONFLICT (id) DO UPDATE, and
+            only when a column differs, so re-loading rows that are already present writes nothing. Rows
+            whose email belongs to a different user are still rejected.
+Functions:
+    bulk_load(conn, df, method, batch_size, on_conflict): Loads a DataFrame into the users table and returns
+        a load report.
+Usage:
+    The caller owns the connection and is responsible for committing or rolling back after bulk_load returns.
+    bulk_load can be called several times in one transaction, e.g. once per chunk of a streamed upload; the
+    in-upload duplicate checks then cover all of its calls.
+"""
+import io
+import logging
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+LOAD_COLUMNS = ('id', 'first_name', 'last_name', 'email', 'gender', 'ip_address')
+LOAD_METHODS = ('copy', 'values')
+CONFLICT_MODES = ('reject', 'upsert')
+
+_COLUMN_LIST = ', '.join(LOAD_COLUMNS)
+_UPDATE_COLUMNS = [column for column in LOAD_COLUMNS if column != 'id']
+
+_CREATE_STAGING = f"""
+    CREATE TEMP TABLE users_staging (
+        row_num BIGINT,
+        {', '.join(f'{column} TEXT' for column in LOAD_COLUMNS)},
+        reject_reason TEXT
+    ) ON COMMIT DROP
+"""
+
+# Ids and emails of the rows accepted by earlier bulk_load calls in this transaction
+_CREATE_UPLOAD_KEYS = """
+    CREATE TEMP TABLE IF NOT EXISTS users_upload_keys (
+        id TEXT PRIMARY KEY,
+        email TEXT UNIQUE
+    ) ON COMMIT DROP
+"""
+
+_RECORD_UPLOAD_KEYS = """
+    INSERT INTO users_upload_keys (id, email)
+    SELECT id, lower(email) FROM users_staging WHERE reject_reason IS NULL
+"""
+
+# Each check only looks at rows that have not been rejected yet, so a row is reported once with the
+# first reason that applies, and in-upload duplicates are judged against rows that will actually load.
+_REJECT_CHECKS = (
+    ('missing id', """
+        UPDATE users_staging SET reject_reason = %s
+        WHERE id IS NULL AND reject_reason IS NULL
+    """),
+    # Rows repeating one accepted in an earlier chunk, checked before 'users', where that row now is
+    ('duplicate id in upload', """
+        UPDATE users_staging s SET reject_reason = %s
+        WHERE s.reject_reason IS NULL AND EXISTS (SELECT 1 FROM users_upload_keys k WHERE k.id = s.id)
+    """),
+    ('duplicate email in upload', """
+        UPDATE users_staging s SET reject_reason = %s
+        WHERE s.reject_reason IS NULL
+          AND EXISTS (SELECT 1 FROM users_upload_keys k WHERE k.email = lower(s.email))
+    """),
+    # Correlated EXISTS probes use the users indexes per staged row instead of scanning the whole table,
+    # which keeps the cost proportional to the upload rather than to the size of users.
+    ('id already exists', """
+        UPDATE users_staging s SET reject_reason = CASE
+            WHEN EXISTS (SELECT 1 FROM users u WHERE u.id = s.id) THEN %s
+            ELSE 'email already exists'
+        END
+        WHERE s.reject_reason IS NULL
+          AND (EXISTS (SELECT 1 FROM users u WHERE u.id = s.id)
+               OR EXISTS (SELECT 1 FROM users u WHERE u.email = s.email))
+    """),
+    ('duplicate id in upload', """
+        UPDATE users_staging s SET reject_reason = %s
+        FROM (
+            SELECT row_num, row_number() OVER (PARTITION BY id ORDER BY row_num) AS n
+            FROM users_staging
+            WHERE reject_reason IS NULL
+        ) d
+        WHERE d.row_num = s.row_num AND d.n > 1
+    """),
+    ('duplicate email in upload', """
+        UPDATE users_staging s SET reject_reason = %s
+        FROM (
+            SELECT row_num, row_number() OVER (PARTITION BY lower(email) ORDER BY row_num) AS n
+            FROM users_staging
+            WHERE reject_reason IS NULL AND email IS NOT NULL
+        ) d
+        WHERE d.row_num = s.row_num AND d.n > 1
+    """),
+)
+
+
+# In upsert mode an existing id is not a conflict; only an email held by a different user is.
+_UPSERT_REJECT_CHECKS = (
+    *_REJECT_CHECKS[:3],
+    ('email already exists', """
+        UPDATE users_staging s SET reject_reason = %s
+        WHERE s.reject_reason IS NULL
+          AND EXISTS (SELECT 1 FROM users u WHERE u.email = s.email AND u.id <> s.id)
+    """),
+    *_REJECT_CHECKS[4:],
+)
+
+_INSERT = f"""
+    INSERT INTO users ({_COLUMN_LIST})
+    SELECT {_COLUMN_LIST} FROM users_staging WHERE reject_reason IS NULL ORDER BY row_num
+"""
+
+_UPDATE_LIST = ', '.join(_UPDATE_COLUMNS)
+_STORED_VALUES = ', '.join(f'users.{column}' for column in _UPDATE_COLUMNS)
+_NEW_VALUES = ', '.join(f'EXCLUDED.{column}' for column in _UPDATE_COLUMNS)
+
+# The WHERE clause skips rows identical to the stored ones, so they are neither written nor counted.
+_UPSERT = _INSERT + f"""
+    ON CONFLICT (id) DO UPDATE SET ({_UPDATE_LIST}) = ({_NEW_VALUES})
+    WHERE ({_STORED_VALUES}) IS DISTINCT FROM ({_NEW_VALUES})
+"""
+
+_COUNT_EXISTING = """
+    SELECT count(*) FROM users_staging s
+    WHERE s.reject_reason IS NULL AND EXISTS (SELECT 1 FROM users u WHERE u.id = s.id)
+"""
+
+
+def _copy_to_staging(cursor, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, columns=LOAD_COLUMNS, header=False, index=True)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY users_staging (row_num, {_COLUMN_LIST}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def _values_to_staging(cursor, df, batch_size):
+    frame = df[list(LOAD_COLUMNS)].astype(object)
+    frame = frame.where(frame.notna(), None)
+    execute_values(
+        cursor,
+        f"INSERT INTO users_staging (row_num, {_COLUMN_LIST}) VALUES %s",
+        ((int(index), *values) for index, *values in frame.itertuples(name=None)),
+        page_size=batch_size
+    )
+
+
+def bulk_load(conn, df, method='copy', batch_size=10000, on_conflict='reject'):
+    """
+    Load validated rows into the users table through a staging table.
+
+    The DataFrame index is used as the row number in the reject report, so callers that drop invalid
+    rows without resetting the index get row numbers that point back into the uploaded file.
+    Rows repeating the id or email of a row accepted by an earlier call in the same transaction are rejected
+    as duplicates in the upload.
+
+    Args:
+        conn: An open psycopg2 connection. The caller commits or rolls back.
+        df (pandas.DataFrame): Validated rows containing the columns in LOAD_COLUMNS.
+        method (str): 'copy' to stream rows with COPY FROM STDIN, or 'values' to use batched execute_values.
+        batch_size (int): Rows per statement when method is 'values'.
+        on_conflict (str): 'reject' to reject rows whose id already exists, or 'upsert' to update them.
+
+    Returns:
+        dict: A load report with the following keys:
+            - rows_loaded (int): Number of rows inserted into the users table.
+            - rows_updated (int): Number of existing users changed by the upload (upsert mode only).
+            - rows_unchanged (int): Number of rows identical to an existing user and skipped (upsert mode only).
+            - rejected_rows (list): One dict per rejected row with 'row', 'id', 'email' and 'reason'.
+
+    Raises:
+        ValueError: If method is not one of LOAD_METHODS or on_conflict is not one of CONFLICT_MODES.
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Unsupported load method '{method}'. Expected one of {LOAD_METHODS}.")
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"Unsupported conflict mode '{on_conflict}'. Expected one of {CONFLICT_MODES}.")
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_CREATE_UPLOAD_KEYS)
+        cursor.execute(_CREATE_STAGING)
+        if method == 'copy':
+            _copy_to_staging(cursor, df)
+        else:
+            _values_to_staging(cursor, df, batch_size)
+
+        checks = _UPSERT_REJECT_CHECKS if on_conflict == 'upsert' else _REJECT_CHECKS
+        for reason, statement in checks:
+            cursor.execute(statement, (reason,))
+
+        existing = 0
+        if on_conflict == 'upsert':
+            cursor.execute(_COUNT_EXISTING)
+            existing = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM users_staging WHERE reject_reason IS NULL")
+            staged = cursor.fetchone()[0]
+            cursor.execute(_UPSERT)
+            rows_loaded = staged - existing
+            rows_updated = cursor.rowcount - rows_loaded
+        else:
+            cursor.execute(_INSERT)
+            rows_loaded = cursor.rowcount
+            rows_updated = 0
+
+        cursor.execute(_RECORD_UPLOAD_KEYS)
+        cursor.execute(
+            "SELECT row_num, id, email, reject_reason FROM users_staging "
+            "WHERE reject_reason IS NOT NULL ORDER BY row_num"
+        )
+        rejected_rows = [
+            {'row': row_num, 'id': row_id, 'email': email, 'reason': reason}
+            for row_num, row_id, email, reason in cursor.fetchall()
+        ]
+        cursor.execute("DROP TABLE users_staging")
+    finally:
+        cursor.close()
+
+    if rejected_rows:
+        logger.error(f"{len(rejected_rows)} rows rejected during load")
+    return {
+        'rows_loaded': rows_loaded,
+        'rows_updated': rows_updated,
+        'rows_unchanged': existing - rows_updated,
+        'rejected_rows': rejected_rows,
+    }
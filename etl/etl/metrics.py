@@ -0,0 +1,200 @@
+"""
+Service Metrics
+This module collects performance metrics for the ETL service and renders them in the Prometheus text format.
+Request, stage and row metrics are prometheus_client counters, gauges and histograms updated as work happens;
+recording an observation takes a lock and a few additions, so the instrumentation stays on in production.
+Connection pool metrics are read from the pools' own counters when the metrics are scraped.
+Metrics:
+    etl_http_requests_total{method, route, status}: Requests handled.
+    etl_http_request_duration_seconds{method, route}: Request latency, up to the response being returned.
+        Streamed responses (/display-rows exports) are timed to the start of the stream.
+    etl_http_requests_in_flight{route}: Requests being handled.
+    etl_stage_duration_seconds{stage}: Time per chunk spent in the extract, transform and load stages.
+    etl_rows_total{outcome}: Rows read, invalid, loaded, updated, unchanged and rejected.
+    etl_runs_in_progress: ETL runs (jobs or wait=true requests) being processed.
+    etl_run_duration_seconds{status}: Duration of ETL runs, by HTTP status of their result.
+    etl_run_rows_per_second: Rows read per second by the last completed run.
+    etl_db_pool_connections{role, state}: Pooled connections in use and idle.
+    etl_db_pool_checkouts_total, etl_db_pool_waits_total, etl_db_pool_timeouts_total,
+        etl_db_pool_recycled_total{role}: Pool counters.
+    etl_db_checkout_duration_seconds{role}: Time to check out a pooled connection, including waits.
+    etl_db_connect_duration_seconds{role}: Time to open a new database connection.
+Profiling:
+    When a profile directory is configured, a request sent with the header 'X-Profile: true' runs under
+    cProfile. The profile is written to the directory as a .prof file, for pstats or snakeviz, and its file
+    name is returned in the 'X-Profile-File' response header. Only the request thread is profiled; send
+    wait=true to /etl to profile an ETL run.
+Functions:
+    instrument(app, profile_dir): Installs the request hooks on a Flask app.
+    register_pools(pools): Exports the metrics of a db.PoolManager.
+    record_chunk(stats): Records the stage timings and row counts of one pipeline chunk.
+    track_run(): Context manager that counts and times one ETL run.
+    record_run(status, seconds, rows_read): Records a finished ETL run.
+    render(): Returns the metrics text and its content type.
+"""
+import os
+import time
+import uuid
+import cProfile
+from contextlib import contextmanager
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily, SummaryMetricFamily
+from db import CHECKOUT_BUCKETS
+
+PROFILE_HEADER = 'X-Profile'
+
+# Creation timestamps add a series per labelled metric and nothing here uses them.
+disable_created_metrics()
+
+REQUESTS = Counter('etl_http_requests_total', 'HTTP requests handled.', ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('etl_http_request_duration_seconds', 'HTTP request latency.', ['method', 'route'])
+IN_FLIGHT = Gauge('etl_http_requests_in_flight', 'HTTP requests being handled.', ['route'])
+STAGE_LATENCY = Histogram(
+    'etl_stage_duration_seconds', 'Time per chunk spent in each pipeline stage.', ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+ROWS = Counter('etl_rows', 'Rows processed by the pipeline, by outcome.', ['outcome'])
+RUNS_IN_PROGRESS = Gauge('etl_runs_in_progress', 'ETL runs being processed.')
+RUN_LATENCY = Histogram(
+    'etl_run_duration_seconds', 'Duration of ETL runs.', ['status'],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+)
+RUN_THROUGHPUT = Gauge('etl_run_rows_per_second', 'Rows read per second by the last completed ETL run.')
+
+# Chunk stats keys reported under etl_rows_total
+_ROW_OUTCOMES = {
+    'rows_read': 'read',
+    'invalid_rows': 'invalid',
+    'rows_loaded': 'loaded',
+    'rows_updated': 'updated',
+    'rows_unchanged': 'unchanged',
+    'rejected_rows': 'rejected',
+}
+_STAGES = {'read_seconds': 'extract', 'transform_seconds': 'transform', 'load_seconds': 'load'}
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def instrument(app, profile_dir=None):
+    """
+    Install request hooks that time and count every request, and the opt-in profiling hook.
+
+    Args:
+        app (flask.Flask): The application.
+        profile_dir (str, optional): Directory to write request profiles to. Profiling is disabled if unset.
+    """
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    @app.before_request
+    def _start_request():
+        g.metrics_route = _route()
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.labels(g.metrics_route).inc()
+        if profile_dir and request.headers.get(PROFILE_HEADER, '').lower() == 'true':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_request(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            filename = f"{time.strftime('%Y%m%dT%H%M%S')}_{request.endpoint}_{uuid.uuid4().hex[:8]}.prof"
+            profiler.dump_stats(os.path.join(profile_dir, filename))
+            response.headers['X-Profile-File'] = filename
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(error):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        route = g.pop('metrics_route')
+        status = g.pop('metrics_status', 500)
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, route, str(status)).inc()
+        IN_FLIGHT.labels(route).dec()
+
+
+class _PoolCollector:
+    def __init__(self, pools):
+        self.pools = pools
+
+    def collect(self):
+        connections = GaugeMetricFamily('etl_db_pool_connections', 'Pooled database connections.',
+                                        labels=['role', 'state'])
+        counters = {
+            name: CounterMetricFamily(f'etl_db_pool_{name}', f'Pool {name}.', labels=['role'])
+            for name in ('checkouts', 'waits', 'timeouts', 'recycled')
+        }
+        checkout = HistogramMetricFamily('etl_db_checkout_duration_seconds',
+                                         'Time to check out a pooled connection.', labels=['role'])
+        connect = SummaryMetricFamily('etl_db_connect_duration_seconds', 'Time to open a new database connection.',
+                                      labels=['role'])
+        # Timings first: a pool created in between then appears in the metrics but not the timings.
+        timings = self.pools.timings()
+        all_metrics = self.pools.metrics()
+        for role, pool_timings in timings.items():
+            pool_metrics = all_metrics[role]
+            connections.add_metric([role, 'in_use'], pool_metrics['in_use'])
+            connections.add_metric([role, 'idle'], pool_metrics['idle'])
+            for name, family in counters.items():
+                family.add_metric([role], pool_metrics[name])
+
+            cumulative, buckets = 0, []
+            for bound, count in zip(CHECKOUT_BUCKETS + (float('inf'),), pool_timings['checkout_buckets']):
+                cumulative += count
+                buckets.append((str(bound) if bound != float('inf') else '+Inf', cumulative))
+            checkout.add_metric([role], buckets, pool_timings['checkout_seconds'])
+            connect.add_metric([role], pool_timings['connects'], pool_timings['connect_seconds'])
+        yield connections
+        yield from counters.values()
+        yield checkout
+        yield connect
+
+
+def register_pools(pools):
+    """Export the connection pool metrics of a db.PoolManager."""
+    REGISTRY.register(_PoolCollector(pools))
+
+
+def record_chunk(stats):
+    """Record the stage timings and row counts from the stats of one pipeline chunk."""
+    for key, stage in _STAGES.items():
+        STAGE_LATENCY.labels(stage).observe(stats[key])
+    for key, outcome in _ROW_OUTCOMES.items():
+        ROWS.labels(outcome).inc(stats[key])
+
+
+@contextmanager
+def track_run():
+    """Count an ETL run as in progress for the duration of a with block."""
+    RUNS_IN_PROGRESS.inc()
+    try:
+        yield
+    finally:
+        RUNS_IN_PROGRESS.dec()
+
+
+def record_run(status, seconds, rows_read):
+    """Record the duration and throughput of a finished ETL run."""
+    RUN_LATENCY.labels(str(status)).observe(seconds)
+    if rows_read and seconds > 0:
+        RUN_THROUGHPUT.set(rows_read / seconds)
+
+
+def render():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        tuple: (body bytes, content type).
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
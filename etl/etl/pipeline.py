@@ -0,0 +1,386 @@
+"""
+ETL Pipeline
+This module runs the extract, transform and load steps of the ETL service over a saved upload.
+Uploads are read in fixed-size chunks: CSV files through pandas' chunked reader or pyarrow's streaming
+CSV reader, XLSX files through openpyxl's read-only row iterator, Parquet files batch by batch and Arrow
+IPC files from a memory map. Each chunk is validated and loaded before the next one is read, so peak
+memory is bounded by the chunk size rather than the file size.
+Files read with pyarrow produce pyarrow-backed string columns, and the pyarrow CSV engine reads the
+expected columns as strings instead of inferring their types.
+The transform step can run on several cores: a TransformPool splits each chunk into contiguous row
+partitions, transforms them in worker processes and concatenates the results in partition order, so the
+loaded rows, their order and the per-rule failure counts are the same as with the serial transform.
+Classes:
+    ColumnMismatchError: Raised when the upload does not have exactly the expected columns.
+    StageError: Wraps an exception raised in the extract, transform or load stage.
+    TransformPool: Runs the transform step over partitions of a chunk in worker processes.
+Functions:
+    read_chunks(file_path, chunk_size, csv_engine): Yields the upload as DataFrames of at most chunk_size rows.
+    transform(df, rules): Cleans and validates one chunk.
+    merge_transformed(results): Combines transform results of consecutive partitions.
+    run(conn, file_path, ...): Runs the pipeline over an upload and returns the load summary.
+"""
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+from loader import bulk_load
+from validation import validate
+
+logger = logging.getLogger(__name__)
+
+EXPECTED_COLUMNS = {'id', 'first_name', 'last_name', 'email', 'gender', 'ip_address'}
+UPLOAD_FORMATS = ('.csv', '.xlsx', '.parquet', '.arrow', '.feather')
+CSV_ENGINES = ('pandas', 'pyarrow')
+
+# Batches read from Parquet when the whole file is read as one chunk
+_PARQUET_BATCH_ROWS = 65536
+_STRING_DTYPES = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+# Chunks are only split when every partition gets at least this many rows; below that, sending the rows to
+# a worker and back costs more than transforming them in place.
+MIN_PARTITION_ROWS = 5000
+
+
+class ColumnMismatchError(Exception):
+    """Raised when an upload is missing expected columns or has extra ones."""
+
+
+class StageError(Exception):
+    """Raised when a pipeline stage fails. The failing stage is 'extract', 'transform' or 'load'."""
+
+    def __init__(self, stage, error):
+        super().__init__(str(error))
+        self.stage = stage
+        self.error = error
+
+
+def _read_xlsx_chunks(file_path, chunk_size):
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else '' for name in header]
+
+        batch = []
+        start = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if chunk_size and len(batch) == chunk_size:
+                yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+                start += len(batch)
+                batch = []
+        if batch or start == 0:
+            yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+    finally:
+        workbook.close()
+
+
+def _read_csv_chunks(file_path, chunk_size):
+    if not chunk_size:
+        yield pd.read_csv(file_path)
+        return
+    with pd.read_csv(file_path, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+def _arrow_frame(table, start):
+    df = table.to_pandas(types_mapper=_STRING_DTYPES.get)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def _rebatch(batches, schema, chunk_size):
+    # Readers return batches of their own size; slicing and concatenating Arrow tables is zero-copy,
+    # so only the chunk being converted to pandas is materialized.
+    pending = schema.empty_table()
+    start = 0
+    for batch in batches:
+        pending = pa.concat_tables([pending, pa.Table.from_batches([batch])])
+        while chunk_size and pending.num_rows >= chunk_size:
+            yield _arrow_frame(pending.slice(0, chunk_size), start)
+            start += chunk_size
+            pending = pending.slice(chunk_size)
+    if pending.num_rows or start == 0:
+        yield _arrow_frame(pending, start)
+
+
+def _read_pyarrow_csv_chunks(file_path, chunk_size):
+    convert_options = pa_csv.ConvertOptions(
+        column_types={column: pa.string() for column in EXPECTED_COLUMNS},
+        strings_can_be_null=True
+    )
+    reader = pa_csv.open_csv(file_path, convert_options=convert_options)
+    try:
+        yield from _rebatch(reader, reader.schema, chunk_size)
+    finally:
+        reader.close()
+
+
+def _read_parquet_chunks(file_path, chunk_size):
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    try:
+        batches = parquet_file.iter_batches(batch_size=chunk_size or _PARQUET_BATCH_ROWS)
+        yield from _rebatch(batches, parquet_file.schema_arrow, chunk_size)
+    finally:
+        parquet_file.close()
+
+
+def _read_arrow_chunks(file_path, chunk_size):
+    with pa.memory_map(file_path) as source:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            # Not the random-access file format; read it as an IPC stream instead.
+            source.seek(0)
+            reader = pa.ipc.open_stream(source)
+            batches = reader
+        yield from _rebatch(batches, reader.schema, chunk_size)
+
+
+def read_chunks(file_path, chunk_size, csv_engine='pandas'):
+    """
+    Read an uploaded CSV, XLSX, Parquet or Arrow IPC file in chunks.
+
+    Chunks keep the row numbers of the file (0-based, excluding the header) as their index.
+
+    Args:
+        file_path (str): Path to a file with one of the extensions in UPLOAD_FORMATS. .arrow and .feather
+            files may use the Arrow IPC file or stream format.
+        chunk_size (int): Maximum rows per chunk. 0 or None reads the whole file as one chunk.
+        csv_engine (str): 'pandas' to read CSV files with pandas, inferring column types, or 'pyarrow' to
+            read them with pyarrow's multithreaded reader, with the expected columns as strings.
+
+    Returns:
+        generator: pandas.DataFrame chunks in file order.
+
+    Raises:
+        ValueError: If csv_engine is not one of CSV_ENGINES.
+    """
+    if csv_engine not in CSV_ENGINES:
+        raise ValueError(f"Unsupported CSV engine '{csv_engine}'. Expected one of {CSV_ENGINES}.")
+    if file_path.endswith('.xlsx'):
+        return _read_xlsx_chunks(file_path, chunk_size)
+    if file_path.endswith('.parquet'):
+        return _read_parquet_chunks(file_path, chunk_size)
+    if file_path.endswith(('.arrow', '.feather')):
+        return _read_arrow_chunks(file_path, chunk_size)
+    if csv_engine == 'pyarrow':
+        return _read_pyarrow_csv_chunks(file_path, chunk_size)
+    return _read_csv_chunks(file_path, chunk_size)
+
+
+def check_columns(columns):
+    """
+    Check that an upload has exactly the expected columns.
+
+    Args:
+        columns (iterable): Column names of the upload.
+
+    Raises:
+        ColumnMismatchError: If columns are missing or unexpected columns are present.
+    """
+    actual_columns = set(columns)
+    if actual_columns != EXPECTED_COLUMNS:
+        missing_columns = EXPECTED_COLUMNS - actual_columns
+        extra_columns = actual_columns - EXPECTED_COLUMNS
+        raise ColumnMismatchError(
+            f"Data validation error. Missing columns: {missing_columns}. Extra columns: {extra_columns}."
+        )
+
+
+def transform(df, rules=None):
+    """
+    Clean and validate one chunk of user rows.
+
+    Strips surrounding whitespace from text columns, lowercases emails and drops rows failing validation.
+
+    Args:
+        df (pandas.DataFrame): A chunk with the expected columns.
+        rules (list, optional): Compiled validation rules. Defaults to the validation module's default rules.
+
+    Returns:
+        tuple: (valid_df, invalid_count, failures)
+            - valid_df (pandas.DataFrame): Rows that passed validation, with their original index.
+            - invalid_count (int): Number of rows dropped.
+            - failures (dict): Number of rows failing each validation rule.
+    """
+    df = df.apply(lambda x: x.str.strip() if pd.api.types.is_string_dtype(x.dtype) else x)
+    df['email'] = df['email'].str.lower()
+
+    valid_mask, failures = validate(df, rules)
+    return df[valid_mask], int((~valid_mask).sum()), failures
+
+
+def merge_transformed(results):
+    """
+    Combine the transform results of consecutive partitions of a chunk.
+
+    Args:
+        results (list): (valid_df, invalid_count, failures) tuples from transform, in partition order.
+
+    Returns:
+        tuple: (valid_df, invalid_count, failures) for the whole chunk, as transform would return it.
+    """
+    valid_df = pd.concat([valid for valid, _, _ in results])
+    invalid_count = sum(count for _, count, _ in results)
+    failures = {name: sum(partition[name] for _, _, partition in results) for name in results[0][2]}
+    return valid_df, invalid_count, failures
+
+
+def _start_worker():
+    pass
+
+
+class TransformPool:
+    """
+    Runs transform over partitions of a chunk in a pool of worker processes.
+
+    Workers are forked where the platform supports it, so they inherit the loaded modules instead of
+    re-importing the service. They are all started when the pool is created; create it before starting
+    other threads so that no worker is forked while another thread holds a lock.
+
+    Args:
+        workers (int): Number of worker processes, and the most partitions a chunk is split into.
+        min_partition_rows (int): Fewest rows per partition. Smaller chunks are transformed in this process.
+    """
+
+    def __init__(self, workers, min_partition_rows=MIN_PARTITION_ROWS):
+        self.workers = workers
+        self.min_partition_rows = min_partition_rows
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(start_method)
+        )
+        self._executor.submit(_start_worker).result()
+
+    def transform(self, df, rules=None):
+        """
+        Clean and validate one chunk across the worker processes.
+
+        Takes and returns the same values as the module-level transform, and returns the same result.
+        """
+        partitions = min(self.workers, len(df) // self.min_partition_rows)
+        if partitions < 2:
+            return transform(df, rules)
+        bounds = [len(df) * i // partitions for i in range(partitions + 1)]
+        parts = [df.iloc[start:end] for start, end in zip(bounds, bounds[1:])]
+        return merge_transformed(list(self._executor.map(transform, parts, [rules] * partitions)))
+
+    def close(self):
+        """Stop the worker processes."""
+        self._executor.shutdown()
+
+
+def run(conn, file_path, chunk_size, rules=None, load_method='copy', batch_size=10000, on_chunk=None,
+        transform_pool=None, on_conflict='reject', csv_engine='pandas'):
+    """
+    Run extract, transform and load over an uploaded file, one chunk at a time.
+
+    All chunks are loaded in the caller's transaction; the caller commits or rolls back.
+
+    Args:
+        conn: An open psycopg2 connection.
+        file_path (str): Path to the saved upload.
+        chunk_size (int): Maximum rows per chunk. 0 or None processes the whole file as one chunk.
+        rules (list, optional): Compiled validation rules.
+        load_method (str): Bulk load method passed to loader.bulk_load.
+        batch_size (int): Batch size passed to loader.bulk_load.
+        on_chunk (callable, optional): Called with the stats dict of each chunk after it is loaded.
+        transform_pool (TransformPool, optional): Pool to run the transform step in. Defaults to
+            transforming each chunk in this process.
+        on_conflict (str): Conflict mode passed to loader.bulk_load.
+        csv_engine (str): CSV engine passed to read_chunks.
+
+    Returns:
+        dict: The load summary with rows_read, invalid_rows, validation_failures, rows_loaded, rows_updated,
+              rows_unchanged, rejected_rows (list of reject dicts) and chunks (list of per-chunk stats,
+              including read_seconds, transform_seconds and load_seconds stage timings).
+
+    Raises:
+        ColumnMismatchError: If the upload does not have exactly the expected columns.
+        StageError: If reading, transforming or loading a chunk fails.
+    """
+    summary = {
+        'rows_read': 0,
+        'invalid_rows': 0,
+        'validation_failures': {},
+        'rows_loaded': 0,
+        'rows_updated': 0,
+        'rows_unchanged': 0,
+        'rejected_rows': [],
+        'chunks': [],
+    }
+    chunks = read_chunks(file_path, chunk_size, csv_engine=csv_engine)
+    chunk_number = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            df = next(chunks, None)
+        except Exception as e:
+            raise StageError('extract', e) from e
+        if df is None:
+            break
+        if chunk_number == 0:
+            check_columns(df.columns)
+        read_seconds = time.perf_counter() - started
+
+        transform_started = time.perf_counter()
+        try:
+            if transform_pool is not None:
+                valid_df, invalid_count, failures = transform_pool.transform(df, rules)
+            else:
+                valid_df, invalid_count, failures = transform(df, rules)
+        except Exception as e:
+            raise StageError('transform', e) from e
+        transform_seconds = time.perf_counter() - transform_started
+
+        load_started = time.perf_counter()
+        try:
+            report = bulk_load(conn, valid_df, method=load_method, batch_size=batch_size, on_conflict=on_conflict)
+        except Exception as e:
+            raise StageError('load', e) from e
+        load_seconds = time.perf_counter() - load_started
+
+        stats = {
+            'chunk': chunk_number,
+            'rows_read': len(df),
+            'invalid_rows': invalid_count,
+            'rows_loaded': report['rows_loaded'],
+            'rows_updated': report['rows_updated'],
+            'rows_unchanged': report['rows_unchanged'],
+            'rejected_rows': len(report['rejected_rows']),
+            'read_seconds': round(read_seconds, 4),
+            'transform_seconds': round(transform_seconds, 4),
+            'load_seconds': round(load_seconds, 4),
+            'seconds': round(time.perf_counter() - started, 4),
+        }
+        summary['rows_read'] += len(df)
+        summary['invalid_rows'] += invalid_count
+        for name, count in failures.items():
+            summary['validation_failures'][name] = summary['validation_failures'].get(name, 0) + count
+        summary['rows_loaded'] += report['rows_loaded']
+        summary['rows_updated'] += report['rows_updated']
+        summary['rows_unchanged'] += report['rows_unchanged']
+        summary['rejected_rows'].extend(report['rejected_rows'])
+        summary['chunks'].append(stats)
+        if on_chunk is not None:
+            on_chunk(stats)
+        chunk_number += 1
+
+    if summary['invalid_rows']:
+        logger.error(
+            f"Data validation rejected {summary['invalid_rows']} rows. "
+            f"Failures per rule: {summary['validation_failures']}"
+        )
+    return summary
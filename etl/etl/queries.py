@@ -0,0 +1,164 @@
+"""
+Row Queries
+This module builds and runs the read queries behind /display-rows.
+Rows are paged with keyset pagination on 'id': a page asks for rows whose id sorts after the last id of the
+previous page, so every page is an index range scan no matter how deep into the table it is, unlike OFFSET.
+Queries select only the requested columns and can filter on exact column values. Exports stream rows
+through a server-side (named) cursor that fetches itersize rows per round trip, so the service holds at
+most one batch in memory regardless of how many rows are read.
+Constants:
+    COLUMNS: Columns that can be selected, in table order.
+    FILTER_COLUMNS: Columns that can be filtered on. scripts/init.sql creates the indexes these filters use.
+    EXPORT_FORMATS: Streaming export formats.
+Classes:
+    QueryError: Raised for invalid projections, filters or limits.
+Functions:
+    parse_columns(value): Parses a comma separated projection.
+    parse_limit(value, default, maximum): Parses a page size.
+    build_select(table, columns, filters, after, limit): Builds a keyset-paginated SELECT.
+    iter_batches(conn, query, params, itersize): Runs a query on a named cursor and yields batches of rows.
+    format_batches(export_format, columns, batches): Encodes batches of rows as NDJSON or CSV text chunks.
+"""
+import io
+import csv
+import json
+import uuid
+from psycopg2 import sql
+
+COLUMNS = ('id', 'first_name', 'last_name', 'email', 'gender', 'ip_address')
+FILTER_COLUMNS = ('gender', 'last_name', 'email')
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+class QueryError(ValueError):
+    """Raised when a requested projection, filter or limit is not valid."""
+
+
+def parse_columns(value):
+    """
+    Parse a comma separated projection such as 'id,email'. An empty value selects every column.
+
+    Raises:
+        QueryError: If a column does not exist.
+    """
+    if not value:
+        return list(COLUMNS)
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise QueryError(f"Unknown columns: {', '.join(unknown)}. Available columns: {', '.join(COLUMNS)}")
+    return list(dict.fromkeys(columns))
+
+
+def parse_limit(value, default, maximum=None):
+    """
+    Parse a page size, using default when value is empty.
+
+    Raises:
+        QueryError: If the value is not a positive integer or exceeds maximum.
+    """
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError(f"Invalid limit: {value}")
+    if limit < 1 or (maximum is not None and limit > maximum):
+        raise QueryError(f"Limit must be between 1 and {maximum}" if maximum else "Limit must be at least 1")
+    return limit
+
+
+def build_select(table, columns, filters=None, after=None, limit=None):
+    """
+    Build a SELECT over table that returns columns, ordered by id.
+
+    The id column is always selected, as the last column if it was not requested, since it is the
+    pagination cursor.
+
+    Args:
+        table (str): 'users' or 'masked_users'.
+        columns (list): Columns to select, from COLUMNS.
+        filters (dict): Exact-match filters keyed by column, from FILTER_COLUMNS.
+        after (str): Return only rows whose id sorts after this one (the previous page's last id).
+        limit (int): Maximum rows to return, or None for all of them.
+
+    Returns:
+        tuple: (query, params, selected) where query and params are for cursor.execute and selected
+               lists the columns of each returned row.
+
+    Raises:
+        QueryError: If a filter column cannot be filtered on.
+    """
+    filters = filters or {}
+    unknown = [column for column in filters if column not in FILTER_COLUMNS]
+    if unknown:
+        raise QueryError(f"Cannot filter on: {', '.join(unknown)}. Filterable columns: {', '.join(FILTER_COLUMNS)}")
+
+    selected = list(columns) + ([] if 'id' in columns else ['id'])
+    conditions, params = [], []
+    for column, value in filters.items():
+        conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+        params.append(value)
+    if after is not None:
+        conditions.append(sql.SQL("id > %s"))
+        params.append(after)
+
+    query = sql.SQL("SELECT {columns} FROM {table}").format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, selected)),
+        table=sql.Identifier(table)
+    )
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY id")
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        params.append(limit)
+    return query, params, selected
+
+
+def iter_batches(conn, query, params, itersize=2000):
+    """
+    Run a query on a server-side cursor and yield lists of up to itersize rows.
+
+    The query is sent on the first next() call, so errors in it are raised there. The cursor lives in the
+    connection's transaction; the caller rolls back when done.
+    """
+    cursor = conn.cursor(name=f"display_rows_{uuid.uuid4().hex}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def format_batches(export_format, columns, batches):
+    """
+    Encode batches of rows as text chunks, one chunk per batch.
+
+    Args:
+        export_format (str): 'ndjson' for one JSON object per line, or 'csv' with a header row.
+        columns (list): Names of the values in each row.
+        batches (iterable): Lists of row tuples, as yielded by iter_batches.
+
+    Yields:
+        str: Encoded rows.
+    """
+    if export_format == 'ndjson':
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
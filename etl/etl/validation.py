@@ -0,0 +1,157 @@
+"""
+Row Validation
+This module validates user rows with column-wide pandas string operations instead of a per-row loop.
+Rules are declared as plain dictionaries keyed by rule name, compiled once, and applied to whole columns.
+Validation returns a boolean mask of valid rows together with the number of rows failing each rule.
+Compiled checks are plain callable objects rather than closures, so compiled rules can be pickled and
+sent to the worker processes of a parallel transform.
+Rule Types:
+    pattern: The value must fully match the regular expression in 'pattern'.
+    ipv4: The value must be four dot-separated groups of 1-3 digits. If 'max_octet' is set, every group
+          must also be at most that value (use 255 for a strict IPv4 check).
+    one_of: The value must be one of the strings in 'values'.
+Rule Options:
+    column: Column the rule applies to. Defaults to the rule name.
+Functions:
+    compile_rules(rules): Compiles rule definitions into column checks.
+    load_rules(path): Reads additional rule definitions from a JSON file and merges them over DEFAULT_RULES.
+    validate(df, rules): Returns the valid-row mask and the per-rule failure counts for a DataFrame.
+Usage:
+    New rules can be added without code by describing them in a JSON file, for example:
+        {"gender": {"type": "one_of", "values": ["Male", "Female"]}}
+"""
+import re
+import json
+import pandas as pd
+
+NAME_PATTERN = r'[A-Za-z]+'
+
+DEFAULT_RULES = {
+    'email': {'type': 'pattern', 'pattern': r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'},
+    'ip_address': {'type': 'ipv4'},
+    'first_name': {'type': 'pattern', 'pattern': NAME_PATTERN},
+    'last_name': {'type': 'pattern', 'pattern': NAME_PATTERN},
+}
+
+_IPV4_FORMAT = re.compile(r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}')
+_IPV4_OCTETS = re.compile(r'\A([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\Z')
+
+
+def _as_strings(series):
+    # Non-string columns (e.g. all-numeric names) can never match a string rule.
+    if pd.api.types.is_string_dtype(series.dtype):
+        return series
+    return None
+
+
+def _matches(series, pattern):
+    strings = _as_strings(series)
+    if strings is None:
+        return pd.Series(False, index=series.index)
+    return strings.str.fullmatch(pattern, na=False).astype(bool)
+
+
+class _PatternCheck:
+    def __init__(self, rule):
+        self.pattern = re.compile(rule['pattern'])
+
+    def __call__(self, series):
+        return _matches(series, self.pattern)
+
+
+class _Ipv4Check:
+    def __init__(self, rule):
+        self.max_octet = rule.get('max_octet')
+
+    def __call__(self, series):
+        if self.max_octet is None:
+            return _matches(series, _IPV4_FORMAT)
+        strings = _as_strings(series)
+        if strings is None:
+            return pd.Series(False, index=series.index)
+        octets = strings.str.extract(_IPV4_OCTETS)
+        well_formed = octets.notna().all(axis=1)
+        in_range = (octets.fillna('0').astype(int) <= self.max_octet).all(axis=1)
+        return well_formed & in_range
+
+
+class _OneOfCheck:
+    def __init__(self, rule):
+        self.allowed = set(rule['values'])
+
+    def __call__(self, series):
+        return series.isin(self.allowed)
+
+
+RULE_TYPES = {
+    'pattern': _PatternCheck,
+    'ipv4': _Ipv4Check,
+    'one_of': _OneOfCheck,
+}
+
+
+def compile_rules(rules):
+    """
+    Compile rule definitions into column checks.
+
+    Args:
+        rules (dict): Rule definitions keyed by rule name, in the format of DEFAULT_RULES.
+
+    Returns:
+        list: (rule name, column, check) tuples, where check is a picklable callable mapping a column
+              Series to a boolean Series.
+
+    Raises:
+        ValueError: If a rule has an unknown type.
+    """
+    compiled = []
+    for name, rule in rules.items():
+        rule_type = rule.get('type')
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f"Validation rule '{name}' has unknown type '{rule_type}'.")
+        compiled.append((name, rule.get('column', name), RULE_TYPES[rule_type](rule)))
+    return compiled
+
+
+def load_rules(path):
+    """
+    Read rule definitions from a JSON file and merge them over DEFAULT_RULES.
+
+    A rule in the file with the same name as a default rule replaces it.
+
+    Args:
+        path (str): Path to a JSON object of rule definitions.
+
+    Returns:
+        list: The compiled rules, as returned by compile_rules.
+    """
+    with open(path) as f:
+        extra_rules = json.load(f)
+    return compile_rules({**DEFAULT_RULES, **extra_rules})
+
+
+def validate(df, rules=None):
+    """
+    Validate every row of a DataFrame against a set of rules.
+
+    Args:
+        df (pandas.DataFrame): The rows to validate.
+        rules (list, optional): Compiled rules from compile_rules or load_rules. Defaults to DEFAULT_RULES.
+
+    Returns:
+        tuple: (mask, failures)
+            - mask (pandas.Series): Boolean Series aligned with df, True for rows that pass every rule.
+            - failures (dict): Number of rows failing each rule, keyed by rule name.
+    """
+    if rules is None:
+        rules = _DEFAULT_COMPILED
+    mask = pd.Series(True, index=df.index)
+    failures = {}
+    for name, column, check in rules:
+        passed = check(df[column])
+        failures[name] = int((~passed).sum())
+        mask &= passed
+    return mask, failures
+
+
+_DEFAULT_COMPILED = compile_rules(DEFAULT_RULES)
@@ -4,13 +4,18 @@
 
 -- It performs the following tasks:
 -- 1. Creates the main 'users' table if it does not already exist.
--- 2. Defines a function 'mask_email' to mask email addresses for privacy.
--- 3. Creates a view 'masked_users' that uses the 'mask_email' function to mask email addresses.
--- 4. Creates roles 'analyst', 'manager', and 'admin' if they do not already exist.
--- 5. Grants appropriate permissions to the roles:
+-- 2. Creates the indexes used by the /display-rows filters and keyset pagination.
+-- 3. Defines a function 'mask_email' to mask email addresses for privacy.
+-- 4. Creates the 'masked_users_materialized' table holding every user with the email already masked,
+--    and triggers that keep it in step with 'users' in the same transaction as each load or delete.
+-- 5. Creates a view 'masked_users' over the materialized table.
+-- 6. Creates the 'etl_uploads' ledger of loaded uploads, and a trigger that clears it when users are deleted.
+-- 7. Creates roles 'analyst', 'manager', and 'admin' if they do not already exist.
+-- 8. Grants appropriate permissions to the roles:
 --    - 'analyst' and 'manager' roles can select from the 'masked_users' view.
 --    - 'manager' role can also select from the 'users' table.
---    - 'admin' role has all privileges on both 'users' and 'masked_users' tables.
+--    - 'admin' role has all privileges on both 'users' and 'masked_users' tables, and can read and
+--      add to the 'etl_uploads' ledger.
 */
 -- Create the main users table
 CREATE TABLE IF NOT EXISTS users (
@@ -22,17 +27,99 @@ CREATE TABLE IF NOT EXISTS users (
     ip_address TEXT
 );
 
--- Create masking function
+-- Indexes for the /display-rows filters. Rows are paged by id, so each filter column is paired with id
+-- and a filtered page is a single index range scan. Pages without filters use the primary key, and
+-- email filters use the index behind the unique constraint.
+CREATE INDEX IF NOT EXISTS users_gender_id_idx ON users (gender, id);
+CREATE INDEX IF NOT EXISTS users_last_name_id_idx ON users (last_name, id);
+
+-- Create masking function. A single-statement, immutable SQL function is inlined into the calling query,
+-- so it costs no more than the expression itself.
 CREATE OR REPLACE FUNCTION mask_email(email text) RETURNS text AS $$
+  SELECT SUBSTRING(email, 1, 1) || '****' || SUBSTRING(email FROM POSITION('@' IN email));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Create the materialized masked table. Emails are masked once, when rows are written, instead of on
+-- every read. It carries the same indexes as 'users' for the /display-rows filters.
+CREATE TABLE IF NOT EXISTS masked_users_materialized (
+    id TEXT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    gender TEXT,
+    ip_address TEXT
+);
+CREATE INDEX IF NOT EXISTS masked_users_materialized_gender_id_idx ON masked_users_materialized (gender, id);
+CREATE INDEX IF NOT EXISTS masked_users_materialized_last_name_id_idx ON masked_users_materialized (last_name, id);
+
+-- Keep the materialized table in step with 'users'. The triggers are statement-level and read the
+-- statement's transition tables, so a bulk load of N rows applies one set-based insert rather than N
+-- row-level ones, and the change commits or rolls back with the load itself. The function runs as its
+-- owner, so loading roles need no privileges on the materialized table.
+CREATE OR REPLACE FUNCTION sync_masked_users() RETURNS trigger AS $$
 BEGIN
-  RETURN SUBSTRING(email, 1, 1) || '****' || SUBSTRING(email FROM POSITION('@' IN email));
+  IF TG_OP = 'TRUNCATE' THEN
+    TRUNCATE masked_users_materialized;
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    DELETE FROM masked_users_materialized m USING old_rows o WHERE m.id = o.id;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO masked_users_materialized (id, first_name, last_name, email, gender, ip_address)
+    SELECT id, first_name, last_name, mask_email(email), gender, ip_address FROM new_rows;
+  END IF;
+  RETURN NULL;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp;
+
+DROP TRIGGER IF EXISTS users_masked_insert ON users;
+CREATE TRIGGER users_masked_insert AFTER INSERT ON users
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_masked_users();
+DROP TRIGGER IF EXISTS users_masked_update ON users;
+CREATE TRIGGER users_masked_update AFTER UPDATE ON users
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_masked_users();
+DROP TRIGGER IF EXISTS users_masked_delete ON users;
+CREATE TRIGGER users_masked_delete AFTER DELETE ON users
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_masked_users();
+DROP TRIGGER IF EXISTS users_masked_truncate ON users;
+CREATE TRIGGER users_masked_truncate AFTER TRUNCATE ON users
+  FOR EACH STATEMENT EXECUTE FUNCTION sync_masked_users();
 
--- Create masked view
+-- Backfill rows loaded before the materialized table existed
+INSERT INTO masked_users_materialized (id, first_name, last_name, email, gender, ip_address)
+SELECT id, first_name, last_name, mask_email(email), gender, ip_address FROM users
+ON CONFLICT (id) DO NOTHING;
+
+-- Create masked view. Reads go to the materialized table, so the grants below are unchanged: roles
+-- granted the view can read the masked rows without any privileges on the table behind it.
 CREATE OR REPLACE VIEW masked_users AS
-SELECT id, first_name, last_name, mask_email(email) AS email, gender, ip_address
-FROM users;
+SELECT id, first_name, last_name, email, gender, ip_address
+FROM masked_users_materialized;
+
+-- Create the upload ledger. One row per loaded upload, keyed by the SHA-256 hash of the file, holding the
+-- load summary returned to the client. The ETL service writes it in the same transaction as the load.
+CREATE TABLE IF NOT EXISTS etl_uploads (
+    content_hash TEXT PRIMARY KEY,
+    rows_read BIGINT NOT NULL,
+    rows_loaded BIGINT NOT NULL,
+    summary JSONB NOT NULL,
+    loaded_by TEXT NOT NULL DEFAULT current_user,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Earlier load summaries no longer describe the table once rows are deleted, so any delete clears the
+-- ledger and the next upload of the same file is loaded again.
+CREATE OR REPLACE FUNCTION clear_etl_uploads() RETURNS trigger AS $$
+BEGIN
+  DELETE FROM etl_uploads;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp;
+
+DROP TRIGGER IF EXISTS users_clear_etl_uploads ON users;
+CREATE TRIGGER users_clear_etl_uploads AFTER DELETE OR TRUNCATE ON users
+  FOR EACH STATEMENT EXECUTE FUNCTION clear_etl_uploads();
 
 -- Create roles
 DO $$
@@ -55,3 +142,4 @@ GRANT SELECT ON masked_users TO manager;
 GRANT SELECT ON users TO manager;
 GRANT ALL PRIVILEGES ON users TO admin;
 GRANT ALL PRIVILEGES ON masked_users TO admin;
+GRANT SELECT, INSERT ON etl_uploads TO admin;
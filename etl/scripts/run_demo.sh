@@ -78,7 +78,7 @@ echo -e "\n"
 
 # Step 3: Run ETL process
 echo -e "${GREEN}Running ETL process...${NC}"
-curl -s -X POST "http://localhost:5001/etl" -F "role=admin" -F "file=@rawdata/DEM_Challenge_Section1_DATASET.xlsx" -u "$AUTH_USERNAME:$AUTH_PASSWORD"
+curl -s -X POST "http://localhost:5001/etl" -F "role=admin" -F "wait=true" -F "file=@rawdata/DEM_Challenge_Section1_DATASET.xlsx" -u "$AUTH_USERNAME:$AUTH_PASSWORD"
 echo -e "\n"
 
 # Step 4: Display rows after ETL for each role
@@ -1,23 +1,89 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 """
 This module implements a Flask web server for training and predicting using a Convolutional Neural Network (CNN) on the Fashion MNIST dataset.
 
 Functions:
-    train_model(): Trains a CNN on the Fashion MNIST dataset and saves the trained model to a file.
-    train(): Flask route to trigger the training of the model via a POST request.
+    load_fashion_mnist(data_dir, cache_dir): Returns the Fashion MNIST train and test sets as uint8 arrays.
+    make_dataset(images, labels, batch_size, shuffle_seed): Builds a tf.data pipeline of float32 batches.
+    dataset_fingerprint(arrays): Returns a short hash of the content of the training and test arrays.
+    architecture_tag(model): Returns a short hash of a model's layers and compile settings.
+    train_model(output_dir, epochs): Trains a CNN on the Fashion MNIST dataset and saves it with its metadata.
+    train(): Flask route to start training a new model version in a background process.
+    activate_version(version, pinned): Swaps a registry version into the serving path.
+    get_model(): Returns the loaded Keras model, loading it if needed.
+    preprocess_image(img_bytes): Converts an encoded image into a normalized (28, 28, 1) float32 array.
+    preprocess_raw(data, shape): Reads raw uint8 pixel bytes into a normalized (N, 28, 28, 1) float32 batch.
     predict(): Flask route to predict the class of a provided image via a POST request.
+    predict_batch(): Flask route to predict the classes of many images in one forward pass.
+    batcher_stats(): Flask route reporting the micro-batcher's queue depth and batch-size histogram.
+    cache_stats(): Flask route reporting the prediction cache's size and hit rate.
+    service_metrics(): Flask route reporting the server's metrics in the Prometheus text format.
+
+Classes:
+    EpochTimer: Keras callback reporting each epoch's duration and training samples/sec.
+    EpochCheckpoint: Keras callback saving the model and optimizer after every epoch, for resuming training.
+    ModelRegistry: Versioned model artifacts on local disk, with the active version and rollback history.
+    Trainer: Runs training in a background process and hands the result to the registry.
+    ModelManager: Loads, warms up and reloads the model, and runs it through the configured inference runtime.
+    MicroBatcher: Queues single-image requests and runs them through the model in small batches.
+    PredictionCache: LRU cache of /predict results keyed by image hash and model version, optionally on disk.
 
 Routes:
-    /train (POST): Trains the model and saves it to a file.
+    /train (POST): Starts training a new model version in the background (wait=true blocks until done).
+    /train/status (GET): Reports the state of the current or last training run.
+    /models (GET): Lists model versions, the active version and whether it is pinned.
+    /models/<version>/pin (POST): Serves a version and keeps serving it when new versions are trained.
+    /models/unpin (POST): Serves the newest version and follows new versions again.
+    /models/rollback (POST): Serves and pins the version that was active before the current one.
     /predict (POST): Predicts the class of an uploaded image using the trained model.
+    /predict/batch (POST): Predicts the classes of many uploaded images with a single model call.
+    Both prediction routes also accept raw uint8 pixels as an application/octet-stream body, with an
+    optional X-Image-Shape header such as '28,28' or '64,28,28'.
+    /batcher-stats (GET): Reports micro-batching queue depth, batch-size histogram and queue wait times.
+    /cache-stats (GET): Reports prediction cache size, hits from memory and disk, misses and hit rate.
+    /metrics (GET): Reports request latency histograms and in-flight gauges per route, preprocessing and
+                    model-forward time, batch sizes, queue waits, cache lookups and model load time, for
+                    Prometheus.
+
+Configuration:
+    MODEL_REGISTRY_DIR: Directory of the model registry (default: models).
+    TRAIN_EPOCHS: Epochs per training run (default: 5).
+    TRAIN_BATCH_SIZE: Training batch size (default: 32).
+    TRAIN_SEED: Seed for weight initialization and shuffling, for reproducible runs (default: 0).
+    TRAIN_DATA_DIR: Directory holding the Fashion MNIST files, either the four idx .gz files or a
+                    fashion_mnist.npz, so training runs offline. Downloaded by Keras if unset.
+    TRAIN_CACHE_DIR: Directory where the decoded dataset is kept as .npy files, so later runs skip decoding.
+    TRAIN_CHECKPOINT_DIR: Directory for per-epoch checkpoints, from which an interrupted run with the same
+                          settings resumes (default: <MODEL_REGISTRY_DIR>/.checkpoints; '' disables them).
+    MODEL_RUNTIME: Inference runtime: 'keras' (default), 'savedmodel' (a tf.function exported as a SavedModel)
+                   or 'tflite'. Exports are built on first load and kept in MODEL_EXPORT_DIR.
+    MODEL_EXPORT_DIR: Directory of SavedModel and TFLite exports, named by the content hash of the .h5 file
+                      they were built from (default: <MODEL_REGISTRY_DIR>/.exports).
+    MODEL_PRELOAD: Set to 'false' to load the model on the first request instead of at startup.
+    MICROBATCH_ENABLED: Set to 'false' to run every /predict call through the model on its own.
+    MICROBATCH_MAX_SIZE: Largest batch the micro-batcher sends to the model (default: 32).
+    MICROBATCH_MAX_WAIT_MS: Longest time the first queued image waits for others to join it (default: 5).
+    PREDICTION_CACHE_SIZE: Most /predict results kept in memory; 0 disables the cache (default: 10000).
+    PREDICTION_CACHE_TTL: Seconds a cached result stays valid; 0 keeps it until evicted (default: 3600).
+    PREDICTION_CACHE_KEY: Hash the uploaded 'bytes' (default) or the normalized 28x28 'tensor'.
+    PREDICTION_CACHE_DB: Optional SQLite file that keeps cached results across restarts and LRU evictions.
+    MAX_BATCH_SIZE: Most images accepted by one /predict/batch request (default: 1024). Uploads are counted
+                    before any image is decoded.
+    MAX_CONTENT_LENGTH: Largest request body in bytes, and largest uncompressed size of an uploaded zip
+                        archive (default: 64 MiB).
+    PROFILE_DIR: When set, a request sent with the header 'X-Profile: true' runs under cProfile and the
+                 profile is written to this directory; its file name is returned in 'X-Profile-File'.
 
 Global Variables:
     app: The Flask application instance.
-    model: The trained Keras model, initially set to None.
+    model_registry: The ModelRegistry holding every trained model version.
+    model_manager: The ModelManager serving the active version.
+    trainer: The Trainer used by /train.
     class_names: List of class names corresponding to the Fashion MNIST dataset.
 
 Usage:
     Run this script to start the Flask server. The server will automatically train the model if it is not already trained.
+    'python app.py --train-to DIR' trains a model into DIR and exits; /train runs it in a background process.
     Use the /train endpoint to retrain the model.
     Use the /predict endpoint to classify an uploaded image.
 """
@@ -27,22 +93,201 @@ import numpy as np
 from PIL import Image
 import io
 import os
+import gzip
+import sys
+import json
+import time
+import uuid
+import queue
+import shutil
+import argparse
+import subprocess
+import sqlite3
+import zipfile
+import hashlib
+import cProfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
 
 app = Flask(__name__)
 
-def train_model():
-    # Load the Fashion MNIST dataset inside the container
-    fashion_mnist = keras.datasets.fashion_mnist
-    (train_images, train_labels), (test_images, test_labels) = fashion_mnist.load_data()
+# Metrics, exported at /metrics. Recording an observation takes a lock and a few additions, so they are
+# always on. Creation timestamps add a series per labelled metric and nothing here uses them.
+disable_created_metrics()
+REQUESTS = Counter('ml_http_requests_total', 'HTTP requests handled.', ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('ml_http_request_duration_seconds', 'HTTP request latency.', ['method', 'route'])
+IN_FLIGHT = Gauge('ml_http_requests_in_flight', 'HTTP requests being handled.', ['route'])
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+PREPROCESS_LATENCY = Histogram('ml_preprocess_duration_seconds', 'Time to decode and scale the images of a request.',
+                               ['route'], buckets=FAST_BUCKETS)
+FORWARD_LATENCY = Histogram('ml_model_forward_duration_seconds', 'Time per model call.', ['runtime'],
+                            buckets=FAST_BUCKETS)
+BATCH_SIZE = Histogram('ml_model_batch_size', 'Images per model call.',
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048))
+QUEUE_WAIT = Histogram('ml_batcher_queue_wait_seconds', 'Time images wait in the micro-batcher queue.',
+                       buckets=FAST_BUCKETS)
+CACHE_LOOKUPS = Counter('ml_prediction_cache_lookups_total', 'Prediction cache lookups, by where they were answered.',
+                        ['result'])
+CACHE_ENTRIES = Gauge('ml_prediction_cache_entries', 'Predictions held in the in-memory cache.')
+MODEL_LOAD_SECONDS = Gauge('ml_model_load_seconds', 'Time taken to load and warm up the serving model.')
+MODEL_VERSION = Gauge('ml_model_version', 'Registry version of the serving model.')
+
+# Inference exports are kept outside the registry's version directories, which are never modified
+MODEL_EXPORT_DIR = os.environ.get(
+    'MODEL_EXPORT_DIR', os.path.join(os.environ.get('MODEL_REGISTRY_DIR', 'models'), '.exports')
+)
+
+# Training settings; training runs in a subprocess started by Trainer, which inherits them
+TRAIN_BATCH_SIZE = int(os.environ.get('TRAIN_BATCH_SIZE', 32))
+TRAIN_SEED = int(os.environ.get('TRAIN_SEED', 0))
+TRAIN_DATA_DIR = os.environ.get('TRAIN_DATA_DIR')
+TRAIN_CACHE_DIR = os.environ.get('TRAIN_CACHE_DIR')
+TRAIN_CHECKPOINT_DIR = os.environ.get(
+    'TRAIN_CHECKPOINT_DIR', os.path.join(os.environ.get('MODEL_REGISTRY_DIR', 'models'), '.checkpoints')
+)
+
+# Fashion MNIST file names, as published and as downloaded by Keras
+FASHION_MNIST_FILES = {
+    'x_train': 'train-images-idx3-ubyte.gz',
+    'y_train': 'train-labels-idx1-ubyte.gz',
+    'x_test': 't10k-images-idx3-ubyte.gz',
+    'y_test': 't10k-labels-idx1-ubyte.gz',
+}
+
+def read_idx(path, images):
+    """Read a gzipped idx file of uint8 images (N, 28, 28) or labels (N,), skipping its header as Keras does."""
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+    if images:
+        return np.frombuffer(data, dtype=np.uint8, offset=16).reshape(-1, 28, 28)
+    return np.frombuffer(data, dtype=np.uint8, offset=8)
+
+def load_fashion_mnist(data_dir=None, cache_dir=None):
+    """
+    Return ((train_images, train_labels), (test_images, test_labels)) as uint8 arrays.
+
+    Args:
+        data_dir (str): Directory holding the four idx .gz files or a fashion_mnist.npz. If not given, Keras
+                        downloads the dataset, or reads its own copy under ~/.keras/datasets.
+        cache_dir (str): Directory where the decoded arrays are kept as .npy files. When they are there,
+                         they are memory-mapped instead of decoding the dataset again.
+    """
+    if cache_dir and all(os.path.exists(os.path.join(cache_dir, f'{name}.npy')) for name in FASHION_MNIST_FILES):
+        arrays = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r') for name in FASHION_MNIST_FILES}
+    elif data_dir and os.path.exists(os.path.join(data_dir, 'fashion_mnist.npz')):
+        with np.load(os.path.join(data_dir, 'fashion_mnist.npz')) as npz:
+            arrays = {name: npz[name] for name in FASHION_MNIST_FILES}
+    elif data_dir:
+        arrays = {
+            name: read_idx(os.path.join(data_dir, filename), images=name.startswith('x'))
+            for name, filename in FASHION_MNIST_FILES.items()
+        }
+    else:
+        (x_train, y_train), (x_test, y_test) = keras.datasets.fashion_mnist.load_data()
+        arrays = {'x_train': x_train, 'y_train': y_train, 'x_test': x_test, 'y_test': y_test}
+    if cache_dir and not isinstance(arrays['x_train'], np.memmap):
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, array in arrays.items():
+            # Written under a temporary name and renamed, so a partial file is never read as the cache
+            np.save(os.path.join(cache_dir, f'{name}.tmp.npy'), array)
+            os.replace(os.path.join(cache_dir, f'{name}.tmp.npy'), os.path.join(cache_dir, f'{name}.npy'))
+    return (arrays['x_train'], arrays['y_train']), (arrays['x_test'], arrays['y_test'])
+
+def make_dataset(images, labels, batch_size, shuffle_seed=None):
+    """
+    Build a tf.data pipeline of (float32 (N, 28, 28, 1) images scaled to [0, 1], labels) batches.
+
+    Images stay uint8 until they are batched; each batch is then cast and scaled in one vectorized step, so
+    only one batch at a time exists as float32. With a shuffle_seed, the whole set is shuffled in an order
+    fixed by the seed alone, however many times the dataset has been iterated before.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(images), np.asarray(labels)))
+    if shuffle_seed is not None:
+        dataset = dataset.shuffle(len(images), seed=shuffle_seed, reshuffle_each_iteration=False)
+    dataset = dataset.batch(batch_size).map(
+        lambda x, y: (tf.reshape(tf.cast(x, tf.float32) * (1 / 255.0), (-1, 28, 28, 1)), y),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def dataset_fingerprint(arrays):
+    """Return a short hash of the content, shapes and dtypes of arrays, whichever file they were read from."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(f'{array.shape}{array.dtype}'.encode())
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()[:16]
+
+class EpochTimer(keras.callbacks.Callback):
+    """Reports each epoch's training time (excluding validation) and training samples/sec."""
+
+    def __init__(self, samples):
+        super().__init__()
+        self.samples = samples
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        self._train_seconds = time.perf_counter() - self._started
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._started
+        train_seconds = self._train_seconds or seconds
+        self.epochs.append({
+            'epoch': epoch + 1,
+            'seconds': round(seconds, 2),
+            'train_seconds': round(train_seconds, 2),
+            'samples_per_second': round(self.samples / train_seconds),
+        })
+        print(f'Epoch {epoch + 1}: {seconds:.1f}s ({train_seconds:.1f}s training), '
+              f'{self.samples / train_seconds:,.0f} samples/sec', flush=True)
+
+class EpochCheckpoint(keras.callbacks.Callback):
+    """
+    Saves the model, with its optimizer state, after every epoch so an interrupted run can resume.
+
+    The checkpoint directory holds latest.keras and progress.json, which records the last finished epoch
+    and the settings of the run. Both are written under temporary names and renamed into place.
+
+    Args:
+        checkpoint_dir (str): Directory for the checkpoint. Created if it does not exist.
+        settings (dict): Settings of the run; a checkpoint is only resumed by a run with the same settings.
+    """
+
+    def __init__(self, checkpoint_dir, settings):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.settings = settings
 
-    # Normalize the images
-    train_images = train_images / 255.0
-    test_images = test_images / 255.0
+    @staticmethod
+    def resume(checkpoint_dir, settings):
+        """Return (model, finished epochs) from a checkpoint written with the same settings, or (None, 0)."""
+        progress_path = os.path.join(checkpoint_dir, 'progress.json')
+        if not os.path.exists(progress_path):
+            return None, 0
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress['settings'] != settings:
+            return None, 0
+        return keras.models.load_model(os.path.join(checkpoint_dir, 'latest.keras')), progress['epoch']
 
-    # Reshape the images for the CNN
-    train_images = train_images.reshape(-1, 28, 28, 1)
-    test_images = test_images.reshape(-1, 28, 28, 1)
+    def on_epoch_end(self, epoch, logs=None):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        model_path = os.path.join(self.checkpoint_dir, 'latest.keras')
+        self.model.save(os.path.join(self.checkpoint_dir, 'latest.tmp.keras'))
+        os.replace(os.path.join(self.checkpoint_dir, 'latest.tmp.keras'), model_path)
+        progress_path = os.path.join(self.checkpoint_dir, 'progress.json')
+        with open(progress_path + '.tmp', 'w') as f:
+            json.dump({'epoch': epoch + 1, 'settings': self.settings}, f)
+        os.replace(progress_path + '.tmp', progress_path)
 
+def build_model():
+    """Return the compiled, untrained CNN."""
     # Define the model architecture
     model = keras.Sequential([
         keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
@@ -58,56 +303,1104 @@ def train_model():
     model.compile(optimizer='adam',
                   loss='sparse_categorical_crossentropy',
                   metrics=['accuracy'])
+    return model
+
+def architecture_tag(model):
+    """Return a short hash of a model's layer and compile configuration, ignoring generated layer names."""
+    layers = [
+        {'class': type(layer).__name__, **{key: value for key, value in layer.get_config().items() if key != 'name'}}
+        for layer in model.layers
+    ]
+    spec = json.dumps({'layers': layers, 'compile': model.get_compile_config()}, sort_keys=True, default=str)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+def train_model(output_dir, epochs=5):
+    """
+    Train a CNN on Fashion MNIST and save it to output_dir as model.h5, with its scores in metadata.json.
+
+    Data is fed through make_dataset, shuffled with the seed TRAIN_SEED + epoch, so every epoch's order
+    depends only on the seed and the epoch number. The run is checkpointed to TRAIN_CHECKPOINT_DIR after
+    every epoch. If the last run with the same epochs, batch size, seed, dataset content and model architecture was
+    interrupted, training continues from its last finished epoch; the checkpoint is removed once the model
+    is saved. A resumed run therefore sees the same batches as an uninterrupted one and ends with the same
+    model.
+    """
+    started = time.time()
+    (train_images, train_labels), (test_images, test_labels) = load_fashion_mnist(TRAIN_DATA_DIR, TRAIN_CACHE_DIR)
+    test_data = make_dataset(test_images, test_labels, 256)
+
+    keras.utils.set_random_seed(TRAIN_SEED)
+    model = build_model()
+    # The checkpoint directory is shared by every run, so only resume one of the same data and architecture
+    settings = {
+        'epochs': epochs, 'batch_size': TRAIN_BATCH_SIZE, 'seed': TRAIN_SEED, 'samples': len(train_images),
+        'dataset': dataset_fingerprint([train_images, train_labels, test_images, test_labels]),
+        'architecture': architecture_tag(model),
+    }
+    initial_epoch = 0
+    if TRAIN_CHECKPOINT_DIR:
+        resumed, initial_epoch = EpochCheckpoint.resume(TRAIN_CHECKPOINT_DIR, settings)
+        if resumed is not None:
+            model = resumed
+            print(f'Resuming training after epoch {initial_epoch} of {epochs}', flush=True)
 
     # Train the model
-    model.fit(train_images, train_labels, epochs=5, validation_data=(test_images, test_labels))
+    timer = EpochTimer(len(train_images))
+    callbacks = [timer]
+    if TRAIN_CHECKPOINT_DIR:
+        callbacks.append(EpochCheckpoint(TRAIN_CHECKPOINT_DIR, settings))
+    history = None
+    for epoch in range(initial_epoch, epochs):
+        # One fit call per epoch, on data shuffled for that epoch, so resuming does not restart the order
+        train_data = make_dataset(train_images, train_labels, TRAIN_BATCH_SIZE, shuffle_seed=TRAIN_SEED + epoch)
+        history = model.fit(train_data, epochs=epoch + 1, initial_epoch=epoch, validation_data=test_data,
+                            callbacks=callbacks, shuffle=False, verbose=2)
+    val_accuracy = history.history['val_accuracy'][-1] if history is not None else model.evaluate(
+        test_data, return_dict=True, verbose=0)['accuracy']
 
     # Save the model
-    model.save('fashion_mnist_model.h5')
+    os.makedirs(output_dir, exist_ok=True)
+    model.save(os.path.join(output_dir, 'model.h5'))
+    with open(os.path.join(output_dir, 'metadata.json'), 'w') as f:
+        json.dump({
+            'source': 'trained',
+            'epochs': epochs,
+            'batch_size': TRAIN_BATCH_SIZE,
+            'seed': TRAIN_SEED,
+            'dataset': settings['dataset'],
+            'architecture': settings['architecture'],
+            'resumed_after_epoch': initial_epoch,
+            'val_accuracy': float(val_accuracy),
+            'train_seconds': round(time.time() - started, 1),
+            'epoch_timings': timer.epochs,
+        }, f)
+    if TRAIN_CHECKPOINT_DIR:
+        shutil.rmtree(TRAIN_CHECKPOINT_DIR, ignore_errors=True)
+
+# Define class names
+class_names = ['T-shirt/top', 'Trouser', 'Pullover', 'Dress', 'Coat',
+               'Sandal', 'Shirt', 'Sneaker', 'Bag', 'Ankle boot']
+
+# Largest number of images accepted by /predict/batch in one request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1024))
+# Every uploaded image is one multipart form part, so allow at least one part per image
+app.config['MAX_FORM_PARTS'] = max(app.config.get('MAX_FORM_PARTS') or 0, MAX_BATCH_SIZE + 16)
+# Largest request body; bigger uploads are refused with 413 before they are read. Also bounds the
+# uncompressed size of a zip archive sent to /predict/batch.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+
+class ModelManager:
+    """
+    Owns the trained model and the runtime used to run it.
+
+    The model is loaded under a lock, so concurrent first requests load it once, and is warmed up with one
+    dummy forward pass so no request pays for graph tracing. Besides the Keras model itself, two lighter
+    CPU inference paths are available, both exported from the .h5 file on first load into export_dir:
+
+        savedmodel: A SavedModel holding a tf.function with a fixed (None, 28, 28, 1) float32 signature.
+        tflite: A TensorFlow Lite flatbuffer run by the TFLite interpreter. The interpreter is not thread
+                safe, so calls to it are serialized.
+
+    The served model is identified by content_hash, a hash of its .h5 file. Exports are named by it, so a
+    retrained or different model never reuses an export of another one. They are written under a temporary
+    name and renamed into place, so another process or a concurrent activation never loads a half-written
+    export.
+
+    A different model is swapped in with activate(): it is loaded and warmed up while requests keep using
+    the current one, then replaced in a single assignment, so in-flight requests finish on the model they
+    started with.
+
+    Args:
+        path (str): Path of the trained .h5 model, or None if there is none yet.
+        runtime (str): 'keras', 'savedmodel' or 'tflite'.
+        version (int): Registry version of the model at path, if any.
+        export_dir (str): Directory of the SavedModel and TFLite exports. Created when the first is written.
+    """
+
+    RUNTIMES = ('keras', 'savedmodel', 'tflite')
+
+    def __init__(self, path, runtime='keras', version=None, export_dir=MODEL_EXPORT_DIR):
+        if runtime not in self.RUNTIMES:
+            raise ValueError(f"Unknown model runtime '{runtime}', expected one of {', '.join(self.RUNTIMES)}")
+        self.path = path
+        self.version = version
+        self.content_hash = None
+        self.runtime = runtime
+        self.export_dir = export_dir
+        self.model = None
+        self.load_seconds = None
+        self._predict = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load and warm up the model if it is not loaded yet. Returns False if it has not been trained."""
+        if self.model is not None:
+            return True
+        with self._lock:
+            if self.model is None:
+                return self._load_from_disk(self.path, self.version)
+        return True
+
+    def activate(self, path, version=None):
+        """
+        Load and warm up the model at path, then make it the one serving predictions.
+
+        Requests keep using the previous model until the new one is ready.
+
+        Raises:
+            FileNotFoundError: If there is no model at path.
+        """
+        with self._lock:
+            if not self._load_from_disk(path, version):
+                raise FileNotFoundError(f'No model found at {path}')
+
+    def _load_from_disk(self, path, version):
+        if path is None or not os.path.exists(path):
+            return False
+        started = time.perf_counter()
+        content_hash = self._file_hash(path)
+        model = keras.models.load_model(path)
+        predict_fn = getattr(self, f'_load_{self.runtime}')(model, content_hash)
+        predict_fn(np.zeros((1, 28, 28, 1), dtype=np.float32))
+        # Publish the predict function before the model, since load() treats a set model as ready
+        self._predict = predict_fn
+        self.model = model
+        self.path, self.version, self.content_hash = path, version, content_hash
+        self.load_seconds = time.perf_counter() - started
+        MODEL_LOAD_SECONDS.set(self.load_seconds)
+        MODEL_VERSION.set(version or 0)
+        return True
+
+    def get(self):
+        """Return the Keras model, loading it if needed. Returns None if it has not been trained."""
+        return self.model if self.load() else None
+
+    def predict(self, batch):
+        """Run a (N, 28, 28, 1) batch through the model in one call and return (N, 10) probabilities."""
+        if not self.load():
+            raise RuntimeError('Model not found. Please train the model first.')
+        started = time.perf_counter()
+        probabilities = np.asarray(self._predict(np.asarray(batch, dtype=np.float32)))
+        FORWARD_LATENCY.labels(self.runtime).observe(time.perf_counter() - started)
+        BATCH_SIZE.observe(len(probabilities))
+        return probabilities
+
+    @staticmethod
+    def _file_hash(path):
+        """Return a short SHA-256 hex digest of a model file's content."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()[:16]
+
+    def _export_path(self, content_hash, suffix):
+        """Return the export path for a model, named by its content hash, and whether it must be built."""
+        export_path = os.path.join(self.export_dir, content_hash + suffix)
+        return export_path, not os.path.exists(export_path)
+
+    def _publish_export(self, write, export_path):
+        """Build an export with write(temporary path), then rename it into place."""
+        os.makedirs(self.export_dir, exist_ok=True)
+        tmp_path = f'{export_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        write(tmp_path)
+        try:
+            os.replace(tmp_path, export_path)
+        except OSError:
+            # A directory cannot replace a non-empty one: another process published the same export first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _load_keras(self, model, content_hash):
+        return lambda batch: np.asarray(model.predict_on_batch(batch))
+
+    def _load_savedmodel(self, model, content_hash):
+        export_path, stale = self._export_path(content_hash, '_savedmodel')
+        if stale:
+            serving = tf.Module()
+            serving.model = model
+            serving.serve = tf.function(
+                lambda images: model(images, training=False),
+                input_signature=[tf.TensorSpec([None, 28, 28, 1], tf.float32)]
+            )
+            self._publish_export(lambda tmp_path: tf.saved_model.save(serving, tmp_path), export_path)
+        # Keep the loaded object referenced, since its function only holds weak references to the variables
+        exported = tf.saved_model.load(export_path)
+        return lambda batch: exported.serve(batch).numpy()
+
+    def _load_tflite(self, model, content_hash):
+        export_path, stale = self._export_path(content_hash, '.tflite')
+        if stale:
+            flatbuffer = tf.lite.TFLiteConverter.from_keras_model(model).convert()
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    f.write(flatbuffer)
+            self._publish_export(write, export_path)
+        interpreter = tf.lite.Interpreter(model_path=export_path)
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        interpreter.allocate_tensors()
+        interpreter_lock = threading.Lock()
+
+        def predict_fn(batch):
+            with interpreter_lock:
+                if interpreter.get_input_details()[0]['shape'][0] != len(batch):
+                    interpreter.resize_tensor_input(input_index, batch.shape)
+                    interpreter.allocate_tensors()
+                interpreter.set_tensor(input_index, batch)
+                interpreter.invoke()
+                return interpreter.get_tensor(output_index).copy()
+        return predict_fn
+
+class ModelRegistry:
+    """
+    Versioned model artifacts on local disk.
+
+    Each version is a directory holding model.h5 and metadata.json. Versions are numbered in the order
+    they were added and never modified; inference exports built from them are kept in MODEL_EXPORT_DIR.
+    registry.json records the active version, whether it is pinned, and the history of activated versions
+    used for rollback. Directories and registry.json are written
+    under a temporary name and renamed into place, so a crash never leaves a half-written version.
+
+    Layout:
+        <root>/v1/model.h5, <root>/v1/metadata.json, ..., <root>/registry.json
+
+    Args:
+        root (str): Directory holding the registry. Created if it does not exist.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, f'v{version}')
+
+    def path(self, version):
+        """Return the model.h5 path of a version."""
+        return os.path.join(self._version_dir(version), 'model.h5')
+
+    def _version_numbers(self):
+        return sorted(int(name[1:]) for name in os.listdir(self.root)
+                      if name.startswith('v') and name[1:].isdigit())
+
+    def versions(self):
+        """Return every version's metadata, oldest first."""
+        versions = []
+        for version in self._version_numbers():
+            with open(os.path.join(self._version_dir(version), 'metadata.json')) as f:
+                versions.append(json.load(f))
+        return versions
+
+    def state(self):
+        """Return {'active', 'pinned', 'history'}; active is None while the registry is empty."""
+        try:
+            with open(os.path.join(self.root, 'registry.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'active': None, 'pinned': False, 'history': []}
+
+    def _write_state(self, state):
+        temp_path = os.path.join(self.root, f'.registry-{uuid.uuid4().hex}.json')
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, os.path.join(self.root, 'registry.json'))
+
+    def staging_dir(self):
+        """Return a new temporary directory to write a model into before it is added with commit()."""
+        return os.path.join(self.root, f'.staging-{uuid.uuid4().hex}')
+
+    def commit(self, staging_dir):
+        """Add a model written to a staging directory as the next version and return its number."""
+        with self._lock:
+            numbers = self._version_numbers()
+            version = numbers[-1] + 1 if numbers else 1
+            metadata_path = os.path.join(staging_dir, 'metadata.json')
+            metadata = {}
+            if os.path.exists(metadata_path):
+                with open(metadata_path) as f:
+                    metadata = json.load(f)
+            metadata.update({'version': version, 'created_at': time.time()})
+            with open(metadata_path, 'w') as f:
+                json.dump(metadata, f)
+            os.rename(staging_dir, self._version_dir(version))
+        return version
+
+    def import_model(self, model_path, source='imported'):
+        """Copy an existing .h5 model into the registry as the next version and return its number."""
+        staging_dir = self.staging_dir()
+        os.makedirs(staging_dir)
+        shutil.copy2(model_path, os.path.join(staging_dir, 'model.h5'))
+        with open(os.path.join(staging_dir, 'metadata.json'), 'w') as f:
+            json.dump({'source': source, 'imported_from': os.path.abspath(model_path)}, f)
+        return self.commit(staging_dir)
+
+    def set_active(self, version, pinned=None, rollback=False):
+        """
+        Record version as the active one.
+
+        Args:
+            version (int): Version now serving predictions.
+            pinned (bool): New pinned flag, or None to keep the current one.
+            rollback (bool): Drop the current version from the history instead of adding the new one.
+        """
+        with self._lock:
+            state = self.state()
+            if rollback:
+                state['history'] = state['history'][:-1]
+            elif not state['history'] or state['history'][-1] != version:
+                state['history'].append(version)
+            state['active'] = version
+            if pinned is not None:
+                state['pinned'] = pinned
+            self._write_state(state)
+
+class TrainingInProgress(Exception):
+    """Raised when training is requested while a training run is still going."""
+
+class Trainer:
+    """
+    Trains new model versions in a background process.
+
+    Training runs as a separate Python process ('app.py --train-to <dir>'), so the server's threads, GIL
+    and memory are not tied up by it. When the process succeeds, its output is added to the registry and
+    on_trained(version) is called from a watcher thread.
+
+    Args:
+        registry (ModelRegistry): Where trained models are added.
+        on_trained (callable): Called with the new version number after it has been added.
+        epochs (int): Training epochs per run.
+    """
+
+    def __init__(self, registry, on_trained, epochs=5):
+        self.registry = registry
+        self.on_trained = on_trained
+        self.epochs = epochs
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {'status': 'idle'}
+
+    def start(self):
+        """
+        Start a training run and return its status.
+
+        Raises:
+            TrainingInProgress: If a training run is already going.
+        """
+        with self._lock:
+            if self._status['status'] == 'running':
+                raise TrainingInProgress('A model is already being trained.')
+            staging_dir = self.registry.staging_dir()
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--train-to', staging_dir, '--epochs', str(self.epochs)],
+                env=dict(os.environ, MODEL_PRELOAD='false')
+            )
+            self._status = {'status': 'running', 'pid': process.pid, 'started_at': time.time()}
+            self._thread = threading.Thread(target=self._watch, args=(process, staging_dir), daemon=True)
+            self._thread.start()
+            return dict(self._status)
+
+    def _watch(self, process, staging_dir):
+        returncode = process.wait()
+        status = dict(self._status, finished_at=time.time())
+        try:
+            if returncode != 0:
+                raise RuntimeError(f'Training process exited with code {returncode}')
+            status['version'] = self.registry.commit(staging_dir)
+            self.on_trained(status['version'])
+            status['status'] = 'succeeded'
+        except Exception as e:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            status.update(status='failed', error=str(e))
+        with self._lock:
+            self._status = status
+
+    def wait(self, timeout=None):
+        """Block until the current training run has finished."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self):
+        """Return the state of the current or last training run."""
+        with self._lock:
+            return dict(self._status)
+
+model_registry = ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', 'models'))
+# Adopt a model trained before the registry existed as its first version
+if model_registry.state()['active'] is None and os.path.exists('fashion_mnist_model.h5'):
+    model_registry.set_active(model_registry.import_model('fashion_mnist_model.h5'))
+
+active_version = model_registry.state()['active']
+model_manager = ModelManager(
+    model_registry.path(active_version) if active_version else None,
+    runtime=os.environ.get('MODEL_RUNTIME', 'keras'),
+    version=active_version
+)
+# Load and warm up the model at startup so the first request does not pay for it
+if os.environ.get('MODEL_PRELOAD', 'true').lower() != 'false':
+    model_manager.load()
+
+# Serializes activations so the registry state always matches the model being served
+activation_lock = threading.Lock()
+
+def _activate(version, pinned=None, rollback=False):
+    model_manager.activate(model_registry.path(version), version=version)
+    model_registry.set_active(version, pinned=pinned, rollback=rollback)
+    if prediction_cache is not None:
+        prediction_cache.invalidate(model_manager.content_hash)
+
+def activate_version(version, pinned=None):
+    """Load and warm up a registry version, swap it into the serving path and record it as active."""
+    with activation_lock:
+        _activate(version, pinned=pinned)
+
+def activate_trained(version):
+    """Serve a newly trained version, unless a version has been pinned."""
+    with activation_lock:
+        if not model_registry.state()['pinned']:
+            _activate(version)
+
+def rollback_version():
+    """Serve and pin the version that was active before the current one. Returns it, or None if there is none."""
+    with activation_lock:
+        history = model_registry.state()['history']
+        if len(history) < 2:
+            return None
+        _activate(history[-2], pinned=True, rollback=True)
+        return history[-2]
+
+trainer = Trainer(model_registry, activate_trained, epochs=int(os.environ.get('TRAIN_EPOCHS', 5)))
 
 # Set up a route to train the model
 @app.route('/train', methods=['POST'])
 def train():
+    """
+    Train a new model version in the background.
+
+    The new version is served as soon as it is trained and warmed up, unless a version is pinned.
+    With wait=true the request blocks until training has finished.
+    """
     try:
-        train_model()
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
-    return jsonify({'message': 'Model trained and saved successfully'}), 200
+        status = trainer.start()
+    except TrainingInProgress as e:
+        return jsonify({'error': str(e), **trainer.status()}), 409
+    if request.values.get('wait', 'false').lower() == 'true':
+        trainer.wait()
+        status = trainer.status()
+        if status['status'] != 'succeeded':
+            return jsonify(status), 400
+        return jsonify({'message': 'Model trained and saved successfully', **status}), 200
+    return jsonify({**status, 'status_url': '/train/status'}), 202
 
-# Load the model (this will be updated after training)
-model = None
+# Set up a route to report training progress
+@app.route('/train/status', methods=['GET'])
+def train_status():
+    return jsonify(trainer.status())
 
-# Define class names
-class_names = ['T-shirt/top', 'Trouser', 'Pullover', 'Dress', 'Coat',
-               'Sandal', 'Shirt', 'Sneaker', 'Bag', 'Ankle boot']
+# Set up a route to list model versions
+@app.route('/models', methods=['GET'])
+def list_models():
+    state = model_registry.state()
+    return jsonify({
+        'active': state['active'],
+        'serving': model_manager.version,
+        'pinned': state['pinned'],
+        'history': state['history'],
+        'versions': model_registry.versions(),
+    })
+
+# Set up a route to pin a model version
+@app.route('/models/<int:version>/pin', methods=['POST'])
+def pin_model(version):
+    """Serve the given version and keep serving it when new versions are trained."""
+    if not os.path.exists(model_registry.path(version)):
+        return jsonify({'error': f'Model version {version} not found'}), 404
+    activate_version(version, pinned=True)
+    return jsonify({'active': version, 'pinned': True})
+
+# Set up a route to unpin the served model version
+@app.route('/models/unpin', methods=['POST'])
+def unpin_model():
+    """Go back to serving the newest version, and serve new versions as they are trained."""
+    versions = model_registry.versions()
+    if not versions:
+        return jsonify({'error': 'No model versions found'}), 404
+    activate_version(versions[-1]['version'], pinned=False)
+    return jsonify({'active': versions[-1]['version'], 'pinned': False})
+
+# Set up a route to roll back to the previous model version
+@app.route('/models/rollback', methods=['POST'])
+def rollback_model():
+    """Serve the version that was active before the current one and pin it."""
+    version = rollback_version()
+    if version is None:
+        return jsonify({'error': 'No previous model version to roll back to'}), 409
+    return jsonify({'active': version, 'pinned': True})
+
+def get_model():
+    """Return the trained Keras model, loading it if needed. Returns None if it has not been trained."""
+    return model_manager.get()
+
+def scale_pixels(pixels):
+    """Scale a uint8 array to [0, 1] as float32, with a single allocation for the result."""
+    scaled = pixels.astype(np.float32)
+    scaled *= np.float32(1 / 255.0)
+    return scaled
+
+def preprocess_image(img_bytes):
+    """Decode an image, convert it to 28x28 grayscale and scale it to [0, 1]. Returns a (28, 28, 1) array."""
+    image = Image.open(io.BytesIO(img_bytes))
+    if image.mode != 'L':
+        image = image.convert('L')
+    if image.size != (28, 28):
+        image = image.resize((28, 28))
+    return scale_pixels(np.asarray(image)).reshape(28, 28, 1)
+
+def preprocess_raw(data, shape=None):
+    """
+    Read raw uint8 pixels into a (N, 28, 28, 1) float32 batch.
+
+    The bytes are viewed in place with np.frombuffer; the only copy made is the scaled float32 batch.
+
+    Args:
+        data (bytes): Row-major uint8 pixels, 784 bytes per image.
+        shape (str): Optional comma separated shape, e.g. '28,28' or '64,28,28'. Inferred from the length if
+                     not given.
+    """
+    if shape:
+        dims = tuple(int(dim) for dim in shape.split(','))
+    elif len(data) == 0 or len(data) % (28 * 28):
+        raise ValueError(f'Expected a non-empty multiple of {28 * 28} bytes, got {len(data)}')
+    else:
+        dims = (len(data) // (28 * 28), 28, 28)
+    if len(dims) == 2:
+        dims = (1,) + dims
+    if dims[1:3] != (28, 28) or len(dims) not in (3, 4) or (len(dims) == 4 and dims[3] != 1):
+        raise ValueError(f'Expected images of shape (N, 28, 28) or (N, 28, 28, 1), got {dims}')
+    if len(data) != int(np.prod(dims)) or len(data) == 0:
+        raise ValueError(f'Expected {int(np.prod(dims))} bytes for shape {dims}, got {len(data)}')
+    return scale_pixels(np.frombuffer(data, dtype=np.uint8)).reshape(-1, 28, 28, 1)
+
+def read_raw_request():
+    """Return the (N, 28, 28, 1) batch sent as an application/octet-stream body, or None for other requests."""
+    if request.mimetype != 'application/octet-stream':
+        return None
+    return preprocess_raw(request.get_data(), request.headers.get('X-Image-Shape'))
+
+def preprocess_array(array):
+    """
+    Turn a packed NumPy array of images into a (N, 28, 28, 1) batch.
+
+    uint8 arrays are scaled by 1/255; float arrays are assumed to be scaled to [0, 1] already.
+    """
+    if array.ndim == 2:
+        array = array[np.newaxis]
+    if array.shape[1:3] != (28, 28) or array.ndim not in (3, 4) or (array.ndim == 4 and array.shape[3] != 1):
+        raise ValueError(f'Expected images of shape (N, 28, 28) or (N, 28, 28, 1), got {array.shape}')
+    if array.dtype == np.uint8:
+        array = scale_pixels(array)
+    return array.astype(np.float32, copy=False).reshape(-1, 28, 28, 1)
+
+class TooManyImages(ValueError):
+    """Raised when an upload holds more images than a batch may have."""
+
+    def __init__(self, count, maximum):
+        super().__init__(f'Too many images: at least {count} (maximum {maximum})')
+
+def npy_image_count(data):
+    """Return the number of images in a .npy file from its header, without reading the array."""
+    header_readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    stream = io.BytesIO(data)
+    version = np.lib.format.read_magic(stream)
+    if version not in header_readers:
+        raise ValueError(f'Unsupported .npy format version {version}')
+    shape, _, _ = header_readers[version](stream)
+    return 1 if len(shape) == 2 else (shape[0] if shape else 0)
+
+def collect_batch(files, max_images=None, max_unpacked_bytes=None):
+    """
+    Preprocess every uploaded file into one batch.
+
+    Each file may be an image, a .npy array of images, or a .zip archive of images. Images are counted
+    before any of them is decoded: from the .npy header and the zip directory. So an upload over the limit
+    is rejected without decompressing or scaling anything.
+
+    Args:
+        max_images (int): Most images accepted; more raise TooManyImages.
+        max_unpacked_bytes (int): Largest total uncompressed size of a zip archive's members.
+
+    Returns:
+        tuple: (names, batch) where names labels each image and batch is a (N, 28, 28, 1) array.
+    """
+    count = 0
+
+    def admit(images):
+        nonlocal count
+        count += images
+        if max_images is not None and count > max_images:
+            raise TooManyImages(count, max_images)
+
+    names, arrays = [], []
+    for file in files:
+        filename = file.filename or 'image'
+        if filename.endswith('.npy'):
+            data = file.read()
+            admit(npy_image_count(data))
+            images = preprocess_array(np.load(io.BytesIO(data), allow_pickle=False))
+            names.extend(f'{filename}[{i}]' for i in range(len(images)))
+            arrays.append(images)
+        elif filename.endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(file.read())) as archive:
+                members = sorted((info for info in archive.infolist() if not info.is_dir()),
+                                 key=lambda info: info.filename)
+                admit(len(members))
+                # Reads stop at each member's recorded size, so this bounds what is decompressed
+                unpacked = sum(info.file_size for info in members)
+                if max_unpacked_bytes is not None and unpacked > max_unpacked_bytes:
+                    raise ValueError(f'{filename} unpacks to {unpacked} bytes (maximum {max_unpacked_bytes})')
+                for info in members:
+                    names.append(info.filename)
+                    arrays.append(preprocess_image(archive.read(info))[np.newaxis])
+        else:
+            admit(1)
+            names.append(filename)
+            arrays.append(preprocess_image(file.read())[np.newaxis])
+    if not arrays:
+        return names, np.empty((0, 28, 28, 1))
+    return names, np.concatenate(arrays)
+
+class MicroBatcher:
+    """
+    Collects concurrent single-image predictions into batches for the model.
+
+    Requests put their preprocessed image on a queue and wait. A background thread takes the first
+    waiting image, keeps collecting until max_batch_size images are queued or max_wait_ms has passed
+    since the first one arrived, runs the whole batch through the model in one call and hands each
+    request its own row of the output.
+
+    Args:
+        predict_fn (callable): Maps a (N, 28, 28, 1) array to a (N, 10) array of class probabilities.
+        max_batch_size (int): Largest batch sent to predict_fn.
+        max_wait_ms (float): Longest time the first image of a batch waits for more to arrive.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._histogram = {}
+        self._wait_seconds = 0.0
+        self._wait_seconds_max = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def predict(self, image, timeout=30.0):
+        """Queue one (28, 28, 1) image and block until its (10,) probability row is ready."""
+        self._start()
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            started = time.perf_counter()
+            try:
+                probabilities = self.predict_fn(np.stack([image for image, _, _ in items]))
+                for row, (_, future, _) in zip(probabilities, items):
+                    future.set_result(row)
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+            self._record(items, started)
+
+    def _record(self, items, started):
+        # Histogram buckets are powers of two: a batch of 5 images is counted under 8.
+        bucket = 1
+        while bucket < len(items):
+            bucket *= 2
+        waits = [started - queued_at for _, _, queued_at in items]
+        for wait in waits:
+            QUEUE_WAIT.observe(wait)
+        with self._lock:
+            self._batches += 1
+            self._images += len(items)
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+            self._wait_seconds += sum(waits)
+            self._wait_seconds_max = max(self._wait_seconds_max, max(waits))
+
+    def stats(self):
+        """Return queue depth, batch counts, the batch-size histogram and queue wait times."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self._batches,
+                'images': self._images,
+                'mean_batch_size': round(self._images / self._batches, 2) if self._batches else 0.0,
+                'batch_size_histogram': {str(bucket): count for bucket, count in sorted(self._histogram.items())},
+                'queue_wait_ms_avg': round(1000 * self._wait_seconds / self._images, 3) if self._images else 0.0,
+                'queue_wait_ms_max': round(1000 * self._wait_seconds_max, 3),
+            }
+
+class PredictionCache:
+    """
+    Remembers the /predict result for each distinct image, so repeated uploads skip the model.
+
+    Entries are keyed by a SHA-256 digest of the image and the content hash of the model that produced them
+    (ModelManager.content_hash), not its registry version number, so a rebuilt or renumbered registry can
+    never serve another model's results. Once another model is activated earlier entries are never
+    returned; invalidate() then drops them. Whether
+    the digest is taken over the uploaded bytes or the normalized tensor is up to the caller: key_on records
+    the choice. Hashing the bytes also skips decoding on a hit; hashing the tensor also matches the same
+    image encoded differently.
+
+    In memory, at most capacity entries are kept in least-recently-used order, each valid for ttl seconds
+    after it was stored. With a db_path every entry is also written to a SQLite file, which is consulted on
+    an in-memory miss, so results survive restarts and LRU evictions.
+
+    Args:
+        capacity (int): Most entries kept in memory.
+        ttl (float): Seconds an entry stays valid; 0 keeps it until it is evicted or invalidated.
+        key_on (str): 'bytes' or 'tensor'.
+        db_path (str): Optional SQLite file backing the in-memory entries.
+    """
+
+    KEY_MODES = ('bytes', 'tensor')
+
+    def __init__(self, capacity=10000, ttl=3600.0, key_on='bytes', db_path=None):
+        if key_on not in self.KEY_MODES:
+            raise ValueError(f"Unknown cache key '{key_on}', expected one of {', '.join(self.KEY_MODES)}")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.key_on = key_on
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._lookups = {'memory': 0, 'disk': 0, 'miss': 0}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            # One connection shared under the cache lock; autocommit, since every write is a single statement
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # Files written when entries were keyed by version number cannot be trusted, so start them over
+            if 'version' in {row[1] for row in self._db.execute('PRAGMA table_info(predictions)')}:
+                self._db.execute('DROP TABLE predictions')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS predictions (model TEXT NOT NULL, digest TEXT NOT NULL, '
+                'class TEXT NOT NULL, confidence REAL NOT NULL, stored_at REAL NOT NULL, '
+                'PRIMARY KEY (model, digest))'
+            )
+
+    @staticmethod
+    def digest(data):
+        """Return the cache key of a bytes-like object, such as an upload or an array's buffer."""
+        return hashlib.sha256(data).hexdigest()
+
+    def _expired(self, stored_at, now):
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def _remember(self, key, result, stored_at):
+        self._entries[key] = (result, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def _count(self, result):
+        self._lookups[result] += 1
+        CACHE_LOOKUPS.labels(result).inc()
+
+    def get(self, digest, model_hash):
+        """Return the cached {'class', 'confidence'} of an image under a model's content hash, or None."""
+        now = time.time()
+        key = (model_hash, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._entries.move_to_end(key)
+                self._count('memory')
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+                CACHE_ENTRIES.set(len(self._entries))
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT class, confidence, stored_at FROM predictions WHERE model = ? AND digest = ?', key
+                ).fetchone()
+                if row is not None and not self._expired(row[2], now):
+                    result = {'class': row[0], 'confidence': row[1]}
+                    self._remember(key, result, row[2])
+                    self._count('disk')
+                    return result
+                if row is not None:
+                    self._db.execute('DELETE FROM predictions WHERE model = ? AND digest = ?', key)
+            self._count('miss')
+            return None
+
+    def put(self, digest, model_hash, result):
+        """Store the {'class', 'confidence'} result of an image under the producing model's content hash."""
+        now = time.time()
+        key = (model_hash, digest)
+        with self._lock:
+            self._remember(key, result, now)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)',
+                                 key + (result['class'], result['confidence'], now))
+
+    def invalidate(self, model_hash):
+        """Drop every entry that was not produced by the model with the given content hash."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] != model_hash]:
+                del self._entries[key]
+            CACHE_ENTRIES.set(len(self._entries))
+            if self._db is not None:
+                self._db.execute('DELETE FROM predictions WHERE model IS NOT ?', (model_hash,))
+
+    def stats(self):
+        """Return the cache's settings, size, lookup counts and hit rate."""
+        with self._lock:
+            lookups = sum(self._lookups.values())
+            hits = self._lookups['memory'] + self._lookups['disk']
+            return {
+                'capacity': self.capacity,
+                'ttl_seconds': self.ttl,
+                'key': self.key_on,
+                'disk': self.db_path is not None,
+                'entries': len(self._entries),
+                'hits_memory': self._lookups['memory'],
+                'hits_disk': self._lookups['disk'],
+                'misses': self._lookups['miss'],
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+def predict_probabilities(batch):
+    """Run a (N, 28, 28, 1) batch through the current model in a single call."""
+    return model_manager.predict(batch)
+
+# Concurrent /predict calls share model calls through the micro-batcher, unless it is disabled
+batcher = None
+if os.environ.get('MICROBATCH_ENABLED', 'true').lower() != 'false':
+    batcher = MicroBatcher(
+        predict_probabilities,
+        max_batch_size=int(os.environ.get('MICROBATCH_MAX_SIZE', 32)),
+        max_wait_ms=float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 5))
+    )
+
+# Repeated /predict uploads are answered from the prediction cache, unless it is disabled
+prediction_cache = None
+if int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)) > 0:
+    prediction_cache = PredictionCache(
+        capacity=int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)),
+        ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+        key_on=os.environ.get('PREDICTION_CACHE_KEY', 'bytes'),
+        db_path=os.environ.get('PREDICTION_CACHE_DB')
+    )
+    # Entries made by a model that is no longer served, e.g. before a restart, are of no further use. A model
+    # that is not loaded yet has no content hash, so keep the entries until it is.
+    if model_manager.content_hash is not None:
+        prediction_cache.invalidate(model_manager.content_hash)
+
+# Time and count every request, and profile the ones that ask for it when PROFILE_DIR is set
+profile_dir = os.environ.get('PROFILE_DIR')
+
+@app.before_request
+def start_request():
+    g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.labels(g.metrics_route).inc()
+    if profile_dir and request.headers.get('X-Profile', '').lower() == 'true':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%dT%H%M%S')}_{request.endpoint}_{uuid.uuid4().hex[:8]}.prof"
+        profiler.dump_stats(os.path.join(profile_dir, filename))
+        response.headers['X-Profile-File'] = filename
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(error):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    route = g.pop('metrics_route')
+    REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+    REQUESTS.labels(request.method, route, str(g.pop('metrics_status', 500))).inc()
+    IN_FLIGHT.labels(route).dec()
+
+# Set up a route for metrics
+@app.route('/metrics', methods=['GET'])
+def service_metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
 # Set up a route for prediction
 @app.route('/predict', methods=['POST'])
 def predict():
-    global model
-    if model is None:
-        if os.path.exists('fashion_mnist_model.h5'):
-            model = keras.models.load_model('fashion_mnist_model.h5')
-        else:
-            return jsonify({'error': 'Model not found. Please train the model first.'}), 400
+    current_model = get_model()
+    if current_model is None:
+        return jsonify({'error': 'Model not found. Please train the model first.'}), 400
 
-    if 'file' not in request.files:
+    # Results are cached per model content hash; read it before predicting so a concurrent swap is not cached
+    model_hash = model_manager.content_hash
+    cache_key = None
+    if request.mimetype == 'application/octet-stream':
+        # The shape header is part of the request, so it is part of the key
+        upload = request.headers.get('X-Image-Shape', '').encode() + b'\n' + request.get_data()
+    elif 'file' in request.files:
+        upload = request.files['file'].read()
+    else:
         return jsonify({'error': 'No file provided'}), 400
-    file = request.files['file']
-    img_bytes = file.read()
-    # Preprocess the image
-    image = Image.open(io.BytesIO(img_bytes)).convert('L')
-    image = image.resize((28, 28))
-    image = np.array(image) / 255.0
-    image = image.reshape(1, 28, 28, 1)
+    if prediction_cache is not None and prediction_cache.key_on == 'bytes':
+        cache_key = prediction_cache.digest(upload)
+        cached = prediction_cache.get(cache_key, model_hash)
+        if cached is not None:
+            return jsonify(cached)
+
+    started = time.perf_counter()
+    try:
+        raw = read_raw_request()
+    except ValueError as e:
+        return jsonify({'error': f'Could not read image: {str(e)}'}), 400
+    if raw is not None:
+        if len(raw) != 1:
+            return jsonify({'error': 'Send exactly one image to /predict; use /predict/batch for more'}), 400
+        image = raw[0]
+    else:
+        # Preprocess the image
+        try:
+            image = preprocess_image(upload)
+        except Exception as e:
+            return jsonify({'error': f'Could not read image: {str(e)}'}), 400
+    PREPROCESS_LATENCY.labels('/predict').observe(time.perf_counter() - started)
+    if prediction_cache is not None and cache_key is None:
+        cache_key = prediction_cache.digest(image)
+        cached = prediction_cache.get(cache_key, model_hash)
+        if cached is not None:
+            return jsonify(cached)
     # Make prediction
-    predictions = model.predict(image)
-    predicted_class = class_names[np.argmax(predictions[0])]
-    confidence = float(np.max(predictions[0]))
-    return jsonify({'class': predicted_class, 'confidence': confidence})
+    if batcher is not None:
+        probabilities = batcher.predict(image)
+    else:
+        probabilities = model_manager.predict(image.reshape(1, 28, 28, 1))[0]
+    result = {'class': class_names[np.argmax(probabilities)], 'confidence': float(np.max(probabilities))}
+    if prediction_cache is not None and model_manager.content_hash == model_hash:
+        prediction_cache.put(cache_key, model_hash, result)
+    return jsonify(result)
+
+# Set up a route for micro-batching statistics
+@app.route('/batcher-stats', methods=['GET'])
+def batcher_stats():
+    if batcher is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **batcher.stats()})
+
+# Set up a route for prediction cache statistics
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    if prediction_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **prediction_cache.stats()})
+
+# Set up a route for batch prediction
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict the classes of many images with a single forward pass.
+
+    Images are sent as multipart form fields named 'files' (or 'file'), each holding an image, a .npy
+    array of 28x28 images, or a .zip archive of images. Producers that already hold pixel arrays can
+    instead send raw uint8 bytes as an application/octet-stream body. All images are preprocessed into
+    one array and classified with one model call.
+
+    Returns:
+        Response: A JSON response with one {'name', 'class', 'confidence'} entry per image, in upload order.
+    """
+    current_model = get_model()
+    if current_model is None:
+        return jsonify({'error': 'Model not found. Please train the model first.'}), 400
+
+    if request.mimetype == 'application/octet-stream' and (request.content_length or 0) > MAX_BATCH_SIZE * 28 * 28:
+        return jsonify({'error': str(TooManyImages(request.content_length // (28 * 28), MAX_BATCH_SIZE))}), 400
+    started = time.perf_counter()
+    try:
+        batch = read_raw_request()
+    except ValueError as e:
+        return jsonify({'error': f'Could not read images: {str(e)}'}), 400
+    if batch is not None:
+        names = [f'raw[{i}]' for i in range(len(batch))]
+    else:
+        files = request.files.getlist('files') + request.files.getlist('file')
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        try:
+            names, batch = collect_batch(
+                files, max_images=MAX_BATCH_SIZE, max_unpacked_bytes=app.config['MAX_CONTENT_LENGTH']
+            )
+        except TooManyImages as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': f'Could not read images: {str(e)}'}), 400
+    PREPROCESS_LATENCY.labels('/predict/batch').observe(time.perf_counter() - started)
+    if len(batch) == 0:
+        return jsonify({'error': 'No images found in the upload'}), 400
+    if len(batch) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many images: {len(batch)} (maximum {MAX_BATCH_SIZE})'}), 400
+
+    predictions = model_manager.predict(batch)
+    predicted = np.argmax(predictions, axis=1)
+    confidences = np.max(predictions, axis=1)
+    return jsonify({
+        'count': len(names),
+        'predictions': [
+            {'name': name, 'class': class_names[index], 'confidence': float(confidence)}
+            for name, index, confidence in zip(names, predicted, confidences)
+        ]
+    })
 
 if __name__ == '__main__':
-    if not os.path.exists('fashion_mnist_model.h5'):
+    parser = argparse.ArgumentParser(description='Fashion MNIST training and prediction server.')
+    parser.add_argument('--train-to', help='Train a model into this directory and exit, instead of serving')
+    parser.add_argument('--epochs', type=int, default=5, help='Training epochs (default: 5)')
+    args = parser.parse_args()
+    if args.train_to:
+        train_model(args.train_to, epochs=args.epochs)
+        sys.exit(0)
+
+    if model_registry.state()['active'] is None:
         print("Training model...")
-        train_model()
+        staging_dir = model_registry.staging_dir()
+        train_model(staging_dir, epochs=trainer.epochs)
+        activate_version(model_registry.commit(staging_dir))
+    model_manager.load()
     app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,93 @@
+"""
+This script compares prediction throughput of one /predict call per image against /predict/batch.
+It drives the Flask app in-process through its test client, so it needs the trained model but no
+running server. Batches are built by cycling through the PNGs in 'test_images' (realistic decode cost)
+and from random 28x28 uint8 arrays, sent both as a single .npy payload and as a raw application/octet-stream
+body (synthetic).
+Usage:
+    python benchmark_batch.py [--sizes N [N ...]] [--repeats N] [--single-limit N]
+Arguments:
+    --sizes: Batch sizes to benchmark (default: 1 2 4 8 ... 1024).
+    --repeats: Timed repetitions per batch size; the best run is reported (default: 3).
+    --single-limit: Largest batch size also measured with one /predict call per image (default: 256).
+Example:
+    python benchmark_batch.py --sizes 1 32 1024
+"""
+import io
+import os
+import glob
+import time
+import argparse
+import numpy as np
+from tensorflow import keras
+import app
+
+
+def best_time(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(sizes, repeats, single_limit):
+    keras.utils.disable_interactive_logging()
+    client = app.app.test_client()
+    image_paths = sorted(glob.glob(os.path.join('test_images', '*.png')))
+    images = [open(path, 'rb').read() for path in image_paths]
+    if not images:
+        raise SystemExit("No PNG files found in 'test_images'. Run get_test_images.py first.")
+
+    def post_single(count):
+        for i in range(count):
+            response = client.post('/predict', data={'file': (io.BytesIO(images[i % len(images)]), 'image.png')})
+            assert response.status_code == 200, response.json
+
+    def post_batch(count):
+        files = [(io.BytesIO(images[i % len(images)]), f'image_{i}.png') for i in range(count)]
+        response = client.post('/predict/batch', data={'files': files})
+        assert response.status_code == 200, response.json
+
+    def post_synthetic(payload):
+        response = client.post('/predict/batch', data={'files': (io.BytesIO(payload), 'batch.npy')})
+        assert response.status_code == 200, response.json
+
+    def post_raw(pixels):
+        response = client.post('/predict/batch', data=pixels.tobytes(), content_type='application/octet-stream',
+                               headers={'X-Image-Shape': ','.join(map(str, pixels.shape))})
+        assert response.status_code == 200, response.json
+
+    # Warm up the model and the request path before timing anything.
+    post_single(1)
+    post_batch(2)
+
+    print(f"{'images':>7} {'single img/s':>13} {'batch img/s':>12} {'speedup':>8} {'npy img/s':>10} {'raw img/s':>10}")
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        pixels = rng.integers(0, 256, size=(size, 28, 28), dtype=np.uint8)
+        buffer = io.BytesIO()
+        np.save(buffer, pixels)
+        payload = buffer.getvalue()
+
+        batch_rate = size / best_time(lambda: post_batch(size), repeats)
+        synthetic_rate = size / best_time(lambda: post_synthetic(payload), repeats)
+        raw_rate = size / best_time(lambda: post_raw(pixels), repeats)
+        if size <= single_limit:
+            single_rate = size / best_time(lambda: post_single(size), repeats)
+            print(f"{size:>7} {single_rate:>13,.0f} {batch_rate:>12,.0f} {batch_rate / single_rate:>7.1f}x "
+                  f"{synthetic_rate:>10,.0f} {raw_rate:>10,.0f}")
+        else:
+            print(f"{size:>7} {'-':>13} {batch_rate:>12,.0f} {'-':>8} {synthetic_rate:>10,.0f} {raw_rate:>10,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark single-image vs batched prediction throughput.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2 ** i for i in range(11)],
+                        help='Batch sizes to benchmark (default: 1 2 4 ... 1024)')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repetitions per size (default: 3)')
+    parser.add_argument('--single-limit', type=int, default=256,
+                        help='Largest size also measured with one /predict call per image (default: 256)')
+    args = parser.parse_args()
+    main(args.sizes, args.repeats, args.single_limit)
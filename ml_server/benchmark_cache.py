@@ -0,0 +1,113 @@
+"""
+This script measures the prediction cache on a stream of /predict requests with a realistic repeat pattern.
+A catalog of distinct product images is built from the PNGs in 'test_images': each catalog item is one of
+them with a few pixels nudged by one grey level and re-encoded, so every item has its own bytes and tensor.
+Requests then pick catalog items with Zipf-distributed popularity (a few items are requested very often,
+most rarely), and the stream is replayed through the Flask test client with the cache disabled, in
+memory, and in memory backed by a SQLite file. Requests run one at a time with the micro-batcher disabled,
+so latencies are those of the request path itself.
+Usage:
+    python benchmark_cache.py [--catalog N] [--requests N] [--zipf S] [--capacity N [N ...]] [--key K]
+Arguments:
+    --catalog: Distinct images in the catalog (default: 1000).
+    --requests: Requests in the replayed stream (default: 5000).
+    --zipf: Zipf exponent of item popularity; higher means more repeats (default: 1.1).
+    --capacity: In-memory cache capacities to test (default: 100 10000).
+    --key: Hash the uploaded 'bytes' or the normalized 'tensor' (default: bytes).
+Example:
+    python benchmark_cache.py --catalog 5000 --requests 20000 --capacity 500 5000
+"""
+import io
+import os
+import glob
+import time
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+from tensorflow import keras
+import app
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_catalog(image_paths, size, rng):
+    """Return size distinct PNGs, each a test image with a few pixels changed by one grey level."""
+    bases = [np.asarray(Image.open(path).convert('L').resize((28, 28)), dtype=np.int16) for path in image_paths]
+    catalog = []
+    for i in range(size):
+        pixels = bases[i % len(bases)].copy()
+        if i >= len(bases):
+            positions = rng.integers(0, 28, size=(4, 2))
+            pixels[positions[:, 0], positions[:, 1]] += rng.choice([-1, 1], size=4)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'PNG')
+        catalog.append(buffer.getvalue())
+    return catalog
+
+
+def zipf_stream(catalog_size, count, exponent, rng):
+    """Return count catalog indices drawn with probability proportional to 1 / rank ** exponent."""
+    weights = 1.0 / np.arange(1, catalog_size + 1) ** exponent
+    return rng.choice(catalog_size, size=count, p=weights / weights.sum())
+
+
+def replay(client, catalog, stream):
+    latencies = []
+    started = time.perf_counter()
+    for index in stream:
+        request_started = time.perf_counter()
+        response = client.post('/predict', data={'file': (io.BytesIO(catalog[index]), 'image.png')})
+        latencies.append(time.perf_counter() - request_started)
+        assert response.status_code == 200, response.json
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def main(catalog_size, request_count, exponent, capacities, key_on):
+    keras.utils.disable_interactive_logging()
+    image_paths = sorted(glob.glob(os.path.join('test_images', '*.png')))
+    if not image_paths:
+        raise SystemExit("No PNG files found in 'test_images'. Run get_test_images.py first.")
+    if app.get_model() is None:
+        raise SystemExit("Model not found. Please train the model first.")
+    rng = np.random.default_rng(0)
+    catalog = build_catalog(image_paths, catalog_size, rng)
+    stream = zipf_stream(catalog_size, request_count, exponent, rng)
+    client = app.app.test_client()
+    app.batcher = None
+    # Warm up the model and the request path before timing anything.
+    app.prediction_cache = None
+    replay(client, catalog, stream[:3])
+
+    print(f"catalog={catalog_size} requests={request_count} zipf={exponent} key={key_on} "
+          f"distinct requested={len(set(stream.tolist()))}")
+    print(f"{'mode':>8} {'capacity':>9} {'req/sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'hit rate':>9} "
+          f"{'memory':>7} {'disk':>6}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        modes = [('off', None)] + [(mode, capacity) for capacity in capacities for mode in ('memory', 'disk')]
+        for mode, capacity in modes:
+            app.prediction_cache = None if mode == 'off' else app.PredictionCache(
+                capacity=capacity, ttl=0, key_on=key_on,
+                db_path=os.path.join(tmp_dir, f'cache_{capacity}.sqlite3') if mode == 'disk' else None
+            )
+            elapsed, latencies = replay(client, catalog, stream)
+            stats = app.prediction_cache.stats() if app.prediction_cache is not None else {}
+            print(f"{mode:>8} {capacity or '-':>9} {len(stream) / elapsed:>9,.0f} "
+                  f"{1000 * percentile(latencies, 0.50):>8.2f} {1000 * percentile(latencies, 0.95):>8.2f} "
+                  f"{stats.get('hit_rate', 0.0):>9.1%} {stats.get('hits_memory', 0):>7} {stats.get('hits_disk', 0):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the /predict result cache on a Zipf request stream.')
+    parser.add_argument('--catalog', type=int, default=1000, help='Distinct images in the catalog (default: 1000)')
+    parser.add_argument('--requests', type=int, default=5000, help='Requests in the stream (default: 5000)')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of popularity (default: 1.1)')
+    parser.add_argument('--capacity', type=int, nargs='+', default=[100, 10000],
+                        help='In-memory cache capacities to test (default: 100 10000)')
+    parser.add_argument('--key', choices=app.PredictionCache.KEY_MODES, default='bytes',
+                        help="Hash the uploaded 'bytes' or the normalized 'tensor' (default: bytes)")
+    args = parser.parse_args()
+    main(args.catalog, args.requests, args.zipf, args.capacity, args.key)
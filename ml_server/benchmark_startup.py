@@ -0,0 +1,85 @@
+"""
+This script measures startup time and first-request latency of the server for each model loading mode.
+Every configuration runs in a fresh Python process, so each one pays the full cost of importing TensorFlow
+and loading the model. A process imports app (startup), sends its first /predict request through the Flask
+test client, then sends more requests to measure steady-state latency. Configurations:
+    lazy keras: The model is loaded on the first request (MODEL_PRELOAD=false), as the server used to.
+    eager keras / savedmodel / tflite: The model is loaded and warmed up at startup with the given runtime.
+Micro-batching is disabled so every request runs the model directly. The SavedModel and TFLite exports
+are built on the first run and included in its load time, so run the script twice for a steady-state view.
+Usage:
+    python benchmark_startup.py [--requests N]
+Arguments:
+    --requests: Steady-state requests timed after the first one (default: 50).
+"""
+import io
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import subprocess
+
+CONFIGURATIONS = [
+    ('lazy', 'keras'),
+    ('eager', 'keras'),
+    ('eager', 'savedmodel'),
+    ('eager', 'tflite'),
+]
+
+
+def measure(requests):
+    """Runs inside the child process and prints its timings as JSON."""
+    started = time.perf_counter()
+    import app
+    startup = time.perf_counter() - started
+
+    client = app.app.test_client()
+    image_path = sorted(glob.glob(os.path.join('test_images', '*.png')))[0]
+    image = open(image_path, 'rb').read()
+
+    def post():
+        began = time.perf_counter()
+        response = client.post('/predict', data={'file': (io.BytesIO(image), 'image.png')})
+        assert response.status_code == 200, response.json
+        return time.perf_counter() - began
+
+    first = post()
+    latencies = sorted(post() for _ in range(requests))
+    print(json.dumps({
+        'startup': startup,
+        'first': first,
+        'p50': latencies[len(latencies) // 2],
+        'load': app.model_manager.load_seconds,
+    }))
+
+
+def main(requests):
+    if not glob.glob(os.path.join('test_images', '*.png')):
+        raise SystemExit("No PNG files found in 'test_images'. Run get_test_images.py first.")
+    if not os.path.exists('fashion_mnist_model.h5'):
+        raise SystemExit("Model not found. Please train the model first.")
+
+    print(f"{'mode':>6} {'runtime':>10} {'startup s':>10} {'load s':>7} {'first req ms':>13} "
+          f"{'startup+first s':>16} {'p50 ms':>7}")
+    for mode, runtime in CONFIGURATIONS:
+        env = dict(os.environ, MODEL_RUNTIME=runtime, MODEL_PRELOAD=str(mode == 'eager').lower(),
+                   MICROBATCH_ENABLED='false', TF_CPP_MIN_LOG_LEVEL='3')
+        output = subprocess.run([sys.executable, __file__, '--child', '--requests', str(requests)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>6} {runtime:>10} {result['startup']:>10.2f} {result['load']:>7.2f} "
+              f"{1000 * result['first']:>13.1f} {result['startup'] + result['first']:>16.2f} "
+              f"{1000 * result['p50']:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark startup time and first-request latency.')
+    parser.add_argument('--requests', type=int, default=50, help='Steady-state requests to time (default: 50)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measure(args.requests)
+    else:
+        main(args.requests)
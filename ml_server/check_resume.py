@@ -0,0 +1,100 @@
+"""
+This script checks that a training run resumed from an epoch checkpoint ends with the same model as an
+uninterrupted run. It trains twice with 'app.py --train-to', each run in a fresh Python process with its own
+checkpoint directory:
+    uninterrupted: Trains all epochs in one process.
+    resumed: Is killed once its checkpoint records --interrupt-after finished epochs, then run again so it
+             resumes from the checkpoint and finishes.
+Both runs use the same TRAIN_SEED and dataset, so their weights must match. The script prints the largest
+weight difference and both validation accuracies, and exits non-zero if the weights differ.
+Usage:
+    python check_resume.py [--epochs N] [--interrupt-after K] [--tolerance T]
+Arguments:
+    --epochs: Epochs per training run (default: 3).
+    --interrupt-after: Finished epochs after which the second run is killed (default: 1).
+    --tolerance: Largest allowed absolute weight difference (default: 1e-5).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+
+def train(output_dir, checkpoint_dir, epochs, interrupt_after=None):
+    """Train into output_dir; with interrupt_after, kill the process once that many epochs are checkpointed.
+
+    Returns True if the process was killed, False if it ran to the end.
+    """
+    env = dict(os.environ, TRAIN_CHECKPOINT_DIR=checkpoint_dir, TF_CPP_MIN_LOG_LEVEL='3')
+    process = subprocess.Popen([sys.executable, 'app.py', '--train-to', output_dir, '--epochs', str(epochs)],
+                               env=env, stdout=subprocess.DEVNULL)
+    progress_path = os.path.join(checkpoint_dir, 'progress.json')
+    while process.poll() is None:
+        if interrupt_after is not None and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                if json.load(f)['epoch'] >= interrupt_after:
+                    process.kill()
+                    process.wait()
+                    return True
+        time.sleep(0.05)
+    if process.returncode != 0:
+        raise SystemExit(f"Training into {output_dir} failed with exit code {process.returncode}")
+    return False
+
+
+def load_run(output_dir):
+    import keras
+    model = keras.models.load_model(os.path.join(output_dir, 'model.h5'))
+    with open(os.path.join(output_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    return model.get_weights(), metadata
+
+
+def main(epochs, interrupt_after, tolerance):
+    if not 0 < interrupt_after < epochs:
+        raise SystemExit("--interrupt-after must be at least 1 and less than --epochs.")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        uninterrupted_dir = os.path.join(workdir, 'uninterrupted')
+        resumed_dir = os.path.join(workdir, 'resumed')
+
+        print(f"Training {epochs} epochs without interruption...")
+        train(uninterrupted_dir, os.path.join(workdir, 'checkpoints-uninterrupted'), epochs)
+
+        print(f"Training {epochs} epochs, killed after epoch {interrupt_after}...")
+        resumed_checkpoints = os.path.join(workdir, 'checkpoints-resumed')
+        if not train(resumed_dir, resumed_checkpoints, epochs, interrupt_after=interrupt_after):
+            raise SystemExit("The run finished before it could be interrupted; use more epochs.")
+        print("Resuming...")
+        train(resumed_dir, resumed_checkpoints, epochs)
+
+        expected, expected_metadata = load_run(uninterrupted_dir)
+        actual, actual_metadata = load_run(resumed_dir)
+
+    resumed_after = actual_metadata.get('resumed_after_epoch')
+    if resumed_after != interrupt_after:
+        raise SystemExit(f"The second run resumed after epoch {resumed_after}, expected {interrupt_after}.")
+    difference = max(float(np.max(np.abs(a - b))) for a, b in zip(expected, actual))
+    print(f"{'run':>14} {'val_accuracy':>13}")
+    print(f"{'uninterrupted':>14} {expected_metadata['val_accuracy']:>13.4f}")
+    print(f"{'resumed':>14} {actual_metadata['val_accuracy']:>13.4f}")
+    print(f"Largest weight difference: {difference:.3g}")
+    if difference > tolerance:
+        raise SystemExit(f"Resumed weights differ from the uninterrupted run by more than {tolerance:g}.")
+    print("Resumed run matches the uninterrupted run.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check that a resumed training run matches an uninterrupted one.')
+    parser.add_argument('--epochs', type=int, default=3, help='Epochs per training run (default: 3)')
+    parser.add_argument('--interrupt-after', type=int, default=1,
+                        help='Finished epochs after which the second run is killed (default: 1)')
+    parser.add_argument('--tolerance', type=float, default=1e-5,
+                        help='Largest allowed absolute weight difference (default: 1e-5)')
+    args = parser.parse_args()
+    main(args.epochs, args.interrupt_after, args.tolerance)
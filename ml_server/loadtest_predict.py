@@ -0,0 +1,115 @@
+"""
+This script load tests /predict with concurrent clients, with and without server-side micro-batching.
+It serves the Flask app on a local port with a threaded werkzeug server, so concurrent requests are handled
+on separate threads as in production, and has every client thread post single PNGs from 'test_images'.
+Each mode is run once with micro-batching disabled (one model call per request) and once with the
+micro-batcher enabled, and throughput, p50/p95/p99 latency and the batcher statistics are reported.
+Usage:
+    python loadtest_predict.py [--concurrency N [N ...]] [--requests N] [--max-batch-size N] [--max-wait-ms MS]
+Arguments:
+    --concurrency: Numbers of concurrent client threads to test (default: 1 8 32).
+    --requests: Requests sent by each client thread (default: 50).
+    --max-batch-size: Largest batch the micro-batcher sends to the model (default: 32).
+    --max-wait-ms: Longest time the first queued image waits for others to join it (default: 5).
+Example:
+    python loadtest_predict.py --concurrency 16 64 --max-wait-ms 2
+"""
+import os
+import glob
+import time
+import uuid
+import logging
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from tensorflow import keras
+from werkzeug.serving import make_server
+import app
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def multipart(image_bytes):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="image.png"\r\n'
+            f'Content-Type: image/png\r\n\r\n').encode() + image_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def client(port, payloads, count, offset):
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for i in range(count):
+        body, headers = payloads[(offset + i) % len(payloads)]
+        started = time.perf_counter()
+        conn.request('POST', '/predict', body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        errors += response.status != 200
+    conn.close()
+    return latencies, errors
+
+
+def run(mode, batcher, port, payloads, concurrency, requests_per_client):
+    app.batcher = batcher
+    # Warm up the model and the request path before timing anything.
+    client(port, payloads, 3, 0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda i: client(port, payloads, requests_per_client, i * requests_per_client), range(concurrency)
+        ))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latencies, _ in results for latency in latencies)
+    errors = sum(errors for _, errors in results)
+    print(f"{mode:>8} {concurrency:>7} {len(latencies):>9} {errors:>7} {len(latencies) / elapsed:>9,.0f} "
+          f"{1000 * percentile(latencies, 0.50):>8.2f} {1000 * percentile(latencies, 0.95):>8.2f} "
+          f"{1000 * percentile(latencies, 0.99):>8.2f}")
+
+
+def main(concurrency_levels, requests_per_client, max_batch_size, max_wait_ms):
+    keras.utils.disable_interactive_logging()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    image_paths = sorted(glob.glob(os.path.join('test_images', '*.png')))
+    if not image_paths:
+        raise SystemExit("No PNG files found in 'test_images'. Run get_test_images.py first.")
+    if app.get_model() is None:
+        raise SystemExit("Model not found. Please train the model first.")
+    payloads = [multipart(open(path, 'rb').read()) for path in image_paths]
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        print(f"requests/client={requests_per_client} max_batch_size={max_batch_size} max_wait_ms={max_wait_ms}")
+        print(f"{'mode':>8} {'clients':>7} {'requests':>9} {'errors':>7} {'req/sec':>9} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for concurrency in concurrency_levels:
+            run('direct', None, server.port, payloads, concurrency, requests_per_client)
+            batcher = app.MicroBatcher(app.predict_probabilities, max_batch_size=max_batch_size,
+                                       max_wait_ms=max_wait_ms)
+            run('batched', batcher, server.port, payloads, concurrency, requests_per_client)
+            stats = batcher.stats()
+            print(f"{'':>8} mean batch size {stats['mean_batch_size']}, "
+                  f"histogram {stats['batch_size_histogram']}, queue wait avg {stats['queue_wait_ms_avg']} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test /predict with and without server-side micro-batching.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                        help='Numbers of concurrent client threads (default: 1 8 32)')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client thread (default: 50)')
+    parser.add_argument('--max-batch-size', type=int, default=32,
+                        help='Largest batch sent to the model (default: 32)')
+    parser.add_argument('--max-wait-ms', type=float, default=5,
+                        help='Longest wait for a batch to fill, in milliseconds (default: 5)')
+    args = parser.parse_args()
+    main(args.concurrency, args.requests, args.max_batch_size, args.max_wait_ms)
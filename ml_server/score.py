@@ -0,0 +1,379 @@
+"""
+This script scores images offline in large batches, with the same preprocessing and model as the Flask server.
+Inputs are image files, directories searched recursively for images, and .npy/.npz arrays of 28x28 images.
+.npy files and uncompressed .npz members are memory-mapped, so arrays larger than memory are read one
+batch at a time. Images are decoded on a pool of worker threads, and the next batch is read and decoded
+while the model runs the current one. Every model call gets --batch-size images; batches may span inputs.
+Results are streamed to a CSV file, or to a directory of Parquet part files, with one row per image:
+name, class, class_index, confidence and error (set, with the other fields empty, for unreadable images).
+Every --flush-every batches the output is flushed and a checkpoint is written next to it, so an interrupted
+run continues from the last checkpoint with --resume. Progress and images/sec are reported on stderr.
+Usage:
+    python score.py INPUT [INPUT ...] --output PATH [--format F] [--batch-size N] [--workers N]
+                    [--flush-every N] [--version N] [--runtime R] [--resume]
+Arguments:
+    INPUT: Image files, directories of images, or .npy/.npz arrays of (N, 28, 28) or (N, 28, 28, 1) images.
+           uint8 arrays are scaled by 1/255; float arrays are assumed to be scaled to [0, 1] already.
+    --output: CSV file, or directory of Parquet part files.
+    --format: 'csv' or 'parquet' (default: parquet if the output ends in .parquet, else csv).
+    --batch-size: Images per model call (default: 1024).
+    --workers: Threads decoding images (default: the number of CPUs).
+    --flush-every: Batches between checkpoints (default: 10).
+    --version: Registry version to score with (default: the active version).
+    --runtime: Inference runtime: keras, savedmodel or tflite (default: MODEL_RUNTIME, else keras).
+    --resume: Continue from the output's last checkpoint instead of starting over.
+Example:
+    python score.py /data/images /data/nightly.npz --output scores.parquet --batch-size 2048 --resume
+"""
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import struct
+import zipfile
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Scoring loads the model it is asked for; skip the server's preload of the active one
+os.environ.setdefault('MODEL_PRELOAD', 'false')
+from tensorflow import keras  # noqa: E402
+import app  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+COLUMNS = ['name', 'class', 'class_index', 'confidence', 'error']
+FORMATS = ('csv', 'parquet')
+
+
+def decode(path):
+    """Read and preprocess one image file. Returns (image, error); unreadable files give a blank image."""
+    try:
+        with open(path, 'rb') as f:
+            return app.preprocess_image(f.read()), None
+    except Exception as e:
+        return np.zeros((28, 28, 1), dtype=np.float32), str(e)
+
+
+class ImageFiles:
+    """Encoded image files, decoded on the worker threads of executor."""
+
+    def __init__(self, paths, executor):
+        self.paths = paths
+        self.executor = executor
+
+    def __len__(self):
+        return len(self.paths)
+
+    def describe(self):
+        return '\n'.join(self.paths)
+
+    def load(self, start, stop):
+        decoded = list(self.executor.map(decode, self.paths[start:stop]))
+        return self.paths[start:stop], np.stack([image for image, _ in decoded]), [error for _, error in decoded]
+
+
+class ArrayImages:
+    """An array of 28x28 images, usually memory-mapped, scaled one batch at a time."""
+
+    def __init__(self, name, array):
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        # Checks the shape without reading any pixels
+        app.preprocess_array(array[:0])
+        self.name = name
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def describe(self):
+        return f'{self.name} {self.array.shape} {self.array.dtype}'
+
+    def load(self, start, stop):
+        names = [f'{self.name}[{i}]' for i in range(start, stop)]
+        return names, app.preprocess_array(np.asarray(self.array[start:stop])), [None] * (stop - start)
+
+
+def npz_arrays(path):
+    """
+    Yield (member name, array) for every array in an .npz file.
+
+    Members stored without compression, as np.savez writes them, are memory-mapped from the archive.
+    Compressed members cannot be, and are read into memory one member at a time.
+    """
+    with zipfile.ZipFile(path) as archive:
+        members = [info for info in archive.infolist() if info.filename.endswith('.npy')]
+    header_readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    with open(path, 'rb') as f:
+        for info in members:
+            name = info.filename[:-len('.npy')]
+            array = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                # The member's data follows its local file header, whose name and extra fields vary in length
+                f.seek(info.header_offset)
+                local_header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                if version in header_readers:
+                    shape, fortran_order, dtype = header_readers[version](f)
+                    if not dtype.hasobject:
+                        array = np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=f.tell(),
+                                          order='F' if fortran_order else 'C')
+            if array is None:
+                with np.load(path) as npz:
+                    array = npz[name]
+            yield name, array
+
+
+def collect_inputs(paths, executor):
+    """Turn the command line inputs into a list of image sources, in the order given."""
+    sources, loose_images = [], []
+    for path in paths:
+        if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            loose_images.append(path)
+            continue
+        if loose_images:
+            sources.append(ImageFiles(loose_images, executor))
+            loose_images = []
+        if os.path.isdir(path):
+            files = sorted(
+                file for file in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                if file.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(file)
+            )
+            if files:
+                sources.append(ImageFiles(files, executor))
+        elif path.endswith('.npy'):
+            sources.append(ArrayImages(path, np.load(path, mmap_mode='r')))
+        elif path.endswith('.npz'):
+            sources.extend(ArrayImages(f'{path}:{name}', array) for name, array in npz_arrays(path))
+        else:
+            raise SystemExit(f'Not an image, a directory, or a .npy/.npz file: {path}')
+    if loose_images:
+        sources.append(ImageFiles(loose_images, executor))
+    return sources
+
+
+class Inputs:
+    """All image sources as one sequence, read in batches that may span sources."""
+
+    def __init__(self, sources):
+        self.sources = [source for source in sources if len(source)]
+        self.offsets = np.cumsum([0] + [len(source) for source in self.sources])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def fingerprint(self, version, runtime):
+        """Identify the inputs and model, so a checkpoint is only resumed against the run that wrote it."""
+        digest = hashlib.sha256(f'{version} {runtime}\n'.encode())
+        for source in self.sources:
+            digest.update(source.describe().encode() + b'\n')
+        return digest.hexdigest()
+
+    def load(self, start, stop):
+        """Return (names, (N, 28, 28, 1) batch, errors) for images start to stop."""
+        names, arrays, errors = [], [], []
+        first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        for index in range(first, len(self.sources)):
+            offset = self.offsets[index]
+            if offset >= stop:
+                break
+            source_names, array, source_errors = self.sources[index].load(
+                max(start - offset, 0), min(stop - offset, len(self.sources[index]))
+            )
+            names.extend(source_names)
+            arrays.append(array)
+            errors.extend(source_errors)
+        return names, np.concatenate(arrays) if len(arrays) > 1 else arrays[0], errors
+
+
+def result_columns(names, probabilities, errors):
+    indices = np.argmax(probabilities, axis=1)
+    confidences = np.max(probabilities, axis=1)
+    return {
+        'name': names,
+        'class': [app.class_names[index] if error is None else None for index, error in zip(indices, errors)],
+        'class_index': [int(index) if error is None else None for index, error in zip(indices, errors)],
+        'confidence': [float(value) if error is None else None for value, error in zip(confidences, errors)],
+        'error': errors,
+    }
+
+
+class CsvOutput:
+    """Appends results to a CSV file. A resumed run first truncates it to the last checkpoint's size."""
+
+    def __init__(self, path, checkpoint):
+        self.progress_path = f'{path}.progress.json'
+        if checkpoint:
+            with open(path, 'r+b') as f:
+                f.truncate(checkpoint['bytes'])
+            self.file = open(path, 'a', newline='')
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+
+    def commit(self, rows):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'bytes': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    """
+    Writes results as Parquet part files in a directory, one per checkpoint.
+
+    Each part file is named after the first row it holds and renamed into place when complete, so a
+    resumed run deletes the parts written after the last checkpoint and rewrites them.
+    """
+
+    def __init__(self, path, checkpoint):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow: pip install pyarrow')
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.progress_path = os.path.join(path, '_progress.json')
+        self.schema = pa.schema([('name', pa.string()), ('class', pa.string()), ('class_index', pa.int32()),
+                                 ('confidence', pa.float32()), ('error', pa.string())])
+        os.makedirs(path, exist_ok=True)
+        committed = checkpoint['rows'] if checkpoint else 0
+        for part in glob.glob(os.path.join(path, 'part-*.parquet*')):
+            if part.endswith('.tmp') or int(os.path.basename(part)[5:15]) >= committed:
+                os.remove(part)
+        self.start = committed
+        self.tables = []
+
+    def write(self, columns):
+        self.tables.append(self.pa.table(columns, schema=self.schema))
+
+    def commit(self, rows):
+        if self.tables:
+            part = os.path.join(self.path, f'part-{self.start:010d}.parquet')
+            self.pq.write_table(self.pa.concat_tables(self.tables), part + '.tmp')
+            os.replace(part + '.tmp', part)
+            self.tables = []
+        self.start = rows
+        return {}
+
+    def close(self):
+        pass
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def score(inputs, model, output, progress_path, fingerprint, start, batch_size, flush_every):
+    """Score images start to the end of inputs, committing the output every flush_every batches."""
+    total = len(inputs)
+    timings = {'read': 0.0, 'model': 0.0, 'write': 0.0}
+    started = last_report = time.perf_counter()
+    position, batches = start, 0
+    # One thread reads the next batch, using the decode pool, while the model runs the current one
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch') as prefetch:
+        pending = prefetch.submit(inputs.load, start, min(start + batch_size, total)) if start < total else None
+        while pending is not None:
+            step = time.perf_counter()
+            names, batch, errors = pending.result()
+            stop = position + len(names)
+            pending = prefetch.submit(inputs.load, stop, min(stop + batch_size, total)) if stop < total else None
+            timings['read'] += time.perf_counter() - step
+
+            step = time.perf_counter()
+            probabilities = model.predict(batch)
+            timings['model'] += time.perf_counter() - step
+
+            step = time.perf_counter()
+            output.write(result_columns(names, probabilities, errors))
+            position, batches = stop, batches + 1
+            if batches % flush_every == 0 or position == total:
+                checkpoint = {'inputs': fingerprint, 'rows': position, **output.commit(position)}
+                write_checkpoint(progress_path, checkpoint)
+            timings['write'] += time.perf_counter() - step
+
+            now = time.perf_counter()
+            if now - last_report >= 5 or position == total:
+                print(f'{position:,}/{total:,} images, {(position - start) / (now - started):,.0f} img/s',
+                      file=sys.stderr)
+                last_report = now
+    return position - start, time.perf_counter() - started, timings
+
+
+def main(args):
+    keras.utils.disable_interactive_logging()
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    version = args.version or app.model_registry.state()['active']
+    if version is None:
+        raise SystemExit('Model not found. Please train the model first.')
+    model = app.ModelManager(app.model_registry.path(version), runtime=args.runtime, version=version)
+    if not model.load():
+        raise SystemExit(f'Model version {version} not found.')
+
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='decode') as executor:
+        inputs = Inputs(collect_inputs(args.inputs, executor))
+        if len(inputs) == 0:
+            raise SystemExit('No images found in the inputs.')
+        fingerprint = inputs.fingerprint(version, args.runtime)
+
+        progress_path = (os.path.join(args.output, '_progress.json') if output_format == 'parquet'
+                         else f'{args.output}.progress.json')
+        checkpoint = read_checkpoint(progress_path) if args.resume else None
+        if checkpoint is not None and checkpoint['inputs'] != fingerprint:
+            raise SystemExit('The inputs or model differ from those of the checkpointed run; '
+                             'run again without --resume to start over.')
+        if checkpoint is None and os.path.exists(progress_path):
+            os.remove(progress_path)
+        start = checkpoint['rows'] if checkpoint else 0
+        if start:
+            print(f'Resuming after {start:,} of {len(inputs):,} images', file=sys.stderr)
+        output = (ParquetOutput if output_format == 'parquet' else CsvOutput)(args.output, checkpoint)
+        try:
+            images, seconds, timings = score(inputs, model, output, progress_path, fingerprint, start,
+                                             args.batch_size, args.flush_every)
+        finally:
+            output.close()
+
+    print(f'Scored {images:,} images with model version {version} ({args.runtime}) in {seconds:.1f}s: '
+          f'{images / seconds if seconds else 0:,.0f} img/s; waiting on reads {timings["read"]:.1f}s, '
+          f'model {timings["model"]:.1f}s, writing {timings["write"]:.1f}s', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score image directories and NumPy arrays in large batches.')
+    parser.add_argument('inputs', nargs='+', metavar='INPUT',
+                        help='Image files, directories of images, or .npy/.npz arrays of 28x28 images')
+    parser.add_argument('--output', required=True, help='CSV file, or directory of Parquet part files')
+    parser.add_argument('--format', choices=FORMATS, help='Output format (default: from the output name)')
+    parser.add_argument('--batch-size', type=int, default=1024, help='Images per model call (default: 1024)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Threads decoding images (default: the number of CPUs)')
+    parser.add_argument('--flush-every', type=int, default=10, help='Batches between checkpoints (default: 10)')
+    parser.add_argument('--version', type=int, help='Registry version to score with (default: the active one)')
+    parser.add_argument('--runtime', choices=app.ModelManager.RUNTIMES,
+                        default=os.environ.get('MODEL_RUNTIME', 'keras'),
+                        help='Inference runtime (default: MODEL_RUNTIME, else keras)')
+    parser.add_argument('--resume', action='store_true', help="Continue from the output's last checkpoint")
+    main(parser.parse_args())